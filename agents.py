@@ -1,14 +1,48 @@
 import json
+import hashlib
 from abc import ABC, abstractmethod
-from typing import Dict, List, Any
+from typing import Callable, Dict, List, Tuple, Any
 from llm_client import GeminiClient, parse_json_response
+from scheduler import Priority
+from tracing import traced
+from metrics import FALLBACKS, LLM_CALLS_SAVED, HISTORY_TRIMMED
+from tokens import ESTIMATOR, trim_history
+from verdicts import VERDICT_CACHE
+from topics import canonical
 from models import Candidate, SkillRecord, GapRecord, FeedbackReport
 from config import get_multiple_resources
+from claims import ClaimIndex
+from question_bank import QUESTION_BANK
+import prompts
 
 class BaseAgent(ABC):
-    def __init__(self, name: str, llm: GeminiClient):
+    def __init__(self, name: str, llm: GeminiClient, priority: Priority = Priority.ANALYSIS):
         self.name = name
         self.llm = llm
+        self.priority = priority  # класс приоритета в общей очереди LLM
+        self.model = ""  # своя модель агента, пусто - модель сессии
+        self.prompt_variant = "compact"  # full / compact / lean, см. prompts.py
+        self.pinned_facts: Callable[[], str] = lambda: ""  # что сохранить при подрезке истории
+    
+    async def _generate(self, prompt: str, temperature: float, priority: Priority = None) -> str:
+        return await self.llm.generate(prompt, temperature=temperature,
+                                       priority=priority if priority is not None else self.priority,
+                                       agent=self.name, model=self.model,
+                                       max_tokens=self.llm.config.AGENT_MAX_OUTPUT.get(self.name, 0))
+    
+    def _render(self, template: prompts.PromptTemplate, **fields) -> str:
+        prompt = template.render(self.prompt_variant, **fields)
+        budget = self.llm.config.AGENT_INPUT_BUDGETS.get(self.name, 0)
+        if not budget or not template.trim:
+            return prompt
+        over = ESTIMATOR.estimate(prompt) - budget
+        if over <= 0:
+            return prompt
+        # не влезли в бюджет - режем историю со старых реплик
+        history = fields[template.trim]
+        fields[template.trim] = trim_history(history, ESTIMATOR.estimate(history) - over, self.pinned_facts())
+        HISTORY_TRIMMED.inc(agent=self.name)
+        return template.render(self.prompt_variant, **fields)
     
     @abstractmethod
     async def process(self, *args, **kwargs) -> Any:
@@ -19,99 +53,19 @@ class ObserverAgent(BaseAgent):
     def __init__(self, llm: GeminiClient):
         super().__init__("Observer", llm)
     
+    @traced
     async def process(self, candidate: Candidate, history: str, message: str) -> Dict:
-        prompt = f"""Ты - Observer, анализируешь ответы кандидата на техническом интервью.
-
-КАНДИДАТ:
-Имя: {candidate.name}
-Позиция: {candidate.position}
-Уровень: {candidate.grade}
-Опыт: {candidate.experience}
+        prompt = self._render(prompts.OBSERVER, name=candidate.name, position=candidate.position,
+                              grade=candidate.grade, experience=candidate.experience,
+                              history=history if history else "[начало интервью]", message=message)
 
-ИСТОРИЯ ДИАЛОГА:
-{history if history else "[начало интервью]"}
-
-ПОСЛЕДНЕЕ СООБЩЕНИЕ КАНДИДАТА:
-"{message}"
-
-ПЕРВЫМ ДЕЛОМ ПРОВЕРЬ НА AI-КОПИПАСТ:
-Если в сообщении есть ЛЮБАЯ из этих фраз (даже если код правильный!):
-- "как языковая модель"
-- "надеюсь, это поможет" 
-- "I hope this helps"
-- "as an AI"
-- "as a language model"
-- "примечание:" в конце технического ответа
-
-ТВОЯ ЗАДАЧА - проанализировать ответ по критериям:
-
-1. answer_quality - качество ответа:
-   - excellent: отличный ответ с примерами и глубиной
-   - good: хороший правильный ответ
-   - adequate: приемлемый базовый ответ
-   - poor: слабый ответ, мало информации
-   - wrong: неправильный ответ
-   - off_topic: ответ не по теме интервью (погода, личное и т.п.)
-   - hallucination: выдуманные факты (несуществующие технологии, версии)
-   - toxic: грубость, оскорбления, неуважение
-   - refusal: отказ отвечать ("не знаю", "не хочу")
-
-2. confidence_level - уверенность кандидата:
-   - high: чёткий уверенный ответ
-   - medium: есть сомнения, слова "наверное", "кажется"
-   - low: неуверенный, короткий ответ
-
-3. topic_relevance - релевантность:
-   - on_topic: по теме вопроса/интервью
-   - partial: частично по теме
-   - off_topic: совсем не по теме
-
-4. factual_accuracy - точность фактов:
-   - accurate: всё верно
-   - suspicious: сомнительные утверждения
-   - hallucination: явная ложь (Python 4.0, несуществующее)
-   - no_technical: нет технического содержания для проверки
-
-5. flags - флаги (список, может быть пустым):
-   - hallucination_detected: выдуманные факты
-   - off_topic_attempt: попытка сменить тему
-   - toxic_behavior: грубость
-   - refusal_to_answer: отказ отвечать
-   - candidate_question: кандидат задал встречный вопрос
-   - shows_interest: проявляет интерес
-   - admits_ignorance: честно признал что не знает
-   - ai_copypaste_detected: ответ скопирован из ChatGPT/Claude (фразы "как языковая модель", "надеюсь, это поможет", "as an AI")
-
-6. detected_skills - выявленные навыки (список тем)
-7. detected_gaps - выявленные пробелы (список тем)
-8. instruction - инструкция интервьюеру что делать дальше
-
-ПРИМЕРЫ АНАЛИЗА:
-
-Сообщение: "ORM это Object-Relational Mapping, позволяет работать с БД через объекты"
-Анализ: answer_quality=good, confidence_level=high, factual_accuracy=accurate, flags=[], detected_skills=["ORM", "базы данных"]
-
-Сообщение: "В Python 4.0 циклы заменят на нейросети"  
-Анализ: answer_quality=hallucination, factual_accuracy=hallucination, flags=["hallucination_detected"], instruction="исправить ложную информацию"
-
-Сообщение: "Вот код: def foo(): pass. Примечание: Как языковая модель AI, я рекомендую проверить этот код."
-Анализ: answer_quality=poor, factual_accuracy=suspicious, flags=["ai_copypaste_detected"], instruction="уточнить откуда кандидат взял ответ, возможно использует AI"
-
-Сообщение: "какая погода сегодня?"
-Анализ: answer_quality=off_topic, topic_relevance=off_topic, flags=["off_topic_attempt"], instruction="вернуть к теме интервью"
-
-Сообщение: "а какие задачи будут на испытательном сроке?"
-Анализ: answer_quality=adequate, flags=["candidate_question", "shows_interest"], instruction="ответить на вопрос как тренажёр, потом продолжить"
-
-Ответь ТОЛЬКО валидным JSON без markdown:
-{{"answer_quality": "...", "confidence_level": "...", "topic_relevance": "...", "factual_accuracy": "...", "detected_skills": [], "detected_gaps": [], "flags": [], "instruction": "..."}}"""
-
-        response = await self.llm.generate(prompt, temperature=0.2)
+        response = await self._generate(prompt, 0.2)
         parsed = parse_json_response(response)
         
         if parsed and "answer_quality" in parsed:
             return parsed
         
+        FALLBACKS.inc(agent=self.name, kind="default_analysis")
         return {
             "answer_quality": "adequate",
             "confidence_level": "medium",
@@ -128,161 +82,70 @@ class FactCheckerAgent(BaseAgent):
     def __init__(self, llm: GeminiClient):
         super().__init__("FactChecker", llm)
     
-    async def process(self, claim: str, context: str = "") -> Dict:
-        prompt = f"""Ты - FactChecker, проверяешь технические утверждения на точность.
-
-УТВЕРЖДЕНИЕ ДЛЯ ПРОВЕРКИ:
-"{claim}"
-
-КОНТЕКСТ:
-{context if context else "[нет контекста]"}
-
-ИЗВЕСТНЫЕ ФАКТЫ:
-- Python: актуальные версии 3.9, 3.10, 3.11, 3.12, 3.13. Python 4.0 НЕ существует и не планируется.
-- Django: версии 4.x, 5.x
-- JavaScript: стандарты ES2020, ES2021, ES2022, ES2023
-- Базовые конструкции (циклы for/while, функции, классы) - фундаментальны, никуда не денутся
-- GIL в Python - реальная концепция
-- ООП, REST, SQL - реальные и актуальные технологии
-
-РАСПРОСТРАНЁННЫЕ МИФЫ:
-- "Python 4.0 выйдет скоро" - ЛОЖЬ
-- "Циклы заменят на нейросети" - БРЕД
-- "SQL устарел" - ЛОЖЬ
-- "ООП больше не нужно" - ЛОЖЬ
-
-Проверь утверждение и ответь JSON:
-{{"is_accurate": true/false, "issues": [{{"claim": "что не так", "problem": "почему", "severity": "critical/major/minor"}}], "corrections": [{{"wrong": "неправильно", "correct": "правильно"}}]}}"""
-
-        response = await self.llm.generate(prompt, temperature=0.1)
+    @traced
+    async def process(self, claim: str, context: str = "", question: str = "") -> Dict:
+        # в промпте вся история, а ключ кэша - утверждение и вопрос, на который оно отвечает
+        use_cache = self.llm.config.FACT_CACHE
+        if use_cache:
+            cached = VERDICT_CACHE.get(claim, question)
+            if cached is not None:
+                LLM_CALLS_SAVED.inc(agent=self.name, reason="verdict_cache")
+                return cached
+
+        prompt = self._render(prompts.FACT_CHECKER, claim=claim,
+                              context=context if context else "[нет контекста]")
+
+        response = await self._generate(prompt, 0.1)
         parsed = parse_json_response(response)
+        if parsed and use_cache:
+            VERDICT_CACHE.put(claim, parsed, question)
         return parsed or {"is_accurate": True, "issues": [], "corrections": []}
 
 
 class InterviewerAgent(BaseAgent):
     def __init__(self, llm: GeminiClient):
-        super().__init__("Interviewer", llm)
+        super().__init__("Interviewer", llm, Priority.INTERACTIVE)
     
+    @traced
     async def process(self, candidate: Candidate, history: str, analysis: Dict,
                     difficulty: int, topics_done: List[str], fact_info: str = "",
-                    contradiction_info: str = "") -> str:
+                    contradiction_info: str = "", seed: str = "") -> str:
 
         
         flags = analysis.get("flags", [])
         quality = analysis.get("answer_quality", "adequate")
         instruction = analysis.get("instruction", "продолжай")
         
-        mode_text = ""
+        mode = ""
         if "toxic_behavior" in flags:
-            mode_text = """РЕЖИМ - ТОКСИЧНОСТЬ:
-Кандидат проявил грубость. Сохраняй профессионализм.
-Мягко укажи что такое поведение неуместно на интервью.
-Предложи продолжить в конструктивном ключе."""
-
+            mode = "toxic"
         elif "off_topic_attempt" in flags:
-            mode_text = """РЕЖИМ - ВОЗВРАТ К ТЕМЕ:
-Кандидат пытается уйти от темы (погода, личное и т.п.)
-НЕ поддерживай разговоры не по теме!
-Вежливо но твёрдо верни к техническим вопросам.
-Скажи что-то вроде "Это интересно, но давай вернёмся к интервью" и сразу задай технический вопрос."""
-
+            mode = "off_topic"
         elif "hallucination_detected" in flags:
-            mode_text = f"""РЕЖИМ - КОРРЕКЦИЯ ОШИБКИ:
-Кандидат сказал НЕВЕРНУЮ информацию.
-ОБЯЗАТЕЛЬНО исправь! Скажи чётко что это не соответствует действительности.
-НЕ говори "интересная информация" - это ЛОЖЬ, её надо исправить.
-{f"Правильная информация: {fact_info}" if fact_info else ""}
-Будь вежлив, но ПРЯМО укажи на ошибку и дай верные факты.
-После исправления продолжи интервью."""
-
+            mode = "hallucination"
         elif "candidate_question" in flags:
-            mode_text = """РЕЖИМ - ОТВЕТ НА ВОПРОС:
-Кандидат задал встречный вопрос - это хороший знак!
-Ты АГЕНТ-ТРЕНАЖЁР, не представляешь конкретную компанию.
-Признай это честно, но дай ПОЛЕЗНЫЙ общий ответ!
-Пример: "Так как я агент-тренажёр, я не нанимаю в конкретную компанию. Но обычно на таких позициях используют Docker, микросервисы, CI/CD. Давай проверим твои знания в этой области?"
-После ответа - продолжи интервью."""
-
+            mode = "question"
         elif "refusal_to_answer" in flags or quality in ["poor", "wrong", "refusal"]:
-            mode_text = """РЕЖИМ - УПРОЩЕНИЕ И ПОМОЩЬ:
-Кандидат испытывает трудности или отказался отвечать.
-
-Если кандидат ПРОСИТ ОБЪЯСНИТЬ (говорит "расскажи", "объясни", "не понимаю"):
-- Дай КРАТКОЕ объяснение (1-2 предложения максимум)
-- Сразу после объяснения задай ПРОСТОЙ проверочный вопрос по этой же теме
-- Пример: "Переменная — это имя, которое ссылается на значение в памяти. Например, x = 5 создаёт переменную x. А если написать y = x + 2, чему будет равен y?"
-
-Если кандидат просто говорит "не знаю" без просьбы объяснить:
-- Упрости вопрос или смени тему на более простую
-- Зафиксируй пробел и двигайся дальше
-
-НЕ превращайся в учителя! Это интервью, а не урок. Объяснение — максимум 2 предложения."""
-
-
-
+            mode = "struggle"
         elif contradiction_info:
-            mode_text = f"""РЕЖИМ - ПРОТИВОРЕЧИЕ:
-Кандидат сказал что-то противоречащее его предыдущим словам.
-Мягко и вежливо уточни это противоречие.
-Не обвиняй, просто попроси пояснить.
-Вопрос для уточнения: {contradiction_info}"""
-
+            mode = "contradiction"
+        mode_text = prompts.INTERVIEWER_MODES[mode].format(
+            fact_info=f"Правильная информация: {fact_info}" if fact_info else "",
+            contradiction_info=contradiction_info) if mode else ""
+        if mode_text and self.prompt_variant != "full":
+            mode_text = prompts.minimize(mode_text)
 
         topics_str = ", ".join(topics_done[-7:]) if topics_done else "пока нет"
         
-        prompt = f"""Ты - технический интервьюер-тренажёр. Твоя задача - провести качественное собеседование.
-
-ИНФОРМАЦИЯ О КАНДИДАТЕ:
-Имя: {candidate.name}
-Позиция: {candidate.position}
-Целевой уровень: {candidate.grade}
-Опыт: {candidate.experience}
-
-ТЕКУЩЕЕ СОСТОЯНИЕ:
-Уровень сложности вопросов: {difficulty}/5
-Темы которые уже обсудили: {topics_str}
-Качество последнего ответа: {quality}
-
-ИСТОРИЯ ДИАЛОГА:
-{history if history else "[начало интервью]"}
-
-АНАЛИЗ ПОСЛЕДНЕГО ОТВЕТА:
-Качество: {quality}
-Уверенность: {analysis.get("confidence_level", "medium")}
-Релевантность: {analysis.get("topic_relevance", "on_topic")}
-Инструкция: {instruction}
-
-{mode_text if mode_text else ""}
-
-ПРАВИЛА ВЕДЕНИЯ ИНТЕРВЬЮ:
-
-1. АДАПТАЦИЯ СЛОЖНОСТИ:
-   - Уровень 1: "Что такое переменная?", "Зачем нужны функции?"
-   - Уровень 2: "Как работает цикл for?", "Что такое список в Python?"
-   - Уровень 3: "Объясни разницу между list и tuple", "Что такое ORM?"
-   - Уровень 4: "Как работает GIL?", "Что такое N+1 проблема?"
-   - Уровень 5: "Как бы ты спроектировал...", "Расскажи про оптимизацию..."
-
-2. НЕ ПОВТОРЯЙ темы из списка уже обсуждённых
-
-3. БУДЬ ЧЕЛОВЕЧНЫМ:
-   - Используй имя кандидата
-   - Хвали за хорошие ответы
-   - Подбадривай при трудностях
-   - Не будь роботом
-
-4. ЕСЛИ КАНДИДАТ ЗАДАЛ ВОПРОС - сначала ответь на него!
-
-5. ТЕМЫ ДЛЯ {candidate.position} ({candidate.grade}):
-   - Python: типы данных, функции, ООП, исключения, декораторы, генераторы
-   - SQL: SELECT, JOIN, GROUP BY, индексы, транзакции
-   - Django/Flask/FastAPI: модели, views, роутинг, ORM
-   - Git: commit, branch, merge, rebase
-   - Общее: алгоритмы, структуры данных, паттерны, REST API
-
-Напиши ТОЛЬКО свою реплику как интервьюер (без пояснений, без JSON):"""
-
-        response = await self.llm.generate(prompt, temperature=0.7)
+        prompt = self._render(
+            prompts.INTERVIEWER, name=candidate.name, position=candidate.position, grade=candidate.grade,
+            experience=candidate.experience, difficulty=difficulty, topics=topics_str,
+            history=history if history else "[начало интервью]", quality=quality,
+            confidence=analysis.get("confidence_level", "medium"),
+            relevance=analysis.get("topic_relevance", "on_topic"), instruction=instruction, mode=mode_text,
+            seed=f"ЗАГОТОВКА ВОПРОСА (можно задать как есть, переформулировать или выбрать другой): {seed}" if seed else "")
+
+        response = await self._generate(prompt, 0.7)
         
         if response:
             response = response.strip()
@@ -290,13 +153,29 @@ class InterviewerAgent(BaseAgent):
                 response = response[1:-1]
             return response
         
+        FALLBACKS.inc(agent=self.name, kind="canned_question")
+        return self.bank_question(candidate, difficulty, topics_done)
+    
+    @staticmethod
+    def bank_question(candidate: Candidate, difficulty: int, topics_done: List[str]) -> str:
+        """Вопрос из банка под позицию и уровень, когда генерировать некогда или не вышло"""
+        entry = QUESTION_BANK.pick(candidate.position, candidate.grade, difficulty, topics_done)
+        if entry:
+            return f"Хорошо, {candidate.name}. Давай продолжим. {entry[1]}"
         return f"Хорошо, {candidate.name}. Давай продолжим. Расскажи подробнее о своём опыте работы с Python."
 
 
 class EvaluatorAgent(BaseAgent):
     def __init__(self, llm: GeminiClient):
-        super().__init__("Evaluator", llm)
+        super().__init__("Evaluator", llm, Priority.INTERACTIVE)
+        self.draft: Dict = {}  # черновик отчёта, обновляется после каждого хода
+        self.draft_turns = 0
+    
+    def reset(self):
+        self.draft = {}
+        self.draft_turns = 0
     
+    @traced
     async def process(self, candidate: Candidate, history: str,
                       skills: List[SkillRecord], gaps: List[GapRecord],
                       flags: List[str], turns_count: int) -> FeedbackReport:
@@ -400,48 +279,162 @@ class EvaluatorAgent(BaseAgent):
     "summary": "итоговое резюме 2-3 предложения"
 }}"""
 
-        response = await self.llm.generate(prompt, temperature=0.3)
+        response = await self._generate(prompt, 0.3)
         parsed = parse_json_response(response)
         
         if parsed and "decision" in parsed:
-            tech = parsed.get("technical_review", {})
-            if "confirmed_skills" in tech:
-                seen = set()
-                unique = []
-                for s in tech["confirmed_skills"]:
-                    key = s.get("topic", "").lower().strip()
-                    if key and key not in seen:
-                        seen.add(key)
-                        unique.append(s)
-                tech["confirmed_skills"] = unique
-            
-            if "knowledge_gaps" in tech:
-                seen = set()
-                unique = []
-                for g in tech["knowledge_gaps"]:
-                    key = g.get("topic", "").lower().strip()
-                    if key and key not in seen:
-                        seen.add(key)
-                        unique.append(g)
-                tech["knowledge_gaps"] = unique
-            
-            roadmap = parsed.get("roadmap", {})
-            for topic_item in roadmap.get("priority_topics", []):
-                topic_name = topic_item.get("topic", "")
-                topic_item["resources"] = get_multiple_resources(topic_name)
-            
-            return FeedbackReport(
-                decision=parsed.get("decision", {}),
-                technical=parsed.get("technical_review", {}),
-                soft_skills=parsed.get("soft_skills_review", {}),
-                roadmap=roadmap,
-                red_flags=parsed.get("red_flags", []),
-                green_flags=parsed.get("green_flags", []),
-                summary=parsed.get("summary", "")
-            )
+            return self._report_from_parsed(parsed)
         
+        FALLBACKS.inc(agent=self.name, kind="fallback_report")
         return self._build_fallback_report(candidate, skills, gaps, flags, turns_count)
     
+    @traced
+    async def update_draft(self, candidate: Candidate, question: str, answer: str,
+                           analysis: Dict, turn_id: int) -> Dict:
+        """Обновляет черновик отчёта по одному ходу (маленький промпт вместо всей истории)"""
+        draft_json = json.dumps(self.draft, ensure_ascii=False) if self.draft else "{}"
+        
+        prompt = self._render(prompts.EVALUATOR_DRAFT, name=candidate.name, position=candidate.position,
+                              grade=candidate.grade, draft=draft_json, turn_id=turn_id, question=question[:300],
+                              message=answer[:500], quality=analysis.get("answer_quality"),
+                              confidence=analysis.get("confidence_level"), flags=analysis.get("flags", []))
+
+        response = await self._generate(prompt, 0.2, Priority.BACKGROUND)
+        parsed = parse_json_response(response)
+        
+        if parsed and "skills" in parsed:
+            self.draft = parsed
+            self.draft_turns = turn_id
+        return self.draft
+    
+    @traced
+    async def finalize(self, candidate: Candidate, skills: List[SkillRecord],
+                       gaps: List[GapRecord], flags: List[str], turns_count: int,
+                       use_llm: bool = True) -> FeedbackReport:
+        """Финальный отчёт из черновика: один короткий вызов или вообще без LLM"""
+        if not self.draft:
+            FALLBACKS.inc(agent=self.name, kind="fallback_report")
+            return self._build_fallback_report(candidate, skills, gaps, flags, turns_count)
+        
+        if use_llm:
+            flags_unique = list(set(flags))
+            depth_info = ""
+            if hasattr(self, '_depth_scores') and self._depth_scores:
+                depth_info = f"\nГЛУБИНА ЗНАНИЙ ПО ТЕМАМ: {json.dumps(self._depth_scores, ensure_ascii=False)}"
+            prompt = f"""Ты - Evaluator, составляешь финальный отчёт по итогам технического интервью.
+
+КАНДИДАТ: {candidate.name}, {candidate.position}, заявленный уровень {candidate.grade}, опыт: {candidate.experience}
+Ходов: {turns_count} (черновик учитывает {self.draft_turns})
+Флаги: {", ".join(flags_unique) if flags_unique else "нет"}
+Случаев токсичности: {flags.count("toxic_behavior")}, галлюцинаций: {flags.count("hallucination_detected")}, отказов: {flags.count("refusal_to_answer")}
+
+ЧЕРНОВИК ОТЧЁТА:
+{json.dumps(self.draft, ensure_ascii=False)}{depth_info}
+
+ВАЖНО:
+- Токсичность = автоматически No Hire или Strong No Hire
+- Много галлюцинаций = снижение оценки честности
+
+Ответь JSON:
+{{"decision": {{"evaluated_grade": "Junior/Middle/Senior/Below Junior", "hiring_recommendation": "Strong Hire/Hire/Maybe/No Hire/Strong No Hire", "confidence_score": 0-100, "explanation": "..."}}, "technical_review": {{"overall_score": 1-10, "confirmed_skills": [{{"topic": "...", "evidence": "...", "score": 1-10}}], "knowledge_gaps": [{{"topic": "...", "severity": "high/medium/low"}}]}}, "soft_skills_review": {{"clarity": {{"score": 1-10, "comment": ""}}, "honesty": {{"score": 1-10, "comment": ""}}, "engagement": {{"score": 1-10, "comment": ""}}, "professionalism": {{"score": 1-10, "comment": ""}}}}, "roadmap": {{"priority_topics": [{{"topic": "...", "why": "...", "priority": "high/medium/low"}}], "recommended_actions": ["..."], "estimated_time": "X месяцев"}}, "red_flags": [], "green_flags": [], "summary": "2-3 предложения"}}"""
+
+            response = await self._generate(prompt, 0.3)
+            parsed = parse_json_response(response)
+            if parsed and "decision" in parsed:
+                report = self._report_from_parsed(parsed)
+                report.technical["knowledge_gaps"] = self._with_gap_details(
+                    report.technical.get("knowledge_gaps", []), gaps)
+                return report
+        
+        FALLBACKS.inc(agent=self.name, kind="draft_only")
+        return self._report_from_draft(candidate, skills, gaps, flags, turns_count)
+    
+    def _report_from_parsed(self, parsed: Dict) -> FeedbackReport:
+        tech = parsed.get("technical_review", {})
+        if "confirmed_skills" in tech:
+            seen = set()
+            unique = []
+            for s in tech["confirmed_skills"]:
+                key = s.get("topic", "").lower().strip()
+                if key and key not in seen:
+                    seen.add(key)
+                    unique.append(s)
+            tech["confirmed_skills"] = unique
+        
+        if "knowledge_gaps" in tech:
+            seen = set()
+            unique = []
+            for g in tech["knowledge_gaps"]:
+                key = g.get("topic", "").lower().strip()
+                if key and key not in seen:
+                    seen.add(key)
+                    unique.append(g)
+            tech["knowledge_gaps"] = unique
+        
+        roadmap = parsed.get("roadmap", {})
+        for topic_item in roadmap.get("priority_topics", []):
+            topic_name = topic_item.get("topic", "")
+            topic_item["resources"] = get_multiple_resources(topic_name)
+        
+        return FeedbackReport(
+            decision=parsed.get("decision", {}),
+            technical=parsed.get("technical_review", {}),
+            soft_skills=parsed.get("soft_skills_review", {}),
+            roadmap=roadmap,
+            red_flags=parsed.get("red_flags", []),
+            green_flags=parsed.get("green_flags", []),
+            summary=parsed.get("summary", "")
+        )
+    
+    def _report_from_draft(self, candidate: Candidate, skills: List[SkillRecord],
+                           gaps: List[GapRecord], flags: List[str], turns_count: int) -> FeedbackReport:
+        # вердикт считаем эвристикой, а оценки и флаги берём из черновика
+        report = self._build_fallback_report(candidate, skills, gaps, flags, turns_count)
+        draft = self.draft
+        
+        draft_skills = [s for s in draft.get("skills", []) if isinstance(s, dict) and s.get("topic")]
+        if draft_skills:
+            report.technical["confirmed_skills"] = draft_skills
+            scores = [s.get("score", 5) for s in draft_skills if isinstance(s.get("score"), (int, float))]
+            if scores:
+                report.technical["overall_score"] = round(sum(scores) / len(scores))
+        draft_gaps = [g for g in draft.get("gaps", []) if isinstance(g, dict) and g.get("topic")]
+        if draft_gaps:
+            # пробелы, которые черновик потерял, оставляем из записей сессии
+            covered = {canonical(g["topic"]) for g in draft_gaps}
+            missed = [g.to_dict() for g in gaps if canonical(g.topic) not in covered]
+            report.technical["knowledge_gaps"] = self._with_gap_details(draft_gaps, gaps) + missed
+        
+        for name, score in draft.get("soft_skills", {}).items():
+            if isinstance(score, (int, float)):
+                report.soft_skills[name] = {"score": score, "comment": ""}
+        
+        topics = [t for t in draft.get("roadmap", []) if isinstance(t, str) and t]
+        if topics:
+            report.roadmap["priority_topics"] = [
+                {"topic": t, "why": "Выявлен пробел", "priority": "high", "resources": get_multiple_resources(t)}
+                for t in topics[:5]
+            ]
+        
+        report.red_flags = list(dict.fromkeys(report.red_flags + draft.get("red_flags", [])))
+        report.green_flags = list(dict.fromkeys(report.green_flags + draft.get("green_flags", [])))
+        if draft.get("notes"):
+            report.summary = f"{report.summary} {draft['notes']}"
+        return report
+    
+    @staticmethod
+    def _with_gap_details(report_gaps: List[Dict], gaps: List[GapRecord]) -> List[Dict]:
+        """Черновик и короткий финальный промпт знают только тему и серьёзность пробела -
+        вопрос, ответ кандидата и правильный ответ берём из записей сессии по теме"""
+        details = {canonical(g.topic): g.to_dict() for g in gaps}
+        merged = []
+        for item in report_gaps:
+            if not isinstance(item, dict):
+                continue
+            record = details.get(canonical(item.get("topic", "")), {})
+            merged.append({**record, **{k: v for k, v in item.items() if v}})
+        return merged
+    
     def _build_fallback_report(self, candidate: Candidate, skills: List[SkillRecord],
                                gaps: List[GapRecord], flags: List[str], turns_count: int) -> FeedbackReport:
         toxic = "toxic_behavior" in flags
@@ -538,30 +531,16 @@ class MetaReviewerAgent(BaseAgent):
     def __init__(self, llm: GeminiClient):
         super().__init__("MetaReviewer", llm)
     
+    @traced
     async def process(self, interviewer_response: str, analysis: Dict, 
                       last_question: str, topics_done: List[str]) -> Dict:
         flags = analysis.get("flags", [])
         
-        prompt = f"""Проверь ответ интервьюера перед отправкой кандидату.
-
-ОТВЕТ ИНТЕРВЬЮЕРА:
-"{interviewer_response}"
-
-КОНТЕКСТ:
-- Флаги последнего ответа кандидата: {flags}
-- Предыдущий вопрос: "{last_question[:100]}"
-- Уже обсуждённые темы: {', '.join(topics_done[-5:]) if topics_done else 'нет'}
+        prompt = self._render(prompts.META_REVIEWER, response=interviewer_response, flags=flags,
+                              last_question=last_question[:100],
+                              topics=', '.join(topics_done[-5:]) if topics_done else 'нет')
 
-ПРОВЕРЬ:
-1. Если был флаг "hallucination_detected" — интервьюер ДОЛЖЕН исправить ложь
-2. Если был флаг "candidate_question" — интервьюер ДОЛЖЕН ответить на вопрос
-3. Если был флаг "off_topic_attempt" — интервьюер ДОЛЖЕН вернуть к теме
-4. Новый вопрос НЕ должен повторять уже обсуждённые темы
-
-Ответь JSON:
-{{"is_ok": true/false, "issues": ["проблема1"], "fix_instruction": "как исправить"}}"""
-
-        response = await self.llm.generate(prompt, temperature=0.1)
+        response = await self._generate(prompt, 0.1)
         parsed = parse_json_response(response)
         return parsed or {"is_ok": True, "issues": [], "fix_instruction": ""}
 
@@ -572,46 +551,37 @@ class ContradictionDetector(BaseAgent):
     def __init__(self, llm: GeminiClient):
         super().__init__("ContradictionDetector", llm)
         self.claims = []  # запоминаем что говорил кандидат
+        self.index = ClaimIndex()  # по нему выбираем, с чем сравнивать
     
     def remember(self, turn_id: int, text: str):
         # не запоминаем слишком короткие или стоп-слова
         if len(text) > 20:
             self.claims.append({"turn": turn_id, "text": text[:300]})
+            self.index.add(turn_id, text[:300])
     
     def reset(self):
         self.claims = []
+        self.index.clear()
     
+    @traced
     async def process(self, message: str, turn_id: int) -> Dict:
         if len(self.claims) < 2:
             return {"found": False}
         
-        # берём последние 5 утверждений
+        # сравниваем только с утверждениями про то же самое, со всего интервью
+        cfg = self.llm.config
+        related = self.index.search(message, k=cfg.CLAIM_INDEX_TOP_K, min_score=cfg.CLAIM_INDEX_MIN_SCORE)
+        if not related:
+            LLM_CALLS_SAVED.inc(agent=self.name, reason="no_related_claims")
+            return {"found": False}
+        
         history_claims = "\n".join([
-            f"[Ход {c['turn']}]: {c['text']}" for c in self.claims[-5:]
+            f"[Ход {c.turn}]: {c.text}" for c in sorted((c for _, c in related), key=lambda c: c.turn)
         ])
         
-        prompt = f"""Проверь, противоречит ли новое сообщение предыдущим словам кандидата.
+        prompt = self._render(prompts.CONTRADICTION, claims=history_claims, turn_id=turn_id, message=message)
 
-ЧТО КАНДИДАТ ГОВОРИЛ РАНЬШЕ:
-{history_claims}
-
-НОВОЕ СООБЩЕНИЕ (ход {turn_id}):
-"{message}"
-
-Противоречие это когда:
-- Раньше сказал "знаю X", теперь "не знаю X"
-- Раньше "работал с Y 3 года", теперь "только начал изучать Y"
-- Взаимоисключающие факты
-
-НЕ противоречие:
-- Уточнение деталей
-- "Я ошибся, на самом деле..."
-- Разные аспекты темы
-
-Ответь JSON:
-{{"found": true/false, "old_text": "что говорил", "old_turn": N, "conflict": "в чём противоречие", "question": "как мягко уточнить"}}"""
-
-        resp = await self.llm.generate(prompt, temperature=0.15)
+        resp = await self._generate(prompt, 0.15)
         result = parse_json_response(resp)
         
         if result and result.get("found"):
@@ -622,44 +592,48 @@ class ContradictionDetector(BaseAgent):
 class DepthProber(BaseAgent):
     """Оценивает насколько глубоко кандидат знает тему"""
     
+    MAX_LEVEL = 5
+    
     def __init__(self, llm: GeminiClient):
         super().__init__("DepthProber", llm)
-        self.scores = {}  # topic -> {"level": 1-5, "evidence": "..."}
+        self.scores = {}  # канонический ключ темы -> {"level": 1-5, "evidence": "..."}
+        self._memo: Dict[Tuple[str, str], Dict] = {}  # (тема, хэш ответа) -> результат
     
     def reset(self):
         self.scores = {}
+        self._memo = {}
     
     def get_summary(self) -> Dict:
         return dict(self.scores)
     
+    @traced
     async def process(self, topic: str, answer: str) -> Dict:
         if not topic or len(answer) < 10:
             return {"level": 0}
         
-        prompt = f"""Оцени глубину понимания темы "{topic}" по ответу кандидата.
-
-ОТВЕТ:
-"{answer[:500]}"
-
-УРОВНИ:
-1 = слышал название, не понимает суть
-2 = понимает базовую концепцию
-3 = может использовать на практике
-4 = понимает нюансы, trade-offs, когда НЕ использовать
-5 = эксперт, может обучать других, знает edge cases
-
-JSON:
-{{"level": 1-5, "reason": "коротко почему"}}"""
+        key = canonical(topic)
+        answer = answer[:500]
+        # выше 5/5 не поднять - незачем спрашивать
+        if self.scores.get(key, {}).get("level", 0) >= self.MAX_LEVEL:
+            LLM_CALLS_SAVED.inc(agent=self.name, reason="topic_saturated")
+            return {"level": self.MAX_LEVEL, "reason": self.scores[key]["evidence"]}
+        memo_key = (key, hashlib.sha1(answer.encode("utf-8")).hexdigest())
+        if memo_key in self._memo:
+            LLM_CALLS_SAVED.inc(agent=self.name, reason="memoized")
+            return self._memo[memo_key]
+        
+        prompt = self._render(prompts.DEPTH_PROBER, topic=topic, answer=answer)
 
-        resp = await self.llm.generate(prompt, temperature=0.1)
+        resp = await self._generate(prompt, 0.1)
         result = parse_json_response(resp)
         
         if result and "level" in result:
+            self._memo[memo_key] = result
             lvl = result["level"]
             # обновляем только если выше предыдущего
-            prev = self.scores.get(topic, {}).get("level", 0)
+            prev = self.scores.get(key, {}).get("level", 0)
             if lvl > prev:
-                self.scores[topic] = {"level": lvl, "evidence": result.get("reason", "")}
+                self.scores[key] = {"level": lvl, "evidence": result.get("reason", "")}
             return result
         
         return {"level": 0}
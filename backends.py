@@ -0,0 +1,302 @@
+"""Подмена живого API: запись ответов в кассету и воспроизведение с записанными задержками,
+заглушки с заданным распределением задержек, сбои по заказу перед HTTP-клиентом"""
+import json
+import math
+import random
+import asyncio
+import hashlib
+import itertools
+from collections import defaultdict, deque
+from pathlib import Path
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+import httpx
+
+from tokens import ESTIMATOR
+from metrics import CHAOS_FAULTS
+
+Usage = Dict[str, int]
+
+
+def prompt_hash(prompt: str) -> str:
+    return hashlib.sha1(prompt.encode("utf-8")).hexdigest()[:16]
+
+
+class Recorder:
+    """Дописывает каждый живой ответ в JSONL-кассету: агент, хэш промпта, ответ, задержка, usage"""
+
+    def __init__(self, path: str):
+        self.path = path
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+
+    def record(self, agent: str, model: str, prompt: str, text: str, latency: float, usage: Usage):
+        entry = {"agent": agent, "model": model, "hash": prompt_hash(prompt), "prompt_chars": len(prompt),
+                 "response": text, "latency": round(latency, 3),
+                 "prompt_tokens": usage.get("promptTokenCount", 0),
+                 "output_tokens": usage.get("candidatesTokenCount", 0)}
+        # одна строка за раз в режиме append - параллельные процессы не перемешают записи
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+class ReplayBackend:
+    """Ответы из кассеты вместо API.
+
+    Сначала ищем запись с тем же промптом - если код и ответы кандидата не менялись, диалог
+    повторяется один в один. Если промпт изменился, берём следующую запись того же агента по кругу.
+    Задержка - записанная, умноженная на speed (0 - без задержки).
+    """
+
+    name = "replay"
+
+    def __init__(self, path: str, speed: float = 1.0):
+        self.path = path
+        self.speed = speed
+        self.by_hash: Dict[str, Deque[Dict]] = defaultdict(deque)
+        self.by_agent: Dict[str, List[Dict]] = defaultdict(list)
+        self._next: Dict[str, int] = defaultdict(int)
+        self.hits = self.misses = 0
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self.by_hash[entry["hash"]].append(entry)
+                    self.by_agent[entry["agent"]].append(entry)
+        if not self.by_agent:
+            raise ValueError(f"Кассета {path} пустая")
+
+    def _lookup(self, prompt: str, agent: str) -> Dict:
+        same = self.by_hash.get(prompt_hash(prompt))
+        if same:
+            self.hits += 1
+            entry = same.popleft()
+            same.append(entry)  # повторный прогон той же кассеты тоже найдёт
+            return entry
+        self.misses += 1
+        entries = self.by_agent.get(agent) or self.by_agent.get("other") or next(iter(self.by_agent.values()))
+        entry = entries[self._next[agent] % len(entries)]
+        self._next[agent] += 1
+        return entry
+
+    async def generate(self, prompt: str, agent: str, model: str) -> Tuple[str, Usage]:
+        entry = self._lookup(prompt, agent)
+        if self.speed:
+            await asyncio.sleep(entry["latency"] * self.speed)
+        return entry["response"], {"promptTokenCount": entry["prompt_tokens"],
+                                   "candidatesTokenCount": entry["output_tokens"]}
+
+
+def parse_distribution(spec: str, rng: random.Random = None) -> Callable[[], float]:
+    """Задержка в секундах по описанию:
+      const:1.5 или 1.5   - всегда 1.5
+      uniform:0.5,2       - равномерно от 0.5 до 2
+      exp:1.0             - экспоненциально со средним 1.0
+      lognormal:1.2,0.5   - логнормально с медианой 1.2 и sigma 0.5 (похоже на задержки API)
+    """
+    rng = rng or random.Random()
+    kind, _, args = spec.partition(":")
+    if not args:  # "fake:0.01" - постоянная задержка
+        kind, args = "const", spec
+    try:
+        params = [float(x) for x in args.split(",") if x]
+        if len(params) != {"uniform": 2, "lognormal": 2}.get(kind, 1):
+            raise ValueError(spec)  # иначе ошибка всплывёт только при первой задержке
+        if kind == "const":
+            return lambda: params[0]
+        if kind == "uniform":
+            return lambda: rng.uniform(params[0], params[1])
+        if kind == "exp":
+            return lambda: rng.expovariate(1 / params[0]) if params[0] else 0.0
+        if kind == "lognormal":
+            return lambda: rng.lognormvariate(math.log(params[0]), params[1])
+    except (ValueError, IndexError, ZeroDivisionError):
+        pass
+    raise ValueError(f"Непонятное распределение '{spec}': x, const:x, uniform:a,b, exp:mean, lognormal:median,sigma")
+
+
+# правдоподобные ответы агентов: форма та же, что у настоящих, содержание - заглушка
+_OBSERVER = [
+    {"answer_quality": "good", "confidence_level": "high", "topic_relevance": "on_topic",
+     "factual_accuracy": "accurate", "detected_skills": ["Python", "SQL"], "detected_gaps": [],
+     "flags": ["shows_interest"], "instruction": "усложнить вопрос"},
+    {"answer_quality": "adequate", "confidence_level": "medium", "topic_relevance": "on_topic",
+     "factual_accuracy": "suspicious", "detected_skills": ["Django"], "detected_gaps": ["asyncio"],
+     "flags": [], "instruction": "уточнить детали"},
+    {"answer_quality": "poor", "confidence_level": "low", "topic_relevance": "partial",
+     "factual_accuracy": "no_technical", "detected_skills": [], "detected_gaps": ["индексы"],
+     "flags": ["admits_ignorance"], "instruction": "упростить вопрос"},
+]
+_QUESTIONS = [
+    "Хорошо. Чем список отличается от кортежа в Python?",
+    "Понятно. Зачем нужны индексы в базе данных и когда они мешают?",
+    "Отлично. Как работает GIL и как он влияет на многопоточный код?",
+    "Интересно. Что такое N+1 проблема в ORM и как её избежать?",
+]
+_RESPONSES = {
+    "FactChecker": {"is_accurate": True, "issues": [], "corrections": []},
+    "DepthProber": {"level": 3, "reason": "базовое понимание"},
+    "ContradictionDetector": {"found": False},
+    "MetaReviewer": {"is_ok": True, "issues": [], "fix_instruction": ""},
+    "StopIntent": "NO",
+    "Greeting": "Привет! Я интервьюер-тренажёр. Расскажи коротко о своём опыте.",
+    # один ответ подходит и черновику, и финальному отчёту
+    "Evaluator": {
+        "decision": {"evaluated_grade": "Junior", "hiring_recommendation": "Hire", "confidence_score": 60,
+                     "explanation": "нагрузочный прогон"},
+        "technical_review": {"overall_score": 6, "confirmed_skills": [{"topic": "Python", "score": 6}],
+                             "knowledge_gaps": []},
+        "soft_skills_review": {"honesty": {"score": 7, "comment": ""}},
+        "roadmap": {"priority_topics": [{"topic": "asyncio"}]},
+        "skills": [{"topic": "Python", "score": 6}], "gaps": [],
+        "soft_skills": {"clarity": 6, "honesty": 7, "engagement": 6, "professionalism": 7},
+        "red_flags": [], "green_flags": [], "notes": "", "summary": "нагрузочный прогон",
+    },
+}
+
+
+class FakeBackend:
+    """Заглушки вместо API с задержкой из заданного распределения - для нагрузочных прогонов"""
+
+    name = "fake"
+
+    def __init__(self, latency: str = "lognormal:1.0,0.5", seed: int = 0):
+        self.rng = random.Random(seed)
+        self.latency = parse_distribution(latency, self.rng)
+        self._turn: Dict[str, int] = defaultdict(int)
+
+    def _response(self, agent: str) -> str:
+        if agent == "Observer":
+            return json.dumps(self.rng.choice(_OBSERVER), ensure_ascii=False)
+        if agent == "Interviewer":
+            self._turn[agent] += 1
+            return _QUESTIONS[self._turn[agent] % len(_QUESTIONS)]
+        response = _RESPONSES.get(agent, "Ок, понял.")
+        return response if isinstance(response, str) else json.dumps(response, ensure_ascii=False)
+
+    async def generate(self, prompt: str, agent: str, model: str) -> Tuple[str, Usage]:
+        await asyncio.sleep(max(0.0, self.latency()))
+        text = self._response(agent)
+        return text, {"promptTokenCount": ESTIMATOR.estimate(prompt), "candidatesTokenCount": ESTIMATOR.estimate(text)}
+
+
+class BackendTransport(httpx.AsyncBaseTransport):
+    """Ответ replay/fake бэкенда в формате generateContent - чтобы через него шёл живой путь клиента"""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        prompt = json.loads(request.content)["contents"][0]["parts"][0]["text"]
+        model = request.url.path.rsplit("/", 1)[-1].split(":")[0]
+        text, usage = await self.backend.generate(prompt, request.extensions.get("agent", "other"), model)
+        return httpx.Response(200, json={"candidates": [{"content": {"parts": [{"text": text}]}}],
+                                         "usageMetadata": usage}, request=request)
+
+
+# сбой -> доля запросов; проверяются по порядку, срабатывает первый выпавший
+CHAOS_KINDS = ("timeout", "429", "5xx", "slow", "empty", "malformed", "fenced")
+
+
+def parse_chaos(spec: str) -> Dict:
+    """Сбои по описанию "429=0.1,5xx=0.05,timeout=0.02,slow=0.2,delay=exp:3,malformed=0.05,fenced=0.1,empty=0.05,seed=1":
+      timeout   - httpx.ReadTimeout после задержки delay
+      429, 5xx  - ответ с этим статусом (5xx - 503)
+      slow      - обычный ответ, но на delay секунд позже
+      empty     - пустой candidates, как при срабатывании фильтров
+      malformed - текст ответа обрезан посередине, JSON не закрыт
+      fenced    - текст ответа завёрнут в ```json ... ```
+    """
+    chaos = {"delay": "exp:3", "seed": None}
+    for item in filter(None, (x.strip() for x in spec.split(","))):
+        key, _, value = item.partition("=")
+        if key in CHAOS_KINDS:
+            chaos[key] = float(value)
+        elif key == "delay":
+            parse_distribution(value)  # ошибку в описании покажем сразу
+            chaos[key] = value
+        elif key == "seed":
+            chaos[key] = int(value)
+        else:
+            raise ValueError(f"Неизвестный сбой '{key}': {', '.join(CHAOS_KINDS)}, delay, seed")
+    return chaos
+
+
+_CHAOS_CLIENTS = itertools.count()
+
+
+class ChaosTransport(httpx.AsyncBaseTransport):
+    """Обёртка над транспортом httpx: с заданной вероятностью портит запрос или ответ.
+
+    Стоит перед HTTP, поэтому сбои проходят через те же ретраи, разбор JSON и запасные
+    пути агентов, что и настоящие.
+    """
+
+    def __init__(self, inner: httpx.AsyncBaseTransport, spec: str):
+        self.inner = inner
+        self.chaos = parse_chaos(spec)
+        # с seed прогон воспроизводим, но у каждого клиента своя последовательность сбоев
+        seed = self.chaos["seed"]
+        self.rng = random.Random(f"{seed}:{next(_CHAOS_CLIENTS)}" if seed is not None else None)
+        self.delay = parse_distribution(self.chaos["delay"], self.rng)
+
+    def _roll(self) -> str:
+        for kind in CHAOS_KINDS:
+            if self.rng.random() < self.chaos.get(kind, 0.0):
+                return kind
+        return ""
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        kind = self._roll()
+        if not kind:
+            return await self.inner.handle_async_request(request)
+        CHAOS_FAULTS.inc(kind=kind)
+        if kind == "timeout":
+            await asyncio.sleep(self.delay())
+            raise httpx.ReadTimeout("chaos: таймаут", request=request)
+        if kind in ("429", "5xx"):
+            status = 429 if kind == "429" else 503
+            return httpx.Response(status, json={"error": {"code": status, "message": f"chaos: {kind}"}},
+                                  request=request)
+        if kind == "slow":
+            await asyncio.sleep(self.delay())
+            return await self.inner.handle_async_request(request)
+
+        response = await self.inner.handle_async_request(request)
+        await response.aread()
+        if response.status_code != 200:
+            return response
+        data = response.json()
+        if kind == "empty":
+            data["candidates"] = []
+        elif data.get("candidates"):
+            part = data["candidates"][0]["content"]["parts"][0]
+            text = part["text"]
+            part["text"] = text[:len(text) // 2] if kind == "malformed" else f"```json\n{text}\n```"
+        return httpx.Response(200, json=data, request=request)
+
+    async def aclose(self):
+        await self.inner.aclose()
+
+
+_BACKENDS: Dict[str, object] = {}
+
+
+def get_backend(spec: str):
+    """"live" -> None (живой API), "replay:путь[@скорость]" -> ReplayBackend,
+    "fake[:распределение]" -> FakeBackend; один экземпляр на процесс"""
+    if not spec or spec == "live":
+        return None
+    if spec not in _BACKENDS:
+        kind, _, arg = spec.partition(":")
+        if kind == "replay":
+            path, _, speed = arg.partition("@")
+            _BACKENDS[spec] = ReplayBackend(path, float(speed) if speed else 1.0)
+        elif kind == "fake":
+            _BACKENDS[spec] = FakeBackend(arg) if arg else FakeBackend()
+        else:
+            raise ValueError(f"Неизвестный бэкенд LLM '{spec}': live, replay:путь[@скорость], fake[:распределение]")
+    return _BACKENDS[spec]
+
+
+def get_recorder(path: str) -> Optional[Recorder]:
+    return Recorder(path) if path else None
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""Бенчмарк задержки интервью по SCENARIOS и проверка на регрессию относительно базовой линии"""
+import sys
+import json
+import asyncio
+import argparse
+import subprocess
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List
+
+from config import CFG
+
+BASELINE_VERSION = 1
+
+# метрика -> допуск по умолчанию; задержки шумят сильнее, чем число вызовов
+LATENCY_METRICS = ("turn_p50", "turn_p95", "turn_p99", "first_message_p50")
+CALL_METRICS = ("calls_per_turn",)
+INFO_METRICS = ("tokens_per_turn",)  # в таблице, но не валят проверку
+MIN_DELTA_SEC = 0.05  # быстрее этого разница - шум таймера и event loop
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * q
+    lo, hi = int(k), min(int(k) + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def stats(reports) -> Dict:
+    turn_sec = [t for r in reports for t in r.turn_sec]
+    turns = len(turn_sec) or 1
+    return {
+        "scenarios": len(reports),
+        "turns": len(turn_sec),
+        "turn_p50": round(percentile(turn_sec, 0.5), 3),
+        "turn_p95": round(percentile(turn_sec, 0.95), 3),
+        "turn_p99": round(percentile(turn_sec, 0.99), 3),
+        "first_message_p50": round(percentile([r.first_message_sec for r in reports], 0.5), 3),
+        "calls_per_turn": round(sum(c for r in reports for c in r.turn_calls) / turns, 2),
+        "tokens_per_turn": round(sum(t for r in reports for t in r.turn_tokens) / turns),
+    }
+
+
+def _commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=Path(__file__).parent, timeout=5).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+
+async def run(args) -> Dict:
+    CFG.LLM_BACKEND, CFG.LLM_CHAOS = args.backend, args.chaos  # до создания клиентов
+    if CFG.LLM_BACKEND != "live":
+        CFG.FACT_CACHE_FILE = ""  # вердикты с кассеты или заглушки не должны попасть в общий кэш
+    if args.record:
+        CFG.LLM_RECORD_FILE = args.record
+    import test_runner  # после настройки бэкенда
+
+    scenarios = test_runner.SCENARIOS
+    if args.scenarios:
+        scenarios = [s for s in scenarios if s.name in args.scenarios]
+    runner = test_runner.TestRunner(pipelines=args.pipeline.split(","), prompt_variants=args.prompts.split(","),
+                                    jobs=args.jobs)
+    await runner.run_all(scenarios)
+
+    by_name: Dict[str, list] = {}
+    multi = len(runner.pipelines) * len(runner.prompt_variants) > 1
+    for r in runner.reports:
+        by_name.setdefault(f"{r.scenario_name} [{r.pipeline}/{r.prompts}]" if multi else r.scenario_name, []).append(r)
+    result = {
+        "version": BASELINE_VERSION,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "commit": _commit(),
+        "backend": args.backend,
+        "chaos": args.chaos,
+        "model": test_runner.TEST_MODEL,
+        "pipeline": args.pipeline,
+        "prompts": args.prompts,
+        "overall": stats(runner.reports),
+        "scenarios": {name: stats(reps) for name, reps in by_name.items()},
+    }
+    out = args.out or f"benchmarks/bench_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    Path(out).parent.mkdir(parents=True, exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"\n📏 Бенчмарк: {out}")
+    _print_stats("итого", result["overall"])
+    return result
+
+
+def _print_stats(name: str, st: Dict):
+    print(f"   {name:<28} ход p50/p95/p99 {st['turn_p50']:.2f}/{st['turn_p95']:.2f}/{st['turn_p99']:.2f}с | "
+          f"первое сообщение {st['first_message_p50']:.2f}с | {st['calls_per_turn']} вызовов, "
+          f"{st['tokens_per_turn']} токенов на ход")
+
+
+def compare(baseline: Dict, current: Dict, latency_threshold: float, calls_threshold: float) -> List[str]:
+    """Список регрессий; пустой - проверка пройдена"""
+    if baseline.get("version") != current.get("version"):
+        return [f"версии формата не совпадают: {baseline.get('version')} и {current.get('version')}"]
+    if baseline.get("backend") != current.get("backend"):
+        print(f"⚠️ Разные бэкенды: {baseline.get('backend')} и {current.get('backend')} - сравнение условное")
+    if baseline.get("chaos", "") != current.get("chaos", ""):
+        print(f"⚠️ Разные сбои: '{baseline.get('chaos', '')}' и '{current.get('chaos', '')}' - сравнение условное")
+    regressions = []
+    rows = [("итого", baseline["overall"], current["overall"])]
+    rows += [(name, st, current["scenarios"][name]) for name, st in baseline["scenarios"].items()
+             if name in current["scenarios"]]
+    print(f"\n{'':<28} {'метрика':<18} {'база':>9} {'сейчас':>9} {'изменение':>10}")
+    for name, base, cur in rows:
+        for metric in LATENCY_METRICS + CALL_METRICS + INFO_METRICS:
+            b, c = base.get(metric, 0), cur.get(metric, 0)
+            change = (c - b) / b if b else 0.0
+            bad = False
+            if metric in LATENCY_METRICS:
+                bad = change > latency_threshold and c - b > MIN_DELTA_SEC
+            elif metric in CALL_METRICS:
+                bad = change > calls_threshold
+            print(f"{name:<28} {metric:<18} {b:>9} {c:>9} {change:>+9.0%}{' ❌' if bad else ''}")
+            if bad:
+                regressions.append(f"{name}: {metric} {b} -> {c} ({change:+.0%})")
+    return regressions
+
+
+def _load(path: str) -> Dict:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Бенчмарк задержки интервью")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_run = sub.add_parser("run", help="прогнать сценарии и записать результат")
+    p_run.add_argument("scenarios", nargs="*", help="имена сценариев (по умолчанию все)")
+    p_run.add_argument("--backend", default=CFG.LLM_BACKEND, help="live или replay:кассета.jsonl[@скорость]")
+    p_run.add_argument("--record", default="", help="записать живые ответы в кассету для replay")
+    p_run.add_argument("--chaos", default=CFG.LLM_CHAOS, help="подмешивать сбои LLM (см. backends.parse_chaos)")
+    p_run.add_argument("--out", default="", help="куда сохранить результат (JSON)")
+    p_run.add_argument("--pipeline", default=CFG.PIPELINE_PROFILE)
+    p_run.add_argument("--prompts", default=CFG.PROMPT_VARIANT)
+    p_run.add_argument("--jobs", type=int, default=1)
+    p_run.add_argument("--gate", metavar="BASELINE", help="сразу сравнить с базовой линией")
+
+    p_cmp = sub.add_parser("compare", help="сравнить результат с базовой линией")
+    p_cmp.add_argument("baseline")
+    p_cmp.add_argument("current")
+
+    for p in (p_run, p_cmp):
+        p.add_argument("--latency-threshold", type=float, default=0.15, help="допустимый рост задержек, доля")
+        p.add_argument("--calls-threshold", type=float, default=0.05, help="допустимый рост вызовов LLM на ход")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        current = asyncio.run(run(args))
+        if not args.gate:
+            return 0
+        baseline = _load(args.gate)
+    else:
+        baseline, current = _load(args.baseline), _load(args.current)
+
+    regressions = compare(baseline, current, args.latency_threshold, args.calls_threshold)
+    if regressions:
+        print(f"\n❌ Регрессии ({len(regressions)}):")
+        for r in regressions:
+            print(f"   {r}")
+        return 1
+    print("\n✅ Регрессий нет")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
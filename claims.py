@@ -0,0 +1,120 @@
+import re
+import math
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Set, Tuple
+
+from config import DOCS_BY_TOPIC
+
+_WORD = re.compile(r"[a-zа-яё0-9][a-zа-яё0-9+#.]*", re.IGNORECASE)
+_LATIN = re.compile(r"^[a-z][a-z0-9+#.]*$")
+_DURATION = re.compile(r"(\d+|пол|один|два|две|три|четыре|пять|несколько)\s*(год|лет|месяц|мес\b)")
+_NEGATION = re.compile(r"не (знаю|работал|использовал|пробовал|сталкивался|писал|трогал)|никогда|только начал|впервые")
+
+_STOP = set("""
+и в во на с со по за к ко от до из у о об а но да же ли бы то это этот эта эти так как что чтобы
+я мы ты вы он она они мне меня мой моя мои нас вас их его ее её там тут где когда если или уже ещё еще
+очень просто было был была были есть быть всё все весь для при про без над под между тоже только
+the a an and or of to in on for with is are was were be it this that i we you my our
+""".split())
+
+# технологии из справочника ссылок + латинские слова считаем упоминаниями технологий.
+# Справа запрещена только латиница: "reactive" - не react, а русские ключи - основы
+# ("архитектур", "очеред"), после них идёт окончание ("архитектуру", "очередями")
+_TECH = re.compile(r"(?<![a-zа-яё])(" + "|".join(re.escape(k) for k in sorted(DOCS_BY_TOPIC, key=len, reverse=True)) + ")(?![a-z])")
+
+
+def _check_tech():
+    """Основы из справочника должны находиться в словоформах, латинские имена - только целиком"""
+    for key in DOCS_BY_TOPIC:
+        if not _LATIN.match(key) and key not in _TECH.findall(f"{key}ами"):
+            raise ValueError(f"_TECH не находит основу '{key}' с окончанием")
+    if _TECH.findall("reactive restore gitlab"):
+        raise ValueError("_TECH находит латинские имена внутри других слов")
+
+
+_check_tech()
+
+
+def _stem(word: str) -> str:
+    # грубая основа для кириллицы: окончания отличаются, начало слова - нет
+    if len(word) > 5 and not _LATIN.match(word):
+        return word[:5]
+    return word.rstrip(".")
+
+
+def features(text: str) -> Tuple[Counter, Set[str]]:
+    """Токены для TF-IDF и метки: технологии, стаж, отрицание"""
+    lower = text.lower()
+    tokens = Counter(_stem(w) for w in _WORD.findall(lower) if w not in _STOP and len(w) > 1)
+    tags = {f"tech:{m}" for m in _TECH.findall(lower)}
+    tags |= {f"tech:{w}" for w in tokens if _LATIN.match(w) and len(w) > 1}
+    if _DURATION.search(lower):
+        tags.add("exp:duration")
+    if _NEGATION.search(lower):
+        tags.add("exp:negation")
+    return tokens, tags
+
+
+@dataclass
+class Claim:
+    turn: int
+    text: str
+    tokens: Counter = field(default_factory=Counter)
+    tags: Set[str] = field(default_factory=set)
+
+
+class ClaimIndex:
+    """Локальный индекс утверждений кандидата: TF-IDF по нормализованным словам
+    плюс пересечение по упомянутым технологиям"""
+
+    TAG_WEIGHT = 2.0  # общая технология весит как пара общих редких слов
+
+    def __init__(self):
+        self.claims: List[Claim] = []
+        self._df: Counter = Counter()  # в скольких утверждениях встречается токен
+
+    def add(self, turn: int, text: str):
+        tokens, tags = features(text)
+        self.claims.append(Claim(turn, text, tokens, tags))
+        self._df.update(set(tokens) | tags)
+
+    def clear(self):
+        self.claims = []
+        self._df = Counter()
+
+    def __len__(self) -> int:
+        return len(self.claims)
+
+    def _idf(self, term: str) -> float:
+        return math.log((1 + len(self.claims)) / (1 + self._df.get(term, 0))) + 1.0
+
+    def _vector(self, tokens: Counter, tags: Set[str]) -> Dict[str, float]:
+        vec = {t: (1 + math.log(n)) * self._idf(t) for t, n in tokens.items()}
+        for tag in tags:
+            vec[tag] = vec.get(tag, 0.0) + self.TAG_WEIGHT * self._idf(tag)
+        return vec
+
+    @staticmethod
+    def _cosine(a: Dict[str, float], b: Dict[str, float]) -> float:
+        if len(a) > len(b):
+            a, b = b, a
+        dot = sum(w * b.get(t, 0.0) for t, w in a.items())
+        if not dot:
+            return 0.0
+        norm = math.sqrt(sum(w * w for w in a.values())) * math.sqrt(sum(w * w for w in b.values()))
+        return dot / norm
+
+    def search(self, text: str, k: int = 5, min_score: float = 0.1) -> List[Tuple[float, Claim]]:
+        """Утверждения, пересекающиеся с текстом по технологиям или словам, лучшие первыми"""
+        tokens, tags = features(text)
+        query = self._vector(tokens, tags)
+        techs = {t for t in tags if t.startswith("tech:")}
+        found = []
+        for claim in self.claims:
+            score = self._cosine(query, self._vector(claim.tokens, claim.tags))
+            # общая технология - всегда кандидат на противоречие
+            if score >= min_score or techs & claim.tags:
+                found.append((score, claim))
+        found.sort(key=lambda x: x[0], reverse=True)
+        return found[:k]
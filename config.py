@@ -1,5 +1,5 @@
-from dataclasses import dataclass
-from typing import Optional, List, Dict
+from dataclasses import dataclass, field
+from typing import Optional, List, Dict, Tuple
 import json
 from pathlib import Path
 
@@ -21,6 +21,59 @@ class Config:
     GEMINI_URL: str = "https://generativelanguage.googleapis.com/v1beta" 
     TEMPERATURE: float = 1.0 #советуют для 3.0 флеш
     MAX_TOKENS: int = 4096 #хватает
+    # свой лимит ответа агента; у gemini-3 сюда же идут токены размышлений, поэтому по умолчанию пусто
+    AGENT_MAX_OUTPUT: Dict[str, int] = field(default_factory=dict)
+    # бюджет промпта агента в токенах: сверх него история режется со старых реплик, 0 - без лимита
+    AGENT_INPUT_BUDGETS: Dict[str, int] = field(default_factory=lambda: {
+        "Observer": 4000, "Interviewer": 4000, "FactChecker": 2500,
+    })
+    TOKEN_CALIBRATION_FILE: str = "test_logs/token_calibration.json"  # веса оценщика токенов, см. tokens.py
+
+    INCREMENTAL_EVAL: bool = True  # черновик отчёта обновляется в фоне после каждого хода
+    FINISH_BUDGET_SEC: float = 20.0  # сколько готовы ждать отчёт после "стоп"
+    STOP_SPECULATION_THRESHOLD: float = 0.6  # с какой вероятности стопа заранее запускаем Evaluator
+    # агенты, которые можно вынести с критического пути: "DepthProber", "ContradictionDetector"
+    BACKGROUND_AGENTS: Tuple[str, ...] = ()
+    PROMPT_VARIANT: str = "compact"  # full / compact / lean - см. prompts.py
+    QUESTION_SEED: bool = False  # подсказывать Interviewer заготовку из банка вопросов на каждом ходу
+    INTERVIEWER_DEADLINE_SEC: float = 0.0  # дольше - задаём вопрос из банка, 0 - ждём сколько нужно
+    # конвейер хода: "default", "lean", "rich" или путь к JSON с шагами (см. pipeline.py)
+    PIPELINE_PROFILE: str = "default"
+
+    # ContradictionDetector сравнивает с top-k похожими утверждениями, без похожих - не зовёт LLM
+    CLAIM_INDEX_TOP_K: int = 5
+    CLAIM_INDEX_MIN_SCORE: float = 0.15
+
+    # вердикты FactChecker переиспользуются между сессиями, "" в FACT_CACHE_FILE - только в памяти
+    FACT_CACHE: bool = True
+    FACT_CACHE_FILE: str = "fact_cache.json"
+    FACT_CACHE_TTL_DAYS: float = 30.0
+    FACT_CACHE_MAX_ENTRIES: int = 2000
+    FACT_CACHE_FUZZY_THRESHOLD: float = 0.85  # похожесть по 4-граммам; ниже - лучше спросить LLM
+
+    # откуда берутся ответы: "live" - API, "replay:путь.jsonl[@скорость]" - кассета,
+    # "fake[:распределение]" - заглушки с задержкой (см. backends.py)
+    LLM_BACKEND: str = "live"
+    LLM_RECORD_FILE: str = ""  # дописывать живые ответы в кассету для replay
+    # сбои перед HTTP-клиентом для проверки устойчивости, например "429=0.1,slow=0.2,delay=exp:3,fenced=0.1"
+    # (см. backends.parse_chaos); с replay/fake ответы тоже идут через HTTP-путь клиента
+    LLM_CHAOS: str = ""
+    LLM_MAX_CONCURRENCY: int = 4  # одновременных запросов к API на процесс
+    LLM_RPM_QUOTA: int = 0  # квота API, запросов в минуту - для прогноза dryrun.py, 0 - не учитывать
+    LLM_STARVATION_SEC: float = 10.0  # после стольких секунд ожидания запрос идёт вне очереди
+
+    # SLO хода: при нарушении отключаем необязательных агентов, при запасе возвращаем.
+    # Выключено по умолчанию: на медленном API меняет, какие проверки вообще могут пройти
+    SLO_ENABLED: bool = False
+    SLO_TURN_P95_SEC: float = 20.0
+    SLO_MAX_ERROR_RATE: float = 0.2
+    SLO_WINDOW: int = 10  # сколько последних ходов учитываем
+
+    TRACING_ENABLED: bool = False  # спаны по каждому ходу, выгрузка в chrome trace / OTLP
+
+    METRICS_PORT: int = 0  # 0 - без HTTP эндпоинта /metrics
+    METRICS_FILE: str = ""  # куда периодически писать метрики в формате Prometheus
+    METRICS_DUMP_SEC: float = 15.0
 
 CFG = Config()
 
@@ -36,6 +89,12 @@ STOP_WORDS = [
     "стоп игра", "стоп интервью", "заверши интервью"
 ]
 
+# слова, которые намекают на завершение, но сами по себе не стоп; одно попадание уже запускает
+# Evaluator заранее, поэтому без слов из обычных ответов ("пока не сталкивался", "все, что помню")
+STOP_HINTS = [
+    "устал", "заканч", "заверш", "закругл", "фидбек", "отчёт", "отчет"
+]
+
 DOCS_BY_TOPIC = {
     "python": "https://docs.python.org/3/tutorial/",
     "django": "https://docs.djangoproject.com/en/stable/",
@@ -0,0 +1,272 @@
+"""Прогноз прогона сценариев до запуска: вызовы LLM, токены и время, последовательно и с --jobs.
+
+Считается по условиям шагов конвейера, max_turns сценариев и статистике агентов из прошлых
+прогонов. После каждого прогона статистика уточняется по факту (observe_run).
+"""
+import json
+import math
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import prompts
+from config import CFG, Config
+from metrics import LLM_SECONDS, LLM_TOKENS
+from pipeline import CORE_AGENTS, PipelineProfile, StepSpec, load_profile
+from tokens import ESTIMATOR
+
+DEFAULT_STATS = "test_logs/estimate_stats.json"
+SIMULATOR = "other"  # симулятор кандидата зовёт LLM без имени агента
+PAUSE_SEC = 4.0  # пауза после каждого сценария в последовательном режиме test_runner, и после последнего тоже
+DECAY = 0.7  # вес прошлой статистики при добавлении нового прогона
+PREFIX_KEY = "prefix:"  # общее начало сценариев: ходов ровно столько, сколько задано, без финального отчёта
+
+# пока статистики нет: доля ходов, где шаг срабатывает при допущенном условии (умножается на cost)
+PRIOR_FIRE = {"FactChecker": 0.3, "DepthProber": 0.6, "ContradictionDetector": 0.5, "StopIntent": 0.1}
+PRIOR_LATENCY = 3.0
+PRIOR_TURN_RATIO = 0.85  # сценарии часто заканчиваются "стопом" раньше max_turns
+PRIOR_OUTPUT_TOKENS = 250
+PRIOR_PROMPT_TOKENS = 1500  # агенты без PromptTemplate: Evaluator, приветствие, симулятор
+_TEMPLATES = {t.agent: t for t in prompts.TEMPLATES}
+
+
+def stats_path(backend: str) -> str:
+    """Статистика живого API и заглушек не смешивается: у fake/replay свои задержки"""
+    kind = backend.split(":", 1)[0]
+    return DEFAULT_STATS if kind == "live" else DEFAULT_STATS.replace(".json", f"_{kind}.json")
+
+
+def _deterministic(step: StepSpec, turn: int, smart: bool, config: Config) -> bool:
+    """Условия шага, известные заранее; условия по анализу Observer - в частоте вызовов"""
+    when = step.when
+    if turn < when.get("min_turn", 1):
+        return False
+    if "smart_mode" in when and when["smart_mode"] != smart:
+        return False
+    return not ("config" in when and not getattr(config, when["config"], False))
+
+
+def exposure(agent: str, profile: PipelineProfile, turns: float, start: int = 1, smart: bool = True,
+             config: Config = CFG) -> float:
+    """Сколько раз у агента была возможность вызова: ходов, где шаг допускается, или сценариев"""
+    if agent == "Greeting":
+        return 0.0 if start > 1 else 1.0
+    step = profile.step(agent)
+    if step is None:
+        if agent in (SIMULATOR, "StopIntent"):
+            return max(turns - start + 1, 0.0)
+        # Evaluator без черновика - один финальный отчёт
+        return 1.0 if agent == "Evaluator" else 0.0
+    full, frac = int(turns), turns - int(turns)
+    count = sum(1 for t in range(start, full + 1) if _deterministic(step, t, smart, config))
+    if frac and _deterministic(step, full + 1, smart, config):
+        count += frac
+    return float(count)
+
+
+def agent_totals() -> Dict[str, Dict[str, float]]:
+    """Вызовы, секунды и токены по агентам из метрик процесса - для разницы до и после прогона"""
+    out: Dict[str, Dict[str, float]] = {}
+    for (agent, _model), row in LLM_SECONDS.series.items():
+        a = out.setdefault(agent, {"calls": 0.0, "seconds": 0.0, "tokens": 0.0})
+        a["calls"] += row[-1]
+        a["seconds"] += row[-2]
+    for (agent, _kind), value in LLM_TOKENS.values.items():
+        out.setdefault(agent, {"calls": 0.0, "seconds": 0.0, "tokens": 0.0})["tokens"] += value
+    return out
+
+
+@dataclass
+class ScenarioEstimate:
+    name: str
+    turns: float
+    calls: float
+    tokens: float
+    seconds: float
+    by_agent: Dict[str, float] = field(default_factory=dict)
+
+
+@dataclass
+class SuiteEstimate:
+    scenarios: List[ScenarioEstimate]
+    calls: float
+    tokens: float
+    serial_sec: float
+    parallel_sec: float
+    jobs: int
+    bound: str  # что ограничивает параллельный прогон
+
+
+class SuiteEstimator:
+    """Статистика по агентам с затуханием: вызовы на одну возможность, задержка, токены на вызов"""
+
+    def __init__(self, path: str = DEFAULT_STATS, config: Config = CFG):
+        self.path = path
+        self.config = config
+        self.agents: Dict[str, Dict[str, float]] = {}  # агент -> calls, seconds, tokens, exposure
+        self.turn_ratio: Dict[str, float] = {}  # сценарий -> фактических ходов / max_turns
+        self.correction: Dict[str, float] = {}  # serial / parallel -> факт / прогноз по времени
+        self.runs = 0
+        self.load()
+
+    # --- статистика ---
+
+    def rate(self, agent: str, profile: PipelineProfile) -> float:
+        a = self.agents.get(agent)
+        if a and a["exposure"]:
+            return a["calls"] / a["exposure"]
+        step = profile.step(agent)
+        fire = 1.0 if agent in CORE_AGENTS else PRIOR_FIRE.get(agent, 1.0)
+        return fire * (step.cost if step else 1)
+
+    def latency(self, agent: str) -> float:
+        a = self.agents.get(agent)
+        if a and a["calls"]:
+            return a["seconds"] / a["calls"]
+        known = [v["seconds"] / v["calls"] for v in self.agents.values() if v["calls"]]
+        return sum(known) / len(known) if known else PRIOR_LATENCY
+
+    def tokens_per_call(self, agent: str, variant: str) -> float:
+        a = self.agents.get(agent)
+        if a and a["calls"] and a["tokens"]:
+            return a["tokens"] / a["calls"]
+        template = _TEMPLATES.get(agent)
+        prompt = ESTIMATOR.estimate(template.render(variant, **prompts.SAMPLE_FIELDS)) if template else PRIOR_PROMPT_TOKENS
+        return prompt + PRIOR_OUTPUT_TOKENS
+
+    # --- прогноз ---
+
+    def _agents(self, profile: PipelineProfile) -> List[str]:
+        names = [s.agent for s in profile.steps] + [SIMULATOR, "StopIntent", "Greeting"]
+        return names + ([] if profile.step("Evaluator") else ["Evaluator"])
+
+    def _turn_sec(self, profile: PipelineProfile, turns: float, start: int, smart: bool) -> float:
+        """Критический путь хода: шаги не в фоне, ожидаемое время с учётом частоты вызова"""
+        span = max(turns - start + 1, 1.0)
+        finish: Dict[str, float] = {}
+
+        def done(agent: str) -> float:
+            if agent not in finish:
+                step = profile.step(agent)
+                ready = max((done(d) for d in step.after), default=0.0)
+                share = exposure(agent, profile, turns, start, smart, self.config) / span
+                own = 0.0 if step.background else share * self.rate(agent, profile) * self.latency(agent)
+                finish[agent] = ready + own
+            return finish[agent]
+
+        on_path = max((done(s.agent) for s in profile.steps), default=0.0)
+        return (on_path + self.latency(SIMULATOR)
+                + self.rate("StopIntent", profile) * self.latency("StopIntent"))
+
+    def scenario(self, name: str, max_turns: int, pipeline: str, variant: str, smart: bool = True,
+                 start: int = 1) -> ScenarioEstimate:
+        profile = load_profile(pipeline)
+        prefix = name.startswith(PREFIX_KEY)
+        turns = max_turns * (1.0 if prefix else self.turn_ratio.get(name, PRIOR_TURN_RATIO))
+        by_agent = {a: self.rate(a, profile) * exposure(a, profile, turns, start, smart, self.config)
+                    for a in self._agents(profile)}
+        calls = sum(by_agent.values())
+        tokens = sum(n * self.tokens_per_call(a, variant) for a, n in by_agent.items())
+        seconds = (by_agent.get("Greeting", 0.0) * self.latency("Greeting")
+                   + max(turns - start + 1, 0.0) * self._turn_sec(profile, turns, start, smart)
+                   + (0.0 if prefix else self.latency("Evaluator")))  # финальный отчёт после "стоп"
+        return ScenarioEstimate(name, round(turns, 1), calls, tokens, seconds, by_agent)
+
+    def suite(self, matrix: List[Tuple[str, int, str, str, int]], jobs: int = 1, smart: bool = True) -> SuiteEstimate:
+        """matrix: (сценарий, max_turns, конвейер, промпты, с какого хода - 1 или после общего начала)"""
+        items = [self.scenario(name, turns, pipeline, variant, smart, start)
+                 for name, turns, pipeline, variant, start in matrix]
+        calls = sum(s.calls for s in items)
+        tokens = sum(s.tokens for s in items)
+        total = sum(s.seconds for s in items)
+        played = sum(1 for s in items if not s.name.startswith(PREFIX_KEY))
+        serial = (total + PAUSE_SEC * played) * self.correction.get("serial", 1.0)
+
+        avg_latency = sum(s.by_agent.get(a, 0) * self.latency(a) for s in items for a in s.by_agent) / (calls or 1)
+        bounds = {
+            "самый длинный сценарий": max((s.seconds for s in items), default=0.0),
+            f"--jobs {jobs}": total / max(jobs, 1),
+            f"{self.config.LLM_MAX_CONCURRENCY} слота LLM": calls * avg_latency / max(self.config.LLM_MAX_CONCURRENCY, 1),
+        }
+        if self.config.LLM_RPM_QUOTA:
+            bounds[f"квота {self.config.LLM_RPM_QUOTA} RPM"] = 60.0 * calls / self.config.LLM_RPM_QUOTA
+        bound = max(bounds, key=bounds.get)
+        parallel = bounds[bound] * self.correction.get("parallel", 1.0)
+        return SuiteEstimate(items, calls, tokens, serial, parallel, jobs, bound)
+
+    # --- калибровка ---
+
+    def observe_run(self, runs: List[Tuple[str, int, str, int, int]], before: Dict, after: Dict,
+                    rows: List[Tuple[str, int, str, str, int]], jobs: int, wall_sec: float, smart: bool = True):
+        """runs: (сценарий, max_turns, конвейер, фактических ходов, с какого хода) для сыгранных сценариев;
+        rows - матрица прогноза: по ней после обновления статистики считается поправка ко времени"""
+        if not runs:
+            return
+        profiles = {pipeline: load_profile(pipeline) for _, _, pipeline, _, _ in runs}
+        names = set(after) | {a for p in profiles.values() for a in self._agents(p)}
+        for agent in names:
+            # агент, которого ни разу не позвали, тоже учим: иначе его частота так и останется априорной
+            now, prev = after.get(agent, {}), before.get(agent, {})
+            delta = {k: now.get(k, 0.0) - prev.get(k, 0.0) for k in ("calls", "seconds", "tokens")}
+            exp = sum(exposure(agent, profiles[pipeline], turns, start, smart, self.config)
+                      for _, _, pipeline, turns, start in runs)
+            if not exp and not delta["calls"]:
+                continue
+            a = self.agents.setdefault(agent, {"calls": 0.0, "seconds": 0.0, "tokens": 0.0, "exposure": 0.0})
+            for k in ("calls", "seconds", "tokens"):
+                a[k] = a[k] * DECAY + delta[k]
+            a["exposure"] = a["exposure"] * DECAY + exp
+        for name, max_turns, _, turns, _ in runs:
+            ratio = turns / max_turns if max_turns else 1.0
+            old = self.turn_ratio.get(name)
+            self.turn_ratio[name] = ratio if old is None else old * DECAY + ratio * (1 - DECAY)
+        if rows and wall_sec:
+            # поправка - то, чего не объясняют задержки агентов: ожидание в очереди, 429, работа event loop
+            mode = "parallel" if jobs > 1 else "serial"
+            est = self.suite(rows, jobs, smart)
+            raw = (est.parallel_sec if mode == "parallel" else est.serial_sec) / self.correction.get(mode, 1.0)
+            if raw:
+                old = self.correction.get(mode)
+                self.correction[mode] = wall_sec / raw if old is None else old * DECAY + wall_sec / raw * (1 - DECAY)
+        self.runs += 1
+        self.save()
+
+    def load(self):
+        if not self.path or not Path(self.path).exists():
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.agents = data.get("agents", {})
+        self.turn_ratio = data.get("turn_ratio", {})
+        self.correction = data.get("correction", {})
+        self.runs = data.get("runs", 0)
+
+    def save(self):
+        if not self.path:
+            return
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump({"runs": self.runs, "agents": self.agents, "turn_ratio": self.turn_ratio,
+                       "correction": self.correction}, f, ensure_ascii=False, indent=2)
+
+
+def fmt_sec(sec: float) -> str:
+    return f"{sec / 60:.1f} мин" if sec >= 90 else f"{sec:.0f}с"
+
+
+def print_estimate(est: SuiteEstimate, runs: int = 0):
+    print(f"\n🔮 Прогноз{' (без статистики, по умолчаниям)' if not runs else f' по {runs} прогонам'}:")
+    print(f"   {'сценарий':<34} {'ходов':>6} {'вызовов':>8} {'токенов':>9} {'время':>9}")
+    for s in est.scenarios:
+        print(f"   {s.name:<34} {s.turns:>6} {s.calls:>8.0f} {s.tokens:>9.0f} {fmt_sec(s.seconds):>9}")
+    print(f"   Итого: {est.calls:.0f} вызовов LLM, {est.tokens:.0f} токенов")
+    if est.jobs > 1:
+        print(f"   Последовательно: ~{fmt_sec(est.serial_sec)} | --jobs {est.jobs}: ~{fmt_sec(est.parallel_sec)} "
+              f"(упирается в {est.bound})")
+    else:
+        print(f"   Последовательно: ~{fmt_sec(est.serial_sec)} (с паузами {PAUSE_SEC:.0f}с после сценариев)")
+    if est.jobs > 1 and math.isclose(est.parallel_sec, est.serial_sec, rel_tol=0.1):
+        print("   ⚠️ Параллельность почти не помогает - узкое место не в числе сценариев")
@@ -0,0 +1,81 @@
+"""Отпечатки того, от чего зависит поведение агентов: промпт, код, модель, настройки конвейера.
+
+Правка промпта обычно задевает одного агента - перезапускать нужно только сценарии,
+где этот агент участвовал (test_runner.py --changed).
+"""
+import json
+import inspect
+import hashlib
+from dataclasses import asdict
+from typing import Dict
+
+import agents
+import claims
+import config
+import llm_client
+import models
+import orchestrator
+import pipeline
+import prompts
+import question_bank
+import tokens
+import topics
+import verdicts
+from config import Config
+from llm_client import confirm_stop_intent
+from orchestrator import InterviewOrchestrator
+from pipeline import PipelineProfile
+
+# агент -> шаблоны и код, которые собирают его промпт и разбирают ответ
+AGENT_SOURCES = {
+    "Observer": (prompts.OBSERVER, agents.ObserverAgent),
+    "FactChecker": (prompts.FACT_CHECKER, agents.FactCheckerAgent),
+    "Interviewer": (prompts.INTERVIEWER, prompts.INTERVIEWER_MODES, agents.InterviewerAgent),
+    "MetaReviewer": (prompts.META_REVIEWER, agents.MetaReviewerAgent),
+    "ContradictionDetector": (prompts.CONTRADICTION, agents.ContradictionDetector),
+    "DepthProber": (prompts.DEPTH_PROBER, agents.DepthProber),
+    "Evaluator": (prompts.EVALUATOR_DRAFT, agents.EvaluatorAgent),  # финальные промпты - прямо в коде
+    "Greeting": (InterviewOrchestrator.generate_greeting,),
+    "StopIntent": (confirm_stop_intent,),
+}
+# общий код хода: меняется он - меняются все сценарии. Модули целиком: банк вопросов, темы, индекс
+# утверждений, кэш вердиктов, обрезка истории, оценка стопа и модели влияют на нескольких агентов сразу
+CORE_SOURCES = (orchestrator, pipeline.PipelineExecutor, pipeline.TurnState, pipeline.TurnBudget,
+                pipeline._conditions_met, agents.BaseAgent, agents.DifficultyController, llm_client, models,
+                question_bank, topics, claims, verdicts, tokens, config)
+# настройки, которые не влияют на диалог: ключи, пути, наблюдаемость, лимиты параллельности
+_RUNTIME_ONLY = {"GEMINI_API_KEY", "PROXY", "GEMINI_URL", "TOKEN_CALIBRATION_FILE", "FACT_CACHE_FILE",
+                 "LLM_RECORD_FILE", "LLM_MAX_CONCURRENCY", "LLM_RPM_QUOTA", "LLM_STARVATION_SEC", "TRACING_ENABLED",
+                 "METRICS_PORT", "METRICS_FILE", "METRICS_DUMP_SEC",
+                 # по агентам - в отпечатке агента
+                 "AGENT_MAX_OUTPUT", "AGENT_INPUT_BUDGETS", "PIPELINE_PROFILE", "PROMPT_VARIANT"}
+
+
+def digest(*parts) -> str:
+    data = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha1(data.encode("utf-8")).hexdigest()[:12]
+
+
+def _source(obj, variant: str) -> str:
+    if isinstance(obj, prompts.PromptTemplate):
+        return obj.source(variant)
+    if isinstance(obj, dict):
+        return json.dumps(obj, ensure_ascii=False, sort_keys=True)
+    return inspect.getsource(obj)
+
+
+def core_fingerprint(config: Config) -> str:
+    settings = {k: v for k, v in asdict(config).items() if k not in _RUNTIME_ONLY}
+    return digest([inspect.getsource(obj) for obj in CORE_SOURCES], settings)
+
+
+def agent_fingerprints(config: Config, profile: PipelineProfile, variant: str) -> Dict[str, str]:
+    """Агент -> отпечаток его промпта, кода, лимитов и шага в конвейере"""
+    limits = {"max_calls": profile.max_calls, "max_tokens": profile.max_tokens}
+    result = {}
+    for agent, sources in AGENT_SOURCES.items():
+        step = profile.step(agent)
+        result[agent] = digest([_source(obj, variant) for obj in sources],
+                               config.AGENT_MAX_OUTPUT.get(agent, 0), config.AGENT_INPUT_BUDGETS.get(agent, 0),
+                               asdict(step) if step else None, limits)
+    return result
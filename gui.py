@@ -14,11 +14,15 @@ except ImportError:
 from config import AVAILABLE_MODELS, adapt_log_to_tz_format
 from models import Candidate
 from orchestrator import InterviewOrchestrator
+from profiling import profiled
 
 class InterviewGUI:
-    def __init__(self):
+    def __init__(self, profiler=None):
         self.orchestrator = None
+        self.profiler = profiler  # профилируем ход целиком, вместе с обновлением интерфейса
         self.loop = asyncio.new_event_loop()
+        # цикл крутится постоянно, чтобы фоновые задачи (черновик отчёта) шли между ходами
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
         self.root = tk.Tk()
         self.root.title("Interview Coach")
         self.root.geometry("1100x750")
@@ -115,7 +119,7 @@ class InterviewGUI:
         self._chat("user", msg)
         self.status_var.set("Обработка...")
         self._disable_input()
-        self._run_async(self._process(msg))
+        self._run_async(profiled(self.profiler, "turn", self._process(msg)))
     
     async def _process(self, msg: str):
         r = await self.orchestrator.process_message(msg)
@@ -133,7 +137,7 @@ class InterviewGUI:
         if self.orchestrator and self.orchestrator.session:
             self.status_var.set("Генерация...")
             self._disable_input()
-            self._run_async(self._do_finish())
+            self._run_async(profiled(self.profiler, "finish", self._do_finish()))
     
     async def _do_finish(self):
         self._finish(await self.orchestrator.finish_interview())
@@ -239,23 +243,16 @@ class InterviewGUI:
         self.send_btn.configure(state=tk.DISABLED)
     
     def _run_async(self, coro):
-        # tkinter не дружит с async, поэтому через thread
-        def run():
-            asyncio.set_event_loop(self.loop)
-            self.loop.run_until_complete(coro)
-        t = threading.Thread(target=run)
-        t.start()
-        def check():
-            if t.is_alive():
-                self.root.after(100, check)
-        check()
+        # tkinter не дружит с async, поэтому отдаём корутину в цикл из отдельного потока
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
     
     def run(self):
         self.root.mainloop()
         try:
-            self.loop.run_until_complete(self.orchestrator.close())
+            asyncio.run_coroutine_threadsafe(self.orchestrator.close(), self.loop).result(timeout=5)
         except:
             pass
+        self.loop.call_soon_threadsafe(self.loop.stop)
 
 class SetupDialog:
     def __init__(self, parent):
@@ -296,7 +293,7 @@ class SetupDialog:
                        "grade": self.grade.get() or "Junior", "experience": self.exp.get() or "не указано"}
         self.top.destroy()
 
-async def run_cli():
+async def run_cli(profiler=None):
     print("="*55 + "\n   ТРЕНАЖЁР СОБЕСЕДОВАНИЙ\n" + "="*55)
     name = input("Имя: ").strip() or "Кандидат"
     position = input("Позиция: ").strip() or "Backend Developer"
@@ -313,13 +310,14 @@ async def run_cli():
     
     while True:
         try:
-            inp = input("👤 Вы: ").strip()
+            # input в потоке, чтобы фоновые задачи не стояли пока пользователь печатает
+            inp = (await asyncio.to_thread(input, "👤 Вы: ")).strip()
         except (KeyboardInterrupt, EOFError):
             break
         if not inp:
             continue
         
-        r = await orch.process_message(inp)
+        r = await profiled(profiler, f"turn_{len(orch.session.turns) + 1:02d}", orch.process_message(inp))
         if r.get("finished"):
             print("\n" + "="*55 + "\n   ЗАВЕРШЕНО\n" + "="*55)
             fb = r["feedback"]
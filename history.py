@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""История прогонов тестов в SQLite: summary_*.json и логи сценариев, запросы трендов по времени"""
+import os
+import glob
+import json
+import sqlite3
+import argparse
+from typing import Dict, List, Tuple
+
+DEFAULT_DB = "test_logs/history.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    file TEXT UNIQUE,
+    ts TEXT,
+    day TEXT,
+    model TEXT,
+    smart INTEGER,
+    backend TEXT,
+    chaos TEXT DEFAULT '',
+    total INTEGER,
+    passed INTEGER,
+    warned INTEGER,
+    failed INTEGER,
+    jobs INTEGER,
+    wall_sec REAL
+);
+CREATE TABLE IF NOT EXISTS scenarios (
+    run_id INTEGER REFERENCES runs(id) ON DELETE CASCADE,
+    name TEXT,
+    pipeline TEXT,
+    prompts TEXT,
+    result TEXT,
+    duration REAL,
+    turns INTEGER,
+    llm_calls INTEGER,
+    llm_tokens INTEGER,
+    llm_errors INTEGER,
+    calls_per_turn REAL,
+    grade TEXT,
+    recommendation TEXT,
+    cached INTEGER,
+    log_file TEXT
+);
+CREATE TABLE IF NOT EXISTS checks (
+    run_id INTEGER REFERENCES runs(id) ON DELETE CASCADE,
+    scenario TEXT,
+    pipeline TEXT,
+    prompts TEXT,
+    name TEXT,
+    result TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_model ON runs(model, smart, day);
+CREATE INDEX IF NOT EXISTS scenarios_name ON scenarios(name, run_id);
+CREATE INDEX IF NOT EXISTS checks_name ON checks(name, run_id);
+"""
+
+# метрика тренда -> выражение по таблице scenarios (s) за группу
+METRICS = {
+    "pass_rate": "AVG(s.result = 'PASS')",
+    "duration": "AVG(s.duration)",
+    "calls_per_turn": "SUM(s.llm_calls) * 1.0 / MAX(SUM(s.turns), 1)",
+    "tokens_per_turn": "SUM(s.llm_tokens) * 1.0 / MAX(SUM(s.turns), 1)",
+}
+
+
+def connect(path: str = DEFAULT_DB) -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA foreign_keys = ON")
+    conn.executescript(SCHEMA)
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(runs)")}
+    if "chaos" not in columns:  # база от версии без учёта сбоев: спецификацию берём из summary, если он остался
+        with conn:
+            conn.execute("ALTER TABLE runs ADD COLUMN chaos TEXT DEFAULT ''")
+            for run_id, file in conn.execute("SELECT id, file FROM runs").fetchall():
+                try:
+                    with open(file, "r", encoding="utf-8") as f:
+                        spec = (json.load(f).get("chaos") or {}).get("spec", "")
+                except (OSError, ValueError):
+                    continue
+                conn.execute("UPDATE runs SET chaos = ? WHERE id = ?", (spec, run_id))
+    return conn
+
+
+def _decision(log_file: str) -> Dict:
+    """Оценка и рекомендация из лога сценария в формате ТЗ, если он ещё лежит рядом"""
+    try:
+        with open(log_file.replace(".json", "_tz.json"), "r", encoding="utf-8") as f:
+            fb = json.load(f).get("final_feedback", {})
+    except (OSError, ValueError, AttributeError):
+        return {}
+    return fb.get("decision", {}) if isinstance(fb, dict) else {}
+
+
+def ingest_summary(conn: sqlite3.Connection, path: str) -> bool:
+    """Один summary_*.json; повторная загрузка того же файла ничего не меняет"""
+    key = os.path.abspath(path)
+    if conn.execute("SELECT 1 FROM runs WHERE file = ?", (key,)).fetchone():
+        return False
+    with open(path, "r", encoding="utf-8") as f:
+        summary = json.load(f)
+    ts = summary.get("timestamp", "")
+    with conn:
+        cur = conn.execute(
+            "INSERT INTO runs (file, ts, day, model, smart, backend, chaos, total, passed, warned, failed, jobs,"
+            " wall_sec) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (key, ts, ts[:10], summary.get("model", ""), int(bool(summary.get("smart_mode"))),
+             summary.get("backend", "live"), (summary.get("chaos") or {}).get("spec", ""), summary.get("total", 0), summary.get("passed", 0),
+             summary.get("warned", 0), summary.get("failed", 0), summary.get("jobs", 1), summary.get("wall_sec", 0.0)))
+        run_id = cur.lastrowid
+        for sc in summary.get("scenarios", []):
+            turns = sc.get("turns", 0)
+            decision = _decision(sc.get("log_file", ""))
+            conn.execute(
+                "INSERT INTO scenarios VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (run_id, sc["name"], sc.get("pipeline", "default"), sc.get("prompts", ""), sc["result"],
+                 sc.get("duration", 0.0), turns, sc.get("llm_calls", 0), sc.get("llm_tokens", 0),
+                 sc.get("llm_errors", 0), round(sc.get("llm_calls", 0) / turns, 2) if turns else 0.0,
+                 decision.get("evaluated_grade", ""), decision.get("hiring_recommendation", ""),
+                 int(sc.get("cached", False)), sc.get("log_file", "")))
+            conn.executemany("INSERT INTO checks VALUES (?, ?, ?, ?, ?, ?)",
+                             [(run_id, sc["name"], sc.get("pipeline", "default"), sc.get("prompts", ""), name, c["result"])
+                              for name, c in sc.get("checks", {}).items()])
+    return True
+
+
+def ingest(conn: sqlite3.Connection, patterns: List[str]) -> int:
+    added = 0
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern)):
+            try:
+                added += ingest_summary(conn, path)
+            except (OSError, ValueError, KeyError) as e:
+                print(f"⚠️ {path}: {e}")
+    return added
+
+
+def _filters(args) -> Tuple[str, list]:
+    where, params = ["1 = 1"], []
+    for column, value in (("r.model", args.model), ("s.name", args.scenario), ("s.pipeline", args.pipeline),
+                          ("s.prompts", args.prompts)):
+        if value:
+            where.append(f"{column} = ?")
+            params.append(value)
+    if args.smart is not None:
+        where.append("r.smart = ?")
+        params.append(int(args.smart))
+    if args.since:
+        where.append("r.day >= ?")
+        params.append(args.since)
+    # заглушки, кассеты и подмешанные сбои не смешиваем с живыми прогонами, если не попросили
+    if args.backend != "all":
+        where.append("(r.backend = ? OR r.backend LIKE ?)")
+        params += [args.backend, f"{args.backend}:%"]
+    if args.chaos != "all":
+        where.append("r.chaos = ?")
+        params.append(args.chaos)
+    where.append("s.cached = 0")  # взятое из прошлого прогона не считаем дважды
+    return " AND ".join(where), params
+
+
+def trend(conn: sqlite3.Connection, args) -> List[tuple]:
+    where, params = _filters(args)
+    group = "r.day" if args.by == "day" else "r.ts"
+    rows = conn.execute(
+        f"SELECT {group}, r.model, COUNT(*), {METRICS[args.metric]} FROM runs r JOIN scenarios s ON s.run_id = r.id"
+        f" WHERE {where} GROUP BY {group}, r.model ORDER BY {group}", params).fetchall()
+    top = max((abs(v or 0) for *_, v in rows), default=0) or 1
+    print(f"\n📈 {args.metric} по {'дням' if args.by == 'day' else 'прогонам'}")
+    for when, model, n, value in rows:
+        value = value or 0.0
+        shown = f"{value:.0%}" if args.metric == "pass_rate" else f"{value:.2f}"
+        print(f"   {when[:19]:<19} {model:<24} {n:>4} сц. {shown:>8} {'█' * round(20 * value / top)}")
+    return rows
+
+
+def slowest(conn: sqlite3.Connection, args) -> List[tuple]:
+    where, params = _filters(args)
+    rows = conn.execute(
+        f"SELECT s.name, s.pipeline, s.prompts, COUNT(*), AVG(s.duration), MAX(s.duration),"
+        f" SUM(s.llm_calls) * 1.0 / MAX(SUM(s.turns), 1), AVG(s.result = 'PASS')"
+        f" FROM runs r JOIN scenarios s ON s.run_id = r.id WHERE {where}"
+        f" GROUP BY s.name, s.pipeline, s.prompts ORDER BY AVG(s.duration) DESC LIMIT ?",
+        params + [args.limit]).fetchall()
+    print("\n🐢 Самые медленные сценарии")
+    for name, pipeline, prompts, n, avg, worst, cpt, pass_rate in rows:
+        print(f"   {name:<20} [{pipeline}/{prompts}] {n:>3} прог. | avg {avg:.1f}с, max {worst:.1f}с | "
+              f"{cpt:.1f} вызовов на ход | пройдено {pass_rate:.0%}")
+    return rows
+
+
+def flaky_checks(conn: sqlite3.Connection, args) -> List[tuple]:
+    where, params = _filters(args)
+    rows = conn.execute(
+        f"SELECT c.name, COUNT(*), AVG(c.result = 'PASS') FROM runs r JOIN scenarios s ON s.run_id = r.id"
+        f" JOIN checks c ON c.run_id = r.id AND c.scenario = s.name"
+        f" AND c.pipeline = s.pipeline AND c.prompts = s.prompts WHERE {where}"
+        f" GROUP BY c.name ORDER BY AVG(c.result = 'PASS') LIMIT ?", params + [args.limit]).fetchall()
+    print("\n🔎 Проверки с наименьшей долей PASS")
+    for name, n, rate in rows:
+        print(f"   {name:<30} {n:>4} раз | PASS {rate:.0%}")
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="История прогонов тестов и тренды")
+    parser.add_argument("--db", default=DEFAULT_DB)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_ing = sub.add_parser("ingest", help="загрузить summary_*.json (повторно загруженные пропускаются)")
+    p_ing.add_argument("paths", nargs="*", default=["test_logs/summary_*.json"])
+
+    p_trend = sub.add_parser("trend", help="метрика по дням или прогонам")
+    p_trend.add_argument("--metric", choices=sorted(METRICS), default="pass_rate")
+    p_trend.add_argument("--by", choices=("day", "run"), default="day")
+    p_slow = sub.add_parser("slowest", help="самые медленные сценарии")
+    p_checks = sub.add_parser("checks", help="проверки, которые чаще всего не проходят")
+    for p in (p_trend, p_slow, p_checks):
+        p.add_argument("--model", default="")
+        p.add_argument("--scenario", default="")
+        p.add_argument("--pipeline", default="")
+        p.add_argument("--prompts", default="")
+        p.add_argument("--smart", type=lambda v: v.lower() in ("1", "true", "yes"), default=None,
+                       help="true/false - только умный или обычный режим")
+        p.add_argument("--since", default="", help="с даты YYYY-MM-DD")
+        p.add_argument("--backend", default="live", help="live, fake, replay или all")
+        p.add_argument("--chaos", default="", help="спецификация сбоев (--chaos прогона), all - любые; по умолчанию без сбоев")
+        p.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+
+    conn = connect(args.db)
+    if args.command == "ingest":
+        print(f"📥 Загружено прогонов: {ingest(conn, args.paths)}")
+    elif args.command == "trend":
+        trend(conn, args)
+    elif args.command == "slowest":
+        slowest(conn, args)
+    else:
+        flaky_checks(conn, args)
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,29 @@
 import json
 import re
+import time
 import asyncio
 import httpx
 from typing import Dict, Optional
-from config import Config, CFG, STOP_WORDS
+from config import Config, CFG, STOP_WORDS, STOP_HINTS
+from scheduler import LLMScheduler, Priority, SCHEDULER
+from tracing import span
+from tokens import ESTIMATOR
+from backends import BackendTransport, ChaosTransport, get_backend, get_recorder
+from metrics import LLM_SECONDS, LLM_TOKENS, LLM_RETRIES, LLM_RATE_LIMITED, LLM_ERRORS
 
 class GeminiClient:
-    def __init__(self, config: Config = CFG):
+    def __init__(self, config: Config = CFG, scheduler: LLMScheduler = SCHEDULER):
         self.config = config
+        self.scheduler = scheduler
+        self.session_id = f"client-{id(self)}"  # ключ сессии для честной очереди
+        self.calls = 0
+        self.errors = 0  # 429 и прочие сбои, для контроля SLO
+        self.tokens = 0  # prompt + output по usageMetadata, для бюджета хода
+        self.agent_calls: Dict[str, int] = {}  # какие агенты вызывались и сколько раз
         self._client: Optional[httpx.AsyncClient] = None
+        self.backend = get_backend(config.LLM_BACKEND)  # None - живой API
+        self.recorder = get_recorder(config.LLM_RECORD_FILE)  # запись ответов для replay
+        self.chaos = config.LLM_CHAOS  # сбои по заказу, см. backends.ChaosTransport
     
     def set_model(self, model_id: str):
         self.config.GEMINI_MODEL = model_id
@@ -18,64 +33,152 @@ class GeminiClient:
     async def _get_client(self) -> httpx.AsyncClient:
         if self._client is None:
             transport = httpx.AsyncHTTPTransport(proxy=self.config.PROXY) if self.config.PROXY else None
+            if self.chaos:
+                inner = BackendTransport(self.backend) if self.backend else transport or httpx.AsyncHTTPTransport()
+                transport = ChaosTransport(inner, self.chaos)
             self._client = httpx.AsyncClient(transport=transport, timeout=httpx.Timeout(60.0, connect=15.0))
             # 60 сек общий таймаут, 15 на коннект - эмпирически подобрано
         return self._client
     
-    async def generate(self, prompt: str, temperature: float = None) -> str:
+    async def generate(self, prompt: str, temperature: float = None,
+                       priority: Priority = Priority.ANALYSIS, agent: str = "", model: str = "",
+                       max_tokens: int = 0) -> str:
+        started = time.perf_counter()
+        model = model or self.config.GEMINI_MODEL
+        self.agent_calls[agent or "other"] = self.agent_calls.get(agent or "other", 0) + 1
+        with span("llm.generate", model=model, priority=priority.name, prompt_chars=len(prompt),
+                  est_tokens=ESTIMATOR.estimate(prompt)) as gen_span:
+            text = await self._generate(prompt, temperature, priority, agent or "other", model, max_tokens)
+            gen_span.set(response_chars=len(text))
+        LLM_SECONDS.observe(time.perf_counter() - started, agent=agent or "other", model=model)
+        return text
+    
+    async def _generate(self, prompt: str, temperature: Optional[float], priority: Priority,
+                        agent: str, model: str, max_tokens: int = 0) -> str:
+        if self.backend is not None and not self.chaos:
+            self.calls += 1
+            return await self._generate_offline(prompt, priority, agent, model)
         client = await self._get_client()
-        url = f"{self.config.GEMINI_URL}/models/{self.config.GEMINI_MODEL}:generateContent"
+        url = f"{self.config.GEMINI_URL}/models/{model}:generateContent"
         
         temp = temperature if temperature is not None else self.config.TEMPERATURE
         payload = {
             "contents": [{"parts": [{"text": prompt}]}],
-            "generationConfig": {"temperature": temp, "maxOutputTokens": self.config.MAX_TOKENS}
+            "generationConfig": {"temperature": temp, "maxOutputTokens": max_tokens or self.config.MAX_TOKENS}
         }
-        headers = {"x-goog-api-key": self.config.GEMINI_API_KEY, "Content-Type": "application/json"}
-
+        headers = {"Content-Type": "application/json"}
+        if self.backend is None:  # ответы бэкенда (--chaos поверх replay/fake) ключ не требуют
+            headers["x-goog-api-key"] = self.config.GEMINI_API_KEY
+        self.calls += 1
         
         # retry при rate limit
         max_attempts = 4
         for attempt in range(max_attempts):
+            if attempt:
+                LLM_RETRIES.inc(agent=agent)
             try:
-                response = await client.post(url, json=payload, headers=headers)
+                # слот берём только на сам запрос, паузы ретраев его не держат
+                with span("queue_wait"):
+                    await self.scheduler.acquire(priority, self.session_id)
+                try:
+                    with span("http", attempt=attempt + 1) as http_span:
+                        http_started = time.perf_counter()
+                        response = await client.post(url, json=payload, headers=headers,
+                                                     extensions={"agent": agent})
+                        http_span.set(status=response.status_code)
+                finally:
+                    self.scheduler.release()
                 
                 # 429 = rate limit, ждём и пробуем снова
                 if response.status_code == 429:
+                    self.errors += 1
+                    LLM_RATE_LIMITED.inc(agent=agent)
                     wait = 2 + attempt * 2  # 2, 4, 6, 8 сек
                     print(f"Rate limit (429), жду {wait}с... (попытка {attempt + 1}/{max_attempts})")
-                    await asyncio.sleep(wait)
+                    with span("retry_sleep", seconds=wait):
+                        await asyncio.sleep(wait)
                     continue
                 
                 response.raise_for_status()
-                data = response.json()
+                with span("json_decode"):
+                    data = response.json()
                 
+                usage = data.get("usageMetadata", {})
+                self._account(usage, agent)
+                if self.backend is None:
+                    ESTIMATOR.observe(prompt, usage.get("promptTokenCount", 0))  # калибруем оценщик на лету
+                
+                text = ""
                 if "candidates" in data and data["candidates"]:
-                    return data["candidates"][0]["content"]["parts"][0]["text"]
-                return ""
+                    text = data["candidates"][0]["content"]["parts"][0]["text"]
+                if self.recorder:
+                    self.recorder.record(agent, model, prompt, text, time.perf_counter() - http_started, usage)
+                return text
                 
             except httpx.HTTPStatusError as e:
+                self.errors += 1
+                if e.response.status_code == 429:
+                    LLM_RATE_LIMITED.inc(agent=agent)
                 if e.response.status_code == 429 and attempt < max_attempts - 1:
                     wait = 2 + attempt * 2
                     print(f"Rate limit (429), жду {wait}с... (попытка {attempt + 1}/{max_attempts})")
-                    await asyncio.sleep(wait)
+                    with span("retry_sleep", seconds=wait):
+                        await asyncio.sleep(wait)
                     continue
                 print(f"Ошибка LLM: {e}")
+                LLM_ERRORS.inc(agent=agent)
                 return ""
             except Exception as e:
+                self.errors += 1
                 print(f"Ошибка LLM: {e}")
+                LLM_ERRORS.inc(agent=agent)
                 return ""
         
         print("Превышено число попыток LLM")
+        LLM_ERRORS.inc(agent=agent)
         return ""
 
     
+    async def _generate_offline(self, prompt: str, priority: Priority, agent: str, model: str) -> str:
+        # та же очередь, что и у живых запросов, - иначе бенчмарк не увидит ожидание слота
+        with span("queue_wait"):
+            await self.scheduler.acquire(priority, self.session_id)
+        try:
+            with span("backend", kind=self.backend.name):
+                text, usage = await self.backend.generate(prompt, agent, model)
+        finally:
+            self.scheduler.release()
+        self._account(usage, agent)
+        return text
+    
+    def _account(self, usage: Dict, agent: str):
+        self.tokens += usage.get("promptTokenCount", 0) + usage.get("candidatesTokenCount", 0)
+        LLM_TOKENS.inc(usage.get("promptTokenCount", 0), agent=agent, kind="prompt")
+        LLM_TOKENS.inc(usage.get("candidatesTokenCount", 0), agent=agent, kind="output")
+    
+    async def count_tokens(self, text: str, model: str = "") -> int:
+        """Точное число токенов через countTokens, 0 при ошибке"""
+        client = await self._get_client()
+        url = f"{self.config.GEMINI_URL}/models/{model or self.config.GEMINI_MODEL}:countTokens"
+        headers = {"x-goog-api-key": self.config.GEMINI_API_KEY, "Content-Type": "application/json"}
+        try:
+            response = await client.post(url, json={"contents": [{"parts": [{"text": text}]}]}, headers=headers)
+            response.raise_for_status()
+            return response.json().get("totalTokens", 0)
+        except Exception as e:
+            print(f"Ошибка countTokens: {e}")
+            return 0
+
     async def close(self):
         if self._client:
             await self._client.aclose()
             self._client = None
 
 def parse_json_response(text: str) -> Optional[Dict]:
+    with span("parse_json", chars=len(text or "")):
+        return _parse_json_response(text)
+
+def _parse_json_response(text: str) -> Optional[Dict]:
     if not text:
         return None
     text = text.strip()
@@ -100,13 +203,30 @@ def parse_json_response(text: str) -> Optional[Dict]:
             pass
     return None
 
-async def is_stop_intent(llm: GeminiClient, message: str) -> bool:
+def stop_intent_score(message: str) -> float:
+    """Дешёвая оценка вероятности стопа: 1.0 - точно стоп, 0.0 - точно нет, между - надо спросить LLM"""
     msg_lower = message.lower().strip()
     if any(word in msg_lower for word in STOP_WORDS):
+        return 1.0
+    if len(message) >= 100 or "?" in message:
+        return 0.0
+    hits = sum(1 for h in STOP_HINTS if h in msg_lower)
+    return min(0.9, 0.3 + 0.3 * hits)
+
+async def is_stop_intent(llm: GeminiClient, message: str) -> bool:
+    score = stop_intent_score(message)
+    if score >= 1.0:
         return True
-    
-    if len(message) < 100 and "?" not in message:
-        prompt = f'''Определи, хочет ли пользователь ЯВНО ЗАВЕРШИТЬ интервью и получить фидбек.
+    if score > 0:
+        return await confirm_stop_intent(llm, message)
+    return False
+
+async def confirm_stop_intent(llm: GeminiClient, message: str) -> bool:
+    with span("StopIntent.confirm"):
+        return await _confirm_stop_intent(llm, message)
+
+async def _confirm_stop_intent(llm: GeminiClient, message: str) -> bool:
+    prompt = f'''Определи, хочет ли пользователь ЯВНО ЗАВЕРШИТЬ интервью и получить фидбек.
 
 Сообщение: "{message}"
 
@@ -130,6 +250,5 @@ async def is_stop_intent(llm: GeminiClient, message: str) -> bool:
 Завершение только при ЯВНОМ намерении закончить интервью.
 
 Ответь ТОЛЬКО: YES или NO'''
-        response = await llm.generate(prompt, temperature=0.1)
-        return response.strip().upper().startswith("YES")
-    return False
+    response = await llm.generate(prompt, temperature=0.1, priority=Priority.ANALYSIS, agent="StopIntent")
+    return response.strip().upper().startswith("YES")
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""Нагрузочный прогон: много одновременных кандидатов против InterviewOrchestrator в одном процессе"""
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tracemalloc
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List
+
+from config import CFG
+
+try:
+    import resource  # только Unix
+except ImportError:
+    resource = None
+
+# ответы кандидатов без LLM: содержание для нагрузки неважно, важна длина и разнообразие
+REPLIES = [
+    "Список изменяемый, кортеж нет, поэтому кортеж можно использовать как ключ словаря.",
+    "Индексы ускоряют поиск, но замедляют вставку и занимают место на диске.",
+    "GIL не даёт двум потокам одновременно выполнять байткод, для CPU-задач лучше процессы.",
+    "N+1 - это когда на каждый объект из списка идёт отдельный запрос, лечится select_related.",
+    "Честно, не знаю, с этим не сталкивался.",
+    "Работал с Django два года, писал REST API на DRF и фоновые задачи на Celery.",
+    "Декоратор - функция, которая принимает функцию и возвращает обёртку над ней.",
+    "А какие задачи будут у команды в первые месяцы?",
+]
+
+
+@dataclass
+class LoadStats:
+    turn_sec: List[float] = field(default_factory=list)
+    session_sec: List[float] = field(default_factory=list)
+    loop_lag: List[float] = field(default_factory=list)
+    errors: int = 0
+    active: int = 0
+    peak_active: int = 0
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+def _rss_mb() -> float:
+    if resource is None:
+        # Windows: пик памяти Python-объектов по tracemalloc - без памяти интерпретатора, но для разницы хватит
+        return tracemalloc.get_traced_memory()[1] / (1024 * 1024) if tracemalloc.is_tracing() else 0.0
+    # ru_maxrss в Linux - килобайты, в macOS - байты
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+async def candidate(n: int, args, stats: LoadStats, think):
+    from models import Candidate
+    from orchestrator import InterviewOrchestrator
+
+    orch = InterviewOrchestrator(smart_mode=args.smart, pipeline=args.pipeline)
+    orch.start_session(Candidate(name=f"Кандидат {n}", position="Python Backend Developer",
+                                 grade="Middle", experience="2 года"))
+    stats.active += 1
+    stats.peak_active = max(stats.peak_active, stats.active)
+    rng = random.Random(n)
+    started = time.perf_counter()
+    try:
+        await orch.generate_greeting()
+        for _ in range(args.turns):
+            await asyncio.sleep(think())
+            t0 = time.perf_counter()
+            res = await orch.process_message(rng.choice(REPLIES))
+            stats.turn_sec.append(time.perf_counter() - t0)
+            if "error" in res:
+                stats.errors += 1
+        await orch.finish_interview()
+        stats.session_sec.append(time.perf_counter() - started)
+    except Exception as e:
+        stats.errors += 1
+        print(f"❌ Кандидат {n}: {e}")
+    finally:
+        stats.active -= 1
+        await orch.close()
+
+
+async def monitor_lag(stats: LoadStats, interval: float = 0.05):
+    """Насколько позже обещанного просыпается sleep - столько event loop был занят"""
+    while True:
+        t0 = time.perf_counter()
+        await asyncio.sleep(interval)
+        stats.loop_lag.append(time.perf_counter() - t0 - interval)
+
+
+async def run(args) -> Dict:
+    from scheduler import SCHEDULER
+    from backends import parse_distribution
+
+    if args.llm_concurrency:
+        SCHEDULER.max_concurrent = args.llm_concurrency
+    think = parse_distribution(args.think, random.Random(1))
+    stats = LoadStats()
+    if resource is None:
+        tracemalloc.start()
+    rss_start = _rss_mb()
+    lag_task = asyncio.create_task(monitor_lag(stats))
+
+    started = time.perf_counter()
+    tasks = []
+    for n in range(args.sessions):
+        tasks.append(asyncio.create_task(candidate(n, args, stats, think)))
+        if args.rate:
+            await asyncio.sleep(random.expovariate(args.rate))  # пуассоновский поток приходов
+    await asyncio.gather(*tasks)
+    wall = time.perf_counter() - started
+    lag_task.cancel()
+
+    turns = len(stats.turn_sec)
+    result = {
+        "backend": CFG.LLM_BACKEND,
+        "sessions": args.sessions,
+        "arrival_rate": args.rate,
+        "think": args.think,
+        "llm_concurrency": SCHEDULER.max_concurrent,
+        "wall_sec": round(wall, 1),
+        "peak_active": stats.peak_active,
+        "errors": stats.errors,
+        "throughput_turns_sec": round(turns / wall, 2) if wall else 0,
+        "throughput_sessions_min": round(60 * len(stats.session_sec) / wall, 1) if wall else 0,
+        "turn_p50": round(percentile(stats.turn_sec, 0.5), 3),
+        "turn_p95": round(percentile(stats.turn_sec, 0.95), 3),
+        "turn_p99": round(percentile(stats.turn_sec, 0.99), 3),
+        "session_p50": round(percentile(stats.session_sec, 0.5), 1),
+        "loop_lag_p50_ms": round(1000 * percentile(stats.loop_lag, 0.5), 1),
+        "loop_lag_p99_ms": round(1000 * percentile(stats.loop_lag, 0.99), 1),
+        "loop_lag_max_ms": round(1000 * max(stats.loop_lag, default=0), 1),
+        # пиковый RSS процесса сверх стартового на одну одновременную сессию - грубо, но без зависимостей
+        "mem_per_session_mb": round((_rss_mb() - rss_start) / max(stats.peak_active, 1), 2),
+        "llm_queue_wait": SCHEDULER.stats(),
+    }
+    return result
+
+
+def print_report(r: Dict):
+    print(f"\n📈 Нагрузка: {r['sessions']} сессий, пик одновременно {r['peak_active']}, "
+          f"бэкенд {r['backend']}, слотов LLM {r['llm_concurrency']}")
+    print(f"   ⏱️ {r['wall_sec']}с | {r['throughput_turns_sec']} ходов/с | "
+          f"{r['throughput_sessions_min']} сессий/мин | ошибок {r['errors']}")
+    print(f"   Ход p50/p95/p99: {r['turn_p50']}/{r['turn_p95']}/{r['turn_p99']}с | сессия p50 {r['session_p50']}с")
+    print(f"   Лаг event loop p50/p99/max: {r['loop_lag_p50_ms']}/{r['loop_lag_p99_ms']}/{r['loop_lag_max_ms']}мс")
+    print(f"   Память: ~{r['mem_per_session_mb']} МБ на сессию")
+    for prio, w in r["llm_queue_wait"].items():
+        if isinstance(w, dict):
+            print(f"   ⏳ Очередь LLM {prio}: {w['count']} вызовов, avg {w['avg_ms']}мс, p95 {w['p95_ms']}мс")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сколько одновременных интервью держит один процесс")
+    parser.add_argument("--sessions", type=int, default=50, help="сколько кандидатов запустить")
+    parser.add_argument("--rate", type=float, default=5.0, help="приходов в секунду, 0 - все сразу")
+    parser.add_argument("--turns", type=int, default=6, help="ходов на кандидата")
+    parser.add_argument("--think", default="lognormal:3,0.6", help="пауза кандидата перед ответом")
+    parser.add_argument("--latency", default="lognormal:1.0,0.5", help="задержка заглушки LLM (fake)")
+    parser.add_argument("--backend", default="", help="fake (по умолчанию), replay:кассета.jsonl или live")
+    parser.add_argument("--llm-concurrency", type=int, default=0, help="слотов LLM, 0 - из конфига")
+    parser.add_argument("--pipeline", default=CFG.PIPELINE_PROFILE)
+    parser.add_argument("--smart", action="store_true", help="умный режим (MetaReviewer)")
+    parser.add_argument("--out", default="", help="сохранить результат в JSON")
+    args = parser.parse_args()
+
+    # бэкенд задаём до импорта оркестратора: клиенты читают его при создании
+    CFG.LLM_BACKEND = args.backend or f"fake:{args.latency}"
+    CFG.TRACING_ENABLED = False
+    CFG.FACT_CACHE_FILE = ""  # заглушечные вердикты не должны попасть в общий кэш
+    result = asyncio.run(run(args))
+    print_report(result)
+    if args.out:
+        Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
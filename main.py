@@ -1,19 +1,33 @@
 #!/usr/bin/env python3
 import sys
 import asyncio
+from datetime import datetime
 
 try:
     from gui import InterviewGUI, run_cli, HAS_GUI
 except ImportError:
     HAS_GUI = False
     from gui import run_cli
+from metrics import start_exporters
+from profiling import Profiler
 
 def main():
+    start_exporters()
     cli_mode = "--cli" in sys.argv or "-c" in sys.argv
+    
+    # --profile: cProfile и стеки на каждый ход, --profile-mem: ещё и tracemalloc
+    profiler = None
+    if "--profile" in sys.argv or "--profile-mem" in sys.argv:
+        profiler = Profiler(f"profiles/{datetime.now().strftime('%Y%m%d_%H%M%S')}",
+                            memory="--profile-mem" in sys.argv)
+    
     if cli_mode or not HAS_GUI:
-        asyncio.run(run_cli())
+        asyncio.run(run_cli(profiler))
     else:
-        InterviewGUI().run()
+        InterviewGUI(profiler).run()
+    
+    if profiler:
+        print(f"🔬 Профиль: {profiler.finish()}")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,215 @@
+import os
+import math
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from config import Config, CFG
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+
+
+def _fmt(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.label_names)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        super().__init__(name, help_text, labels)
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    def get(self, **labels) -> float:
+        return self.values.get(self._key(labels), 0.0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = list(self.values.items())
+        return self.header() + [f"{self.name}{_labels(self.label_names, k)} {_fmt(v)}" for k, v in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self.values[self._key(labels)] = value
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self.series: Dict[Tuple[str, ...], List[float]] = {}  # [счётчики бакетов..., sum, count]
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            row = self.series.setdefault(key, [0.0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    row[i] += 1
+            row[-2] += value
+            row[-1] += 1
+
+    def count(self, **labels) -> float:
+        row = self.series.get(self._key(labels))
+        return row[-1] if row else 0.0
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        with self._lock:
+            items = [(k, list(v)) for k, v in self.series.items()]
+        for key, row in items:
+            for i, bound in enumerate(self.buckets):
+                le = 'le="' + _fmt(bound) + '"'
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, key, le)} {_fmt(row[i])}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {_fmt(row[-2])}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, key)} {_fmt(row[-1])}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, labels: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help_text, labels))
+
+    def gauge(self, name: str, help_text: str, labels: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, help_text, labels))
+
+    def histogram(self, name: str, help_text: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help_text, labels, buckets))
+
+    def render(self) -> str:
+        """Текстовый формат Prometheus (exposition format 0.0.4)"""
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+TURN_SECONDS = REGISTRY.histogram("interview_turn_seconds", "Время обработки хода кандидата", ["smart"])
+FINISH_SECONDS = REGISTRY.histogram("interview_finish_seconds", "Время от стопа до готового отчёта")
+ACTIVE_SESSIONS = REGISTRY.gauge("interview_active_sessions", "Незавершённые сессии интервью")
+LLM_SECONDS = REGISTRY.histogram("llm_request_seconds", "Время вызова LLM с ретраями", ["agent", "model"])
+LLM_TOKENS = REGISTRY.counter("llm_tokens_total", "Токены по usageMetadata", ["agent", "kind"])
+LLM_RETRIES = REGISTRY.counter("llm_retries_total", "Повторные попытки запросов к LLM", ["agent"])
+LLM_RATE_LIMITED = REGISTRY.counter("llm_rate_limited_total", "Ответы 429 от API", ["agent"])
+LLM_ERRORS = REGISTRY.counter("llm_errors_total", "Вызовы LLM, вернувшие пустой ответ из-за ошибки", ["agent"])
+CHAOS_FAULTS = REGISTRY.counter("llm_chaos_faults_total", "Сбои, подмешанные в ответы LLM (LLM_CHAOS)", ["kind"])
+LLM_QUEUE_WAIT = REGISTRY.histogram("llm_queue_wait_seconds", "Ожидание слота в очереди LLM", ["priority"],
+                                    buckets=(0.001, 0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0))
+FALLBACKS = REGISTRY.counter("agent_fallback_total", "Ответы агентов по запасному пути", ["agent", "kind"])
+HISTORY_TRIMMED = REGISTRY.counter("prompt_history_trimmed_total", "Промпты, где историю подрезали под бюджет",
+                                   ["agent"])
+FACT_CACHE_LOOKUPS = REGISTRY.counter("fact_cache_lookups_total", "Поиски в кэше вердиктов FactChecker",
+                                     ["tier"])
+LLM_CALLS_SAVED = REGISTRY.counter("llm_calls_saved_total", "Вызовы LLM, без которых обошлись локально",
+                                   ["agent", "reason"])
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass  # не засоряем консоль
+
+
+def start_http_server(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Локальный эндпоинт /metrics в фоновом потоке"""
+    server = ThreadingHTTPServer((host, port), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def dump_to_file(path: str):
+    # пишем во временный файл и переименовываем, чтобы node_exporter не прочитал половину
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(REGISTRY.render())
+    os.replace(tmp, path)
+
+
+def start_file_dump(path: str, interval_sec: float) -> threading.Event:
+    """Периодически сбрасывает метрики в файл, вернёт Event для остановки"""
+    stop = threading.Event()
+
+    def loop():
+        while not stop.wait(interval_sec):
+            try:
+                dump_to_file(path)
+            except OSError as e:
+                print(f"Не удалось записать метрики: {e}")
+        dump_to_file(path)
+
+    threading.Thread(target=loop, daemon=True).start()
+    return stop
+
+
+def start_exporters(config: Config = CFG) -> Optional[threading.Event]:
+    """Включает экспорт по настройкам METRICS_PORT / METRICS_FILE"""
+    if config.METRICS_PORT:
+        start_http_server(config.METRICS_PORT)
+        print(f"📈 Метрики: http://127.0.0.1:{config.METRICS_PORT}/metrics")
+    if config.METRICS_FILE:
+        return start_file_dump(config.METRICS_FILE, config.METRICS_DUMP_SEC)
+    return None
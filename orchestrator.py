@@ -1,7 +1,18 @@
+import copy
 import json
+import time
+import asyncio
+from collections import deque
 from datetime import datetime
 from typing import Dict, List, Optional, Set, Any
-from llm_client import GeminiClient, is_stop_intent
+from llm_client import GeminiClient, is_stop_intent, stop_intent_score, confirm_stop_intent
+from scheduler import Priority
+from tracing import Tracer, span
+from pipeline import PipelineExecutor, TurnBudget, TurnState, load_profile
+from metrics import TURN_SECONDS, FINISH_SECONDS, ACTIVE_SESSIONS, FALLBACKS
+from question_bank import QUESTION_BANK
+from topics import canonical
+import prompts
 from models import Candidate, Thought, TurnData, SkillRecord, GapRecord, InterviewSession
 from agents import (
     ObserverAgent, FactCheckerAgent, InterviewerAgent, 
@@ -31,15 +42,80 @@ class ConversationContext:
         return "\n\n".join(lines)
     
     def add_topic(self, topic: str):
-        self.topics.add(topic.lower())
+        self.topics.add(canonical(topic))
     
     def get_topics_list(self) -> List[str]:
         return list(self.topics)
 
 
+class LatencySLOController:
+    """Следит за p95 времени хода и долей ошибок API, при нарушении SLO
+    по одному отключает необязательных агентов, при запасе возвращает обратно"""
+    
+    # порядок отключения: сначала самые дорогие и наименее важные
+    OPTIONAL_AGENTS = ["MetaReviewer", "DepthProber", "ContradictionDetector", "FactChecker"]
+    
+    def __init__(self, p95_slo_sec: float, max_error_rate: float, window: int = 10,
+                 min_samples: int = 3, restore_ratio: float = 0.6):
+        self.p95_slo_sec = p95_slo_sec
+        self.max_error_rate = max_error_rate
+        self.min_samples = min_samples
+        self.restore_ratio = restore_ratio  # возвращаем агента когда p95 ниже этой доли SLO
+        self.latencies = deque(maxlen=window)
+        self.calls = deque(maxlen=window)
+        self.errors = deque(maxlen=window)
+        self.shed: List[str] = []
+    
+    def is_enabled(self, agent: str) -> bool:
+        return agent not in self.shed
+    
+    def p95(self) -> float:
+        ordered = sorted(self.latencies)
+        return ordered[int(0.95 * (len(ordered) - 1))] if ordered else 0.0
+    
+    def error_rate(self) -> float:
+        return sum(self.errors) / max(1, sum(self.calls))
+    
+    def record(self, latency: float, calls: int, errors: int) -> str:
+        """Учитывает ход, возвращает описание решения или пустую строку"""
+        self.latencies.append(latency)
+        self.calls.append(calls)
+        self.errors.append(errors)
+        if len(self.latencies) < self.min_samples:
+            return ""
+        
+        p95, err = self.p95(), self.error_rate()
+        state = f"p95 {p95:.1f}с, ошибки API {err:.0%}"
+        decision = ""
+        if p95 > self.p95_slo_sec or err > self.max_error_rate:
+            agent = next((a for a in self.OPTIONAL_AGENTS if a not in self.shed), None)
+            if agent:
+                self.shed.append(agent)
+                decision = f"SLO нарушен ({state}), отключаю {agent}"
+        elif self.shed and p95 < self.p95_slo_sec * self.restore_ratio and err <= self.max_error_rate / 2:
+            agent = self.shed.pop()
+            decision = f"Есть запас ({state}), возвращаю {agent}"
+        
+        if decision:
+            # после решения меряем заново, чтобы увидеть его эффект
+            self.latencies.clear()
+            self.calls.clear()
+            self.errors.clear()
+        return decision
+
+
 class InterviewOrchestrator:
-    def __init__(self, smart_mode: bool = False):
+    # что переносится в ответвление (fork): состояние сессии и внутреннее состояние агентов
+    FORK_STATE = ("session", "context", "difficulty", "turns_analyses", "last_question",
+                  "_carried_contradiction", "_seeds", "slo")
+    FORK_AGENTS = ("observer", "fact_checker", "interviewer", "evaluator",
+                   "contradiction_detector", "depth_prober", "meta_reviewer")
+    
+    def __init__(self, smart_mode: bool = False, background_agents: Optional[Set[str]] = None,
+                 pipeline: Optional[str] = None, prompt_variant: Optional[str] = None):
+        self._pipeline_spec = pipeline  # имя или путь профиля - для fork
         self.llm = GeminiClient()
+        self.tracer = Tracer(enabled=self.llm.config.TRACING_ENABLED)
         self.smart_mode = smart_mode  # включает MetaReviewer
         
         # основные агенты
@@ -51,14 +127,35 @@ class InterviewOrchestrator:
         # дополнительные агенты
         self.contradiction_detector = ContradictionDetector(self.llm)
         self.depth_prober = DepthProber(self.llm)
-        self.meta_reviewer = MetaReviewerAgent(self.llm) if smart_mode else None
+        self.meta_reviewer = MetaReviewerAgent(self.llm)
+        
+        # конвейер хода: какие агенты, в каком порядке и при каких условиях
+        # агенты из background_agents работают уже после ответа кандидату
+        self.pipeline = load_profile(pipeline or self.llm.config.PIPELINE_PROFILE).with_background(
+            background_agents if background_agents is not None else self.llm.config.BACKGROUND_AGENTS)
+        self.background_agents = {s.agent for s in self.pipeline.steps if s.background}
+        self.executor = PipelineExecutor(self.pipeline, {
+            "Observer": self._step_observer,
+            "ContradictionDetector": self._step_contradiction,
+            "DepthProber": self._step_depth,
+            "FactChecker": self._step_fact_check,
+            "Interviewer": self._step_interviewer,
+            "MetaReviewer": self._step_meta_review,
+            "Evaluator": self._step_draft,
+        })
+        self._configure_agents(prompt_variant or self.llm.config.PROMPT_VARIANT)
         
         # состояние
         self.session: Optional[InterviewSession] = None
+        self._active = False  # учтена ли сессия в ACTIVE_SESSIONS
         self.context = ConversationContext()
         self.difficulty = DifficultyController()
         self.turns_analyses: List[Dict] = []
         self.last_question: str = ""
+        self._background: Dict[str, asyncio.Task] = {}  # последняя фоновая задача каждого агента
+        self._carried_contradiction: str = ""  # противоречие из фона для следующего хода
+        self._seeds: Set[str] = set()  # заготовки из банка, уже предложенные Interviewer
+        self.slo = self._new_slo()
 
 
     def set_model(self, model_id: str):
@@ -73,6 +170,7 @@ class InterviewOrchestrator:
             started_at=datetime.now().isoformat(),
             difficulty=initial_diff
         )
+        self._set_active(True)
         self.context = ConversationContext()
         self.difficulty = DifficultyController(initial_diff)
         self.turns_analyses = []
@@ -81,6 +179,11 @@ class InterviewOrchestrator:
         # сбрасываем состояние детекторов
         self.contradiction_detector.reset()
         self.depth_prober.reset()
+        self.evaluator.reset()
+        self._cancel_background()
+        self._carried_contradiction = ""
+        self._seeds = set()
+        self.slo = self._new_slo()
 
     
     async def is_stop_command(self, message: str) -> bool:
@@ -88,6 +191,10 @@ class InterviewOrchestrator:
 
     async def generate_greeting(self) -> Dict[str, Any]:
         """Генерирует приветствие БЕЗ создания turn (шаг 0 не логируется)"""
+        with self.tracer.span("greeting"):
+            return await self._generate_greeting()
+    
+    async def _generate_greeting(self) -> Dict[str, Any]:
         if not self.session:
             return {"error": "Сессия не инициализирована"}
         
@@ -101,7 +208,7 @@ class InterviewOrchestrator:
     Будь дружелюбным и профессиональным.
     Напиши только текст приветствия:"""
 
-        greeting = await self.llm.generate(prompt, temperature=0.7)
+        greeting = await self.llm.generate(prompt, temperature=0.7, priority=Priority.INTERACTIVE, agent="Greeting")
         
         if not greeting:
             greeting = f"Привет, {c.name}! Я БотБотискафов, твой AI-интервьюер для тренировки. Расскажи о себе и своём опыте."
@@ -122,22 +229,104 @@ class InterviewOrchestrator:
 
     
     async def process_message(self, user_message: str) -> Dict[str, Any]:
+        turn_no = len(self.session.turns) + 1 if self.session else 0
+        with self.tracer.span("turn", turn=turn_no, chars=len(user_message)) as turn_span:
+            result = await self._process_message(user_message)
+            turn_span.set(finished=bool(result.get("finished")))
+            return result
+    
+    async def _process_message(self, user_message: str) -> Dict[str, Any]:
         if not self.session:
             return {"error": "Сессия не инициализирована"}
         
-        if await self.is_stop_command(user_message):
+        stop_score = stop_intent_score(user_message)
+        if stop_score >= 1.0:
             return await self.finish_interview()
+        
+        turn_started = time.perf_counter()
+        calls_before, errors_before = self.llm.calls, self.llm.errors
+        budget = TurnBudget(self.llm, self.pipeline.max_calls, self.pipeline.max_tokens)
 
         turn_id = len(self.session.turns) + 1
-        thoughts: List[Thought] = []
-        
-        previous_agent_question = self.last_question
         
         self.context.add_message("user", user_message)
-        history = self.context.get_history()
+        with span("history"):
+            history = self.context.get_history()
+        
+        state = TurnState(turn_id, user_message, history, self.last_question,
+                          smart_mode=self.smart_mode, config=self.llm.config)
+        
+        # проверка стопа идёт параллельно с Observer, при высокой вероятности
+        # стопа заранее стартует и Evaluator - проигравшая ветка отменяется
+        observer_task = asyncio.create_task(
+            self.observer.process(self.session.candidate, history, user_message))
+        if stop_score > 0:
+            feedback_task = None
+            if stop_score >= self.llm.config.STOP_SPECULATION_THRESHOLD:
+                feedback_task = asyncio.create_task(self._build_feedback())
+            
+            if await confirm_stop_intent(self.llm, user_message):
+                observer_task.cancel()
+                self.context.messages.pop()
+                return await self.finish_interview(feedback_task)
+            if feedback_task:
+                feedback_task.cancel()
+        state.early["Observer"] = observer_task
+        
+        # противоречие, найденное в фоне на прошлом ходу
+        state.contradiction_info = self._carried_contradiction
+        self._carried_contradiction = ""
+        
+        with span("pipeline", profile=self.pipeline.name) as pipeline_span:
+            await self.executor.run(state, budget, self._agent_enabled)
+            pipeline_span.set(calls=budget.calls, tokens=budget.tokens,
+                              skipped=",".join(sorted(state.skipped)))
+        
+        if "ContradictionDetector" not in state.ran:
+            self._remember_claim(state)
+        for agent, reason in state.skipped.items():
+            if reason != "условие":
+                state.thoughts.append(Thought("Pipeline", f"{agent} пропущен: {reason}"))
+
+        self.context.add_message("assistant", state.response)
+        self.last_question = state.response
+        
+        TURN_SECONDS.observe(time.perf_counter() - turn_started, smart=str(self.smart_mode).lower())
+        if self.slo:
+            decision = self.slo.record(time.perf_counter() - turn_started,
+                                       self.llm.calls - calls_before, self.llm.errors - errors_before)
+            if decision:
+                state.thoughts.append(Thought("SLOController", decision))
+
+        turn = TurnData(
+            turn_id=turn_id,
+            user_message=user_message,
+            thoughts=state.thoughts,
+            agent_message=state.previous_question,
+            difficulty=state.difficulty,
+            flags=state.flags,
+            quality=state.quality
+        )
+
+        self.session.turns.append(turn)
         
+        # фоновые шаги дописывают мысли и флаги в уже сохранённый ход
+        for spec in state.deferred:
+            self._run_in_background(spec.agent, self.executor.run_step(spec, state))
         
-        analysis = await self.observer.process(self.session.candidate, history, user_message)
+        return {
+            "turn_id": turn_id,
+            "message": state.response,
+            "thoughts": [t.to_dict() for t in state.thoughts],
+            "difficulty": state.difficulty,
+            "flags": state.flags,
+            "quality": state.quality
+        }
+    
+    async def _step_observer(self, st: TurnState):
+        task = st.early.pop("Observer", None)
+        analysis = await (task or self.observer.process(self.session.candidate, st.history, st.user_message))
+        st.analysis = analysis
         
         observer_thought = (
             f"Качество: {analysis.get('answer_quality')}, "
@@ -145,152 +334,150 @@ class InterviewOrchestrator:
             f"Флаги: {analysis.get('flags', [])}, "
             f"Инструкция: {analysis.get('instruction', '')}"
         )
-        thoughts.append(Thought("Observer", observer_thought))
+        st.thoughts.append(Thought("Observer", observer_thought))
         
         self.turns_analyses.append(analysis)
         
-        flags = analysis.get("flags", [])
-        self.session.all_flags.extend(flags)
-        
-        contradiction_info = ""
-        if turn_id >= 3:  # проверяем с 3-го хода
-            contr = await self.contradiction_detector.process(user_message, turn_id)
-            if contr.get("found"):
-                contradiction_info = contr.get("question", "")
-                thoughts.append(Thought("ContradictionDetector", 
-                    f"Противоречие с ходом {contr.get('old_turn', '?')}: {contr.get('conflict', '')[:80]}"))
-                flags.append("contradiction_detected")
-        
-        # запоминаем для будущих проверок
-        if analysis.get("answer_quality") not in ["off_topic", "toxic", "refusal"]:
-            self.contradiction_detector.remember(turn_id, user_message)
-        
-        detected_skills = analysis.get("detected_skills", [])
-        for skill in detected_skills:
-            depth_result = await self.depth_prober.process(skill, user_message)
-            if depth_result.get("level", 0) >= 3:
-                thoughts.append(Thought("DepthProber", 
-                    f"{skill}: уровень {depth_result.get('level')}/5"))
+        st.flags = analysis.get("flags", [])
+        self.session.all_flags.extend(st.flags)
         
         # фиксируем навыки
-        for skill in detected_skills:
-            skill_lower = skill.lower().strip()
-            existing = {s.topic.lower().strip() for s in self.session.skills}
-            if skill_lower not in existing:
+        for skill in analysis.get("detected_skills", []):
+            existing = {canonical(s.topic) for s in self.session.skills}
+            if canonical(skill) not in existing:
                 self.session.skills.append(SkillRecord(
-                    topic=skill, evidence=user_message[:100], turn_id=turn_id
+                    topic=skill, evidence=st.user_message[:100], turn_id=st.turn_id
                 ))
             self.context.add_topic(skill)
-            self.session.topics_covered.add(skill.lower())
+            self.session.topics_covered.add(canonical(skill))
         
         # фиксируем пробелы
         for gap in analysis.get("detected_gaps", []):
-            gap_lower = gap.lower().strip()
-            existing = {g.topic.lower().strip() for g in self.session.gaps}
-            if gap_lower not in existing:
+            existing = {canonical(g.topic) for g in self.session.gaps}
+            if canonical(gap) not in existing:
                 self.session.gaps.append(GapRecord(
                     topic=gap, question=self.last_question[:100],
-                    candidate_answer=user_message[:100], correct_answer="", turn_id=turn_id
+                    candidate_answer=st.user_message[:100], correct_answer="", turn_id=st.turn_id
                 ))
-
-        fact_info = ""
-        if analysis.get("factual_accuracy") in ["suspicious", "hallucination"]:
-            fact_result = await self.fact_checker.process(user_message, history)
-            if not fact_result.get("is_accurate") and fact_result.get("corrections"):
-                corr = fact_result["corrections"][0]
-                fact_info = f"Неверно: '{corr.get('wrong', '')}'. Правильно: '{corr.get('correct', '')}'"
-                thoughts.append(Thought("FactChecker", f"Ошибка: {fact_info}"))
-        
-        quality = analysis.get("answer_quality", "adequate")
+    
+    async def _step_contradiction(self, st: TurnState):
+        try:
+            contr = await self.contradiction_detector.process(st.user_message, st.turn_id)
+        finally:
+            # запоминаем для будущих проверок, даже если проверка не уложилась в таймаут
+            self._remember_claim(st)
+        if not contr.get("found"):
+            return
+        question = contr.get("question", "")
+        st.thoughts.append(Thought("ContradictionDetector",
+            f"Противоречие с ходом {contr.get('old_turn', '?')}: {contr.get('conflict', '')[:80]}"))
+        st.flags.append("contradiction_detected")
+        if st.response:
+            # кандидату уже ответили - спросим на следующем ходу
+            self._carried_contradiction = question
+        elif question:
+            st.contradiction_info = question
+    
+    def _remember_claim(self, st: TurnState):
+        if st.analysis.get("answer_quality") not in ["off_topic", "toxic", "refusal"]:
+            self.contradiction_detector.remember(st.turn_id, st.user_message)
+    
+    async def _step_depth(self, st: TurnState):
+        await self._probe_depth(st.analysis.get("detected_skills", []), st.user_message, st.thoughts)
+    
+    async def _step_fact_check(self, st: TurnState):
+        fact_result = await self.fact_checker.process(st.user_message, st.history, st.previous_question)
+        if not fact_result.get("is_accurate") and fact_result.get("corrections"):
+            corr = fact_result["corrections"][0]
+            st.fact_info = f"Неверно: '{corr.get('wrong', '')}'. Правильно: '{corr.get('correct', '')}'"
+            st.thoughts.append(Thought("FactChecker", f"Ошибка: {st.fact_info}"))
+    
+    async def _step_interviewer(self, st: TurnState):
+        st.quality = st.analysis.get("answer_quality", "adequate")
         old_diff = self.difficulty.level
-        new_diff = self.difficulty.update(quality)
+        new_diff = self.difficulty.update(st.quality)
         
         if old_diff != new_diff:
             direction = "повышена" if new_diff > old_diff else "понижена"
-            thoughts.append(Thought("DifficultyCtrl", f"Сложность {direction}: {old_diff} → {new_diff}"))
+            st.thoughts.append(Thought("DifficultyCtrl", f"Сложность {direction}: {old_diff} → {new_diff}"))
         
         self.session.difficulty = new_diff
+        st.difficulty = new_diff
         
-        response = await self.interviewer.process(
-            candidate=self.session.candidate,
+        st.response = await self._ask_interviewer(st, st.history)
+        st.thoughts.append(Thought("Interviewer", f"Сложность: {new_diff}/5"))
+    
+    async def _ask_interviewer(self, st: TurnState, history: str) -> str:
+        cfg = self.llm.config
+        candidate = self.session.candidate
+        topics_done = self.context.get_topics_list()
+        seed = ""
+        if cfg.QUESTION_SEED:
+            # одну заготовку дважды не предлагаем
+            entry = QUESTION_BANK.pick(candidate.position, candidate.grade, st.difficulty, topics_done,
+                                       asked=self._seeds)
+            if entry:
+                seed = entry[1]
+                self._seeds.add(seed)
+        ask = self.interviewer.process(
+            candidate=candidate,
             history=history,
-            analysis=analysis,
-            difficulty=new_diff,
-            topics_done=self.context.get_topics_list(),
-            fact_info=fact_info,
-            contradiction_info=contradiction_info
+            analysis=st.analysis,
+            difficulty=st.difficulty,
+            topics_done=topics_done,
+            fact_info=st.fact_info,
+            contradiction_info=st.contradiction_info,
+            seed=seed
         )
-        
-        thoughts.append(Thought("Interviewer", f"Сложность: {new_diff}/5"))
-        
-        if self.smart_mode and self.meta_reviewer:
-            meta_result = await self.meta_reviewer.process(
-                interviewer_response=response,
-                analysis=analysis,
-                last_question=self.last_question,
-                topics_done=self.context.get_topics_list()
-            )
-            
-            if not meta_result.get("is_ok"):
-                thoughts.append(Thought("MetaReviewer", f"Проблемы: {meta_result.get('issues', [])}"))
-                fix = meta_result.get("fix_instruction", "")
-                if fix:
-                    response = await self.interviewer.process(
-                        candidate=self.session.candidate,
-                        history=history + f"\n\n[ВАЖНО: {fix}]",
-                        analysis=analysis,
-                        difficulty=new_diff,
-                        topics_done=self.context.get_topics_list(),
-                        fact_info=fact_info,
-                        contradiction_info=contradiction_info
-                    )
-                    thoughts.append(Thought("Interviewer", "Исправлено после ревью"))
-            else:
-                thoughts.append(Thought("MetaReviewer", "Проверено ✓"))
-
-        self.context.add_message("assistant", response)
-        self.last_question = response
-
-        turn = TurnData(
-            turn_id=turn_id,
-            user_message=user_message,
-            thoughts=thoughts,
-            agent_message=previous_agent_question,
-            difficulty=new_diff,
-            flags=flags,
-            quality=quality
+        if not cfg.INTERVIEWER_DEADLINE_SEC:
+            return await ask
+        try:
+            return await asyncio.wait_for(ask, timeout=cfg.INTERVIEWER_DEADLINE_SEC)
+        except asyncio.TimeoutError:
+            # кандидат не должен ждать: берём готовый вопрос из банка
+            FALLBACKS.inc(agent="Interviewer", kind="deadline_bank")
+            st.thoughts.append(Thought("Interviewer", f"Не уложился в {cfg.INTERVIEWER_DEADLINE_SEC:g}с, вопрос из банка"))
+            if seed:
+                return f"Хорошо, {candidate.name}. Давай продолжим. {seed}"
+            return self.interviewer.bank_question(candidate, st.difficulty, topics_done)
+    
+    async def _step_meta_review(self, st: TurnState):
+        meta_result = await self.meta_reviewer.process(
+            interviewer_response=st.response,
+            analysis=st.analysis,
+            last_question=self.last_question,
+            topics_done=self.context.get_topics_list()
         )
-
-        self.session.turns.append(turn)
         
-        return {
-            "turn_id": turn_id,
-            "message": response,
-            "thoughts": [t.to_dict() for t in thoughts],
-            "difficulty": new_diff,
-            "flags": flags,
-            "quality": quality
-        }
+        if meta_result.get("is_ok"):
+            st.thoughts.append(Thought("MetaReviewer", "Проверено ✓"))
+            return
+        st.thoughts.append(Thought("MetaReviewer", f"Проблемы: {meta_result.get('issues', [])}"))
+        fix = meta_result.get("fix_instruction", "")
+        if fix:
+            st.response = await self._ask_interviewer(st, st.history + f"\n\n[ВАЖНО: {fix}]")
+            st.thoughts.append(Thought("Interviewer", "Исправлено после ревью"))
+    
+    async def _step_draft(self, st: TurnState):
+        await self.evaluator.update_draft(
+            self.session.candidate, st.previous_question, st.user_message, st.analysis, st.turn_id)
 
-    async def finish_interview(self) -> Dict[str, Any]:
+    async def finish_interview(self, feedback_task: Optional[asyncio.Task] = None) -> Dict[str, Any]:
+        with self.tracer.span("finish"):
+            return await self._finish_interview(feedback_task)
+    
+    async def _finish_interview(self, feedback_task: Optional[asyncio.Task] = None) -> Dict[str, Any]:
         if not self.session:
             return {"error": "Сессия не инициализирована"}
         
         self.session.finished = True
-        history = self.context.get_history()
+        self._set_active(False)
         
-        # передаём данные о глубине знаний
-        self.evaluator._depth_scores = self.depth_prober.get_summary()
-
-        feedback = await self.evaluator.process(
-            candidate=self.session.candidate,
-            history=history,
-            skills=self.session.skills,
-            gaps=self.session.gaps,
-            flags=self.session.all_flags,
-            turns_count=len(self.session.turns)
-        )
-
+        # отчёт мог быть запущен спекулятивно ещё до подтверждения стопа
+        started = time.perf_counter()
+        feedback = await (feedback_task or self._build_feedback())
+        FINISH_SECONDS.observe(time.perf_counter() - started)
+        self._cancel_background()
         
         self.session.feedback = feedback
         
@@ -305,6 +492,160 @@ class InterviewOrchestrator:
             }
         }
     
+    def _set_active(self, active: bool):
+        if active != self._active:
+            ACTIVE_SESSIONS.inc(1 if active else -1)
+            self._active = active
+    
+    def _new_slo(self) -> Optional[LatencySLOController]:
+        cfg = self.llm.config
+        if not cfg.SLO_ENABLED:
+            return None
+        return LatencySLOController(cfg.SLO_TURN_P95_SEC, cfg.SLO_MAX_ERROR_RATE, cfg.SLO_WINDOW)
+    
+    def _configure_agents(self, prompt_variant: str):
+        if prompt_variant not in prompts.VARIANTS:
+            raise ValueError(f"Неизвестный вариант промптов '{prompt_variant}', есть: {prompts.VARIANTS}")
+        self.prompt_variant = prompt_variant
+        agents = {a.name: a for a in (self.observer, self.fact_checker, self.interviewer, self.evaluator,
+                                      self.contradiction_detector, self.depth_prober, self.meta_reviewer)}
+        for agent in agents.values():
+            agent.prompt_variant = prompt_variant
+            agent.pinned_facts = self._pinned_facts
+        for spec in self.pipeline.steps:
+            agent = agents[spec.agent]
+            agent.model = spec.model
+            if spec.priority:
+                agent.priority = Priority[spec.priority]
+            elif spec.background and agent.priority == Priority.ANALYSIS:
+                # вынесенные в фон агенты не должны отнимать слоты у интерактивных вызовов
+                agent.priority = Priority.BACKGROUND
+    
+    def _pinned_facts(self) -> str:
+        """Навыки, пробелы и утверждения кандидата - остаются в промпте, даже когда старые реплики вырезаны"""
+        if not self.session:
+            return ""
+        parts = []
+        if self.session.skills:
+            parts.append("навыки: " + ", ".join(s.topic for s in self.session.skills))
+        if self.session.gaps:
+            parts.append("пробелы: " + ", ".join(g.topic for g in self.session.gaps))
+        claims = self.contradiction_detector.claims[-5:]
+        if claims:
+            parts.append("утверждения: " + "; ".join(f"[ход {c['turn']}] {c['text'][:80]}" for c in claims))
+        return ". ".join(parts)
+    
+    def _agent_enabled(self, name: str) -> bool:
+        return self.slo is None or self.slo.is_enabled(name)
+    
+    async def _build_feedback(self):
+        # не меняет состояние сессии, поэтому можно запускать спекулятивно и отменять
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.llm.config.FINISH_BUDGET_SEC
+        
+        # дожидаемся фоновых агентов и последнего черновика, но не дольше бюджета
+        await self._await_background(self.llm.config.FINISH_BUDGET_SEC)
+        
+        # передаём данные о глубине знаний
+        self.evaluator._depth_scores = self.depth_prober.get_summary()
+        
+        if self.llm.config.INCREMENTAL_EVAL and self.evaluator.draft:
+            return await self._finalize_from_draft(deadline - loop.time())
+        
+        history = self.context.get_history()
+
+        return await self.evaluator.process(
+            candidate=self.session.candidate,
+            history=history,
+            skills=self.session.skills,
+            gaps=self.session.gaps,
+            flags=self.session.all_flags,
+            turns_count=len(self.session.turns)
+        )
+    
+    async def _finalize_from_draft(self, remaining: float):
+        args = dict(
+            candidate=self.session.candidate,
+            skills=self.session.skills,
+            gaps=self.session.gaps,
+            flags=self.session.all_flags,
+            turns_count=len(self.session.turns)
+        )
+        if remaining > 1.0:
+            try:
+                return await asyncio.wait_for(self.evaluator.finalize(**args), timeout=remaining)
+            except asyncio.TimeoutError:
+                print("Финализация отчёта не уложилась в бюджет, собираю из черновика")
+        # бюджет исчерпан - отчёт без LLM (внутри fallback если черновика нет)
+        return await self.evaluator.finalize(**args, use_llm=False)
+    
+    async def _probe_depth(self, skills: List[str], user_message: str, thoughts: List[Thought]):
+        # "Django" и "django ORM" в одном ответе - одна тема, спрашиваем один раз
+        unique: Dict[str, str] = {}
+        for skill in skills:
+            unique.setdefault(canonical(skill), skill)
+        skills = list(unique.values())
+        # темы независимы, оцениваем параллельно
+        results = await asyncio.gather(*[self.depth_prober.process(skill, user_message) for skill in skills])
+        for skill, depth_result in zip(skills, results):
+            if depth_result.get("level", 0) >= 3:
+                thoughts.append(Thought("DepthProber", 
+                    f"{skill}: уровень {depth_result.get('level')}/5"))
+    
+    def _run_in_background(self, name: str, coro):
+        # задачи одного агента идут цепочкой: каждая видит результат предыдущей
+        prev = self._background.get(name)
+        
+        async def run():
+            if prev:
+                try:
+                    await asyncio.gather(prev, return_exceptions=True)
+                except asyncio.CancelledError:
+                    coro.close()
+                    raise
+            try:
+                await coro
+            except Exception as e:
+                print(f"Ошибка фонового агента {name}: {e}")
+        
+        self._background[name] = asyncio.create_task(run())
+    
+    async def _await_background(self, timeout: float):
+        pending = [t for t in self._background.values() if not t.done()]
+        if pending:
+            await asyncio.wait(pending, timeout=timeout)
+    
+    def _cancel_background(self):
+        for task in self._background.values():
+            if not task.done():
+                task.cancel()
+        self._background = {}
+    
+    async def snapshot(self) -> Dict[str, Any]:
+        """Состояние после N ходов, от которого можно запускать ответвления: сессия, контекст,
+        сложность, детекторы и черновик отчёта. Фоновые агенты сначала дорабатывают"""
+        await self._await_background(self.llm.config.FINISH_BUDGET_SEC)
+        state = {name: copy.deepcopy(getattr(self, name)) for name in self.FORK_STATE}
+        # клиент LLM и колбэки не копируем - у ответвления они свои
+        state["agents"] = {name: copy.deepcopy({k: v for k, v in vars(getattr(self, name)).items()
+                                                if k not in ("llm", "pinned_facts")})
+                           for name in self.FORK_AGENTS}
+        state["options"] = {"smart_mode": self.smart_mode, "background_agents": set(self.background_agents),
+                            "pipeline": self._pipeline_spec, "prompt_variant": self.prompt_variant}
+        return state
+    
+    @classmethod
+    def fork(cls, snapshot: Dict[str, Any]) -> "InterviewOrchestrator":
+        """Новая сессия, продолжающая снимок; снимок не меняется, ответвлений может быть сколько угодно"""
+        orch = cls(**snapshot["options"])
+        for name in cls.FORK_STATE:
+            setattr(orch, name, copy.deepcopy(snapshot[name]))
+        for name, state in snapshot["agents"].items():
+            vars(getattr(orch, name)).update(copy.deepcopy(state))
+        if orch.session and not orch.session.finished:
+            orch._set_active(True)
+        return orch
+    
     def save_log(self, filepath: str):
     # ensure_ascii=False чтоб кириллица нормально сохранялась
         if self.session:
@@ -317,4 +658,6 @@ class InterviewOrchestrator:
         return "{}"
     
     async def close(self):
+        self._set_active(False)
+        self._cancel_background()
         await self.llm.close()
@@ -0,0 +1,292 @@
+import json
+import asyncio
+from dataclasses import dataclass, field, replace
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from scheduler import Priority
+from tracing import span
+from metrics import FALLBACKS
+
+# без них ход не собрать: они не пропускаются ни по условию, ни по бюджету, ни по SLO
+CORE_AGENTS = ("Observer", "Interviewer")
+CONDITIONS = ("min_turn", "smart_mode", "config", "analysis", "nonempty")
+
+
+@dataclass
+class StepSpec:
+    """Шаг конвейера хода: какой агент, после кого, при каких условиях и с какими ограничениями.
+
+    when - условия запуска, все должны выполниться:
+      min_turn: N                   - начиная с N-го хода
+      smart_mode: true/false        - только в умном (или только в обычном) режиме
+      config: "ИМЯ"                 - только если флаг в Config включён
+      analysis: {"поле": [значения]} - значение поля из анализа Observer входит в список
+      nonempty: "поле"              - поле анализа Observer не пустое
+    """
+    agent: str
+    after: Tuple[str, ...] = ()
+    when: Dict[str, Any] = field(default_factory=dict)
+    model: str = ""  # пусто - модель сессии
+    timeout: float = 0.0  # сек, 0 - без таймаута
+    priority: str = ""  # имя Priority, пусто - приоритет агента по умолчанию
+    background: bool = False  # после ответа кандидату, результат попадёт в следующий ход
+    cost: int = 1  # ожидаемое число вызовов LLM, для бюджета хода
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "StepSpec":
+        data = dict(data)
+        data["after"] = tuple(data.get("after", ()))
+        return cls(**data)
+
+
+@dataclass
+class PipelineProfile:
+    name: str
+    steps: List[StepSpec]
+    max_calls: int = 0  # вызовов LLM на ход, 0 - без лимита
+    max_tokens: int = 0  # токенов (prompt + output) на ход, 0 - без лимита
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "PipelineProfile":
+        profile = cls(
+            name=data.get("name", "custom"),
+            steps=[StepSpec.from_dict(s) for s in data.get("steps", [])],
+            max_calls=data.get("max_calls", 0),
+            max_tokens=data.get("max_tokens", 0),
+        )
+        profile.validate()
+        return profile
+
+    def with_background(self, agents: Iterable[str]) -> "PipelineProfile":
+        """Копия профиля, где перечисленные агенты вынесены в фон"""
+        agents = set(agents)
+        if not agents:
+            return self
+        steps = [replace(s, background=True) if s.agent in agents else s for s in self.steps]
+        profile = replace(self, steps=steps)
+        profile.validate()
+        return profile
+
+    def step(self, agent: str) -> Optional[StepSpec]:
+        return next((s for s in self.steps if s.agent == agent), None)
+
+    def validate(self):
+        names = [s.agent for s in self.steps]
+        if len(names) != len(set(names)):
+            raise ValueError(f"Профиль {self.name}: агент указан дважды")
+        for core in CORE_AGENTS:
+            if core not in names:
+                raise ValueError(f"Профиль {self.name}: нет обязательного шага {core}")
+        for s in self.steps:
+            unknown = [d for d in s.after if d not in names]
+            if unknown:
+                raise ValueError(f"Профиль {self.name}: {s.agent} зависит от неизвестных {unknown}")
+            unknown = [k for k in s.when if k not in CONDITIONS]
+            if unknown:
+                raise ValueError(f"Профиль {self.name}: неизвестные условия {unknown} у {s.agent}")
+            if s.priority and s.priority not in Priority.__members__:
+                raise ValueError(f"Профиль {self.name}: неизвестный приоритет {s.priority}")
+            if s.agent in CORE_AGENTS and (s.background or s.timeout or s.when):
+                raise ValueError(f"Профиль {self.name}: {s.agent} нельзя вынести в фон, "
+                                 "ограничить таймаутом или условием")
+        # циклы: снимаем шаги без зависимостей, пока получается
+        left = {s.agent: set(s.after) for s in self.steps}
+        while left:
+            ready = [n for n, deps in left.items() if not deps & left.keys()]
+            if not ready:
+                raise ValueError(f"Профиль {self.name}: циклические зависимости {sorted(left)}")
+            for n in ready:
+                del left[n]
+
+
+def _steps(*steps: StepSpec) -> List[StepSpec]:
+    return list(steps)
+
+
+# то же, что было зашито в process_message
+DEFAULT_PROFILE = PipelineProfile("default", _steps(
+    StepSpec("Observer"),
+    StepSpec("ContradictionDetector", after=("Observer",), when={"min_turn": 3}),
+    StepSpec("DepthProber", after=("Observer",), when={"nonempty": "detected_skills"}, cost=2),
+    StepSpec("FactChecker", after=("Observer",),
+             when={"analysis": {"factual_accuracy": ["suspicious", "hallucination"]}}),
+    StepSpec("Interviewer", after=("ContradictionDetector", "DepthProber", "FactChecker")),
+    StepSpec("MetaReviewer", after=("Interviewer",), when={"smart_mode": True}, cost=2),
+    StepSpec("Evaluator", after=("Observer",), when={"config": "INCREMENTAL_EVAL"}, background=True),
+))
+
+# минимальная задержка: на критическом пути только Observer, проверка фактов и Interviewer
+LEAN_PROFILE = PipelineProfile("lean", _steps(
+    StepSpec("Observer"),
+    StepSpec("FactChecker", after=("Observer",), timeout=8.0,
+             when={"analysis": {"factual_accuracy": ["hallucination"]}}),
+    StepSpec("Interviewer", after=("FactChecker",)),
+    StepSpec("ContradictionDetector", after=("Observer",), when={"min_turn": 3}, background=True),
+    StepSpec("DepthProber", after=("Observer",), when={"nonempty": "detected_skills"}, background=True, cost=2),
+    StepSpec("Evaluator", after=("Observer",), when={"config": "INCREMENTAL_EVAL"}, background=True),
+), max_calls=5)
+
+# максимум качества: все проверки с раннего хода и ревью каждого вопроса
+RICH_PROFILE = PipelineProfile("rich", _steps(
+    StepSpec("Observer"),
+    StepSpec("ContradictionDetector", after=("Observer",), when={"min_turn": 2}),
+    StepSpec("DepthProber", after=("Observer",), when={"nonempty": "detected_skills"}, cost=2),
+    StepSpec("FactChecker", after=("Observer",),
+             when={"analysis": {"factual_accuracy": ["accurate", "suspicious", "hallucination"]}}),
+    StepSpec("Interviewer", after=("ContradictionDetector", "DepthProber", "FactChecker")),
+    StepSpec("MetaReviewer", after=("Interviewer",), cost=2),
+    StepSpec("Evaluator", after=("Observer",), when={"config": "INCREMENTAL_EVAL"}, background=True),
+))
+
+PROFILES = {p.name: p for p in (DEFAULT_PROFILE, LEAN_PROFILE, RICH_PROFILE)}
+
+
+def load_profile(name_or_path: str) -> PipelineProfile:
+    """Встроенный профиль по имени или JSON-файл с описанием шагов"""
+    if name_or_path in PROFILES:
+        return PROFILES[name_or_path]
+    path = Path(name_or_path)
+    if not path.exists():
+        raise ValueError(f"Профиль '{name_or_path}' не найден, встроенные: {list(PROFILES)}")
+    with open(path, "r", encoding="utf-8") as f:
+        return PipelineProfile.from_dict(json.load(f))
+
+
+@dataclass
+class TurnState:
+    """Всё, что шаги хода читают и пишут"""
+    turn_id: int
+    user_message: str
+    history: str
+    previous_question: str
+    smart_mode: bool = False
+    config: Any = None
+    analysis: Dict = field(default_factory=dict)
+    thoughts: List = field(default_factory=list)
+    flags: List[str] = field(default_factory=list)
+    fact_info: str = ""
+    contradiction_info: str = ""
+    response: str = ""
+    difficulty: int = 0
+    quality: str = "adequate"
+    early: Dict[str, asyncio.Task] = field(default_factory=dict)  # шаги, запущенные до конвейера
+    ran: Set[str] = field(default_factory=set)
+    skipped: Dict[str, str] = field(default_factory=dict)  # агент -> причина
+    deferred: List[StepSpec] = field(default_factory=list)
+
+
+class TurnBudget:
+    """Бюджет вызовов и токенов на один ход"""
+
+    def __init__(self, llm, max_calls: int = 0, max_tokens: int = 0):
+        self.llm = llm
+        self.max_calls = max_calls
+        self.max_tokens = max_tokens
+        self.calls_start = llm.calls
+        self.tokens_start = llm.tokens
+        self.reserved = 0  # вызовы фоновых шагов, которые ещё не начались
+
+    @property
+    def calls(self) -> int:
+        return self.llm.calls - self.calls_start + self.reserved
+
+    @property
+    def tokens(self) -> int:
+        return self.llm.tokens - self.tokens_start
+
+    def allows(self, cost: int) -> bool:
+        if self.max_calls and self.calls + cost > self.max_calls:
+            return False
+        return not (self.max_tokens and self.tokens >= self.max_tokens)
+
+
+Handler = Callable[[TurnState], Awaitable[None]]
+
+
+class PipelineExecutor:
+    """Исполняет профиль: шаги без взаимных зависимостей идут параллельно,
+    фоновые откладываются до сохранения хода"""
+
+    def __init__(self, profile: PipelineProfile, handlers: Dict[str, Handler]):
+        missing = [s.agent for s in profile.steps if s.agent not in handlers]
+        if missing:
+            raise ValueError(f"Профиль {profile.name}: нет обработчиков для {missing}")
+        self.profile = profile
+        self.handlers = handlers
+
+    async def run(self, state: TurnState, budget: TurnBudget,
+                  enabled: Callable[[str], bool] = lambda agent: True):
+        pending = {s.agent: s for s in self.profile.steps}
+        background = {s.agent for s in self.profile.steps if s.background}
+        running: Dict[asyncio.Task, str] = {}
+        # обязательные шаги всё равно пойдут, их вызовы сразу вычитаем из бюджета
+        core = {n: s.cost for n, s in pending.items() if n in CORE_AGENTS and n not in state.early}
+        budget.reserved += sum(core.values())
+        try:
+            while pending or running:
+                for name, spec in list(pending.items()):
+                    # фоновые шаги ещё не начались, ждать их нельзя
+                    waits = [d for d in spec.after if d not in background]
+                    if any(d in pending or d in running.values() for d in waits):
+                        continue
+                    del pending[name]
+                    reason = self._skip_reason(spec, state, budget, enabled)
+                    if reason:
+                        state.skipped[name] = reason
+                    elif spec.background:
+                        budget.reserved += spec.cost
+                        state.deferred.append(spec)
+                        state.ran.add(name)
+                    else:
+                        budget.reserved -= core.get(name, 0)
+                        running[asyncio.create_task(self.run_step(spec, state))] = name
+                        state.ran.add(name)
+                if not running:
+                    continue
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    running.pop(task)
+                    task.result()
+        finally:
+            for task in running:
+                task.cancel()
+
+    async def run_step(self, spec: StepSpec, state: TurnState):
+        with span(f"step.{spec.agent}", background=spec.background):
+            if not spec.timeout:
+                await self.handlers[spec.agent](state)
+                return
+            try:
+                await asyncio.wait_for(self.handlers[spec.agent](state), timeout=spec.timeout)
+            except asyncio.TimeoutError:
+                state.skipped[spec.agent] = f"таймаут {spec.timeout:g}с"
+                FALLBACKS.inc(agent=spec.agent, kind="timeout")
+
+    @staticmethod
+    def _skip_reason(spec: StepSpec, state: TurnState, budget: TurnBudget,
+                     enabled: Callable[[str], bool]) -> str:
+        if spec.agent in CORE_AGENTS:
+            return ""
+        if not _conditions_met(spec.when, state):
+            return "условие"
+        if not enabled(spec.agent):
+            return "SLO"
+        if not budget.allows(spec.cost):
+            return "бюджет хода"
+        return ""
+
+
+def _conditions_met(when: Dict[str, Any], state: TurnState) -> bool:
+    for key, expected in when.items():
+        if key == "min_turn" and state.turn_id < expected:
+            return False
+        if key == "smart_mode" and state.smart_mode != expected:
+            return False
+        if key == "config" and not getattr(state.config, expected, False):
+            return False
+        if key == "analysis" and any(state.analysis.get(f) not in values for f, values in expected.items()):
+            return False
+        if key == "nonempty" and not state.analysis.get(expected):
+            return False
+    return True
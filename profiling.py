@@ -0,0 +1,155 @@
+import io
+import os
+import re
+import sys
+import time
+import pstats
+import cProfile
+import threading
+import tracemalloc
+from collections import Counter
+from typing import Awaitable, List, Optional, TypeVar
+
+T = TypeVar("T")
+
+# кадры, в которых поток цикла событий просто ждёт сеть / таймеры
+_IDLE_FRAMES = {("selectors.py", "select")}
+
+_cprofile_busy = threading.Lock()  # cProfile в потоке может быть только один
+
+
+async def profiled(profiler: Optional["Profiler"], label: str, coro: Awaitable[T]) -> T:
+    """Выполняет корутину под профилировщиком, если он включён"""
+    if profiler is None:
+        return await coro
+    return await profiler.run(label, coro)
+
+
+class StackSampler:
+    """Раз в interval снимает стек потока и копит их в формате collapsed stacks"""
+
+    def __init__(self, thread_id: int, interval: float = 0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.idle = 0
+        self.busy = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            names = []
+            top = (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name)
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if top in _IDLE_FRAMES:
+                # ожидание сети не смешиваем с работой питона
+                self.idle += 1
+                self.stacks["[network/idle wait]"] += 1
+            else:
+                self.busy += 1
+                self.stacks[";".join(reversed(names))] += 1
+
+
+class Profiler:
+    """Профилирует каждый вызов (ход или финал) отдельно и собирает сводку по сценарию.
+
+    На каждый вызов пишется <label>.prof (cProfile), <label>.collapsed (стеки для
+    flamegraph.pl / speedscope) и, если включено, <label>.mem.txt с приростом памяти.
+    finish() склеивает всё в merged.prof, merged.collapsed и summary.txt.
+    """
+
+    def __init__(self, out_dir: str, memory: bool = False, sample_interval: float = 0.005):
+        self.out_dir = out_dir
+        self.memory = memory
+        self.sample_interval = sample_interval
+        self.prof_files: List[str] = []
+        self.stacks: Counter = Counter()
+        self.idle = 0
+        self.busy = 0
+        self.wall = 0.0
+        self.calls = 0
+        self._snapshot = None
+        os.makedirs(out_dir, exist_ok=True)
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start(25)
+
+    async def run(self, label: str, coro: Awaitable[T]) -> T:
+        self.calls += 1
+        label = f"{self.calls:03d}_" + re.sub(r"[^\w.-]+", "_", label)
+        sampler = StackSampler(threading.get_ident(), self.sample_interval)
+        profile = cProfile.Profile() if _cprofile_busy.acquire(blocking=False) else None
+        if self.memory and self._snapshot is None:
+            self._snapshot = tracemalloc.take_snapshot()
+
+        started = time.perf_counter()
+        sampler.start()
+        if profile:
+            profile.enable()
+        try:
+            return await coro
+        finally:
+            if profile:
+                profile.disable()
+                _cprofile_busy.release()
+            sampler.stop()
+            self.wall += time.perf_counter() - started
+            self._save(label, profile, sampler)
+
+    def _save(self, label: str, profile: Optional[cProfile.Profile], sampler: StackSampler):
+        base = os.path.join(self.out_dir, label)
+        if profile:
+            profile.dump_stats(f"{base}.prof")
+            self.prof_files.append(f"{base}.prof")
+        self._write_collapsed(f"{base}.collapsed", sampler.stacks)
+        self.stacks.update(sampler.stacks)
+        self.idle += sampler.idle
+        self.busy += sampler.busy
+
+        if self.memory:
+            snapshot = tracemalloc.take_snapshot()
+            top = snapshot.compare_to(self._snapshot, "lineno")[:30]
+            with open(f"{base}.mem.txt", "w", encoding="utf-8") as f:
+                f.write(f"Текущая память: {tracemalloc.get_traced_memory()[0] / 1024:.0f} КБ\n\n")
+                f.writelines(f"{stat}\n" for stat in top)
+            self._snapshot = snapshot
+
+    @staticmethod
+    def _write_collapsed(path: str, stacks: Counter):
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+    def finish(self) -> str:
+        """Сводка по всем вызовам, вернёт путь к summary.txt"""
+        self._write_collapsed(os.path.join(self.out_dir, "merged.collapsed"), self.stacks)
+        summary_path = os.path.join(self.out_dir, "summary.txt")
+        total = self.idle + self.busy
+        with open(summary_path, "w", encoding="utf-8") as f:
+            f.write(f"Время под профилировщиком: {self.wall:.1f}с\n")
+            if total:
+                f.write(f"Сэмплов: {total}, работа python: {100 * self.busy / total:.0f}%, "
+                        f"ожидание сети/таймеров: {100 * self.idle / total:.0f}%\n\n")
+            if self.prof_files:
+                stats = pstats.Stats(*self.prof_files)
+                stats.dump_stats(os.path.join(self.out_dir, "merged.prof"))
+                buf = io.StringIO()
+                pstats.Stats(os.path.join(self.out_dir, "merged.prof"), stream=buf) \
+                    .strip_dirs().sort_stats("tottime").print_stats(30)
+                f.write(buf.getvalue())
+        return summary_path
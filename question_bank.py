@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""Банк вопросов: мгновенный запасной вопрос и подсказка интервьюеру без генерации"""
+import sys
+import timeit
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# какие уровни сложности уместны для грейда
+GRADE_LEVELS = {"Junior": (1, 3), "Middle": (2, 4), "Senior": (3, 5), "Lead": (4, 5)}
+
+# направление -> слова в названии позиции
+TRACKS = {
+    "frontend": ("front", "фронт", "react", "vue", "javascript", "html", "верст"),
+    "devops": ("devops", "sre", "девопс", "инфраструкт", "platform"),
+    "data": ("data", "данн", "analyst", "аналитик", "ml", "machine"),
+    "backend": (),  # по умолчанию
+}
+
+# (направление, тема, сложность, вопрос)
+QUESTIONS = [
+    ("backend", "python", 1, "Какие встроенные типы данных в Python ты знаешь?"),
+    ("backend", "python", 1, "Зачем в Python нужны функции и как объявить функцию с аргументом по умолчанию?"),
+    ("backend", "python", 2, "Чем список отличается от кортежа в Python?"),
+    ("backend", "python", 2, "Как в Python обработать исключение и зачем нужен блок finally?"),
+    ("backend", "python", 3, "Что такое декоратор и как написать свой?"),
+    ("backend", "python", 3, "Чем генератор отличается от списка и когда его стоит использовать?"),
+    ("backend", "python", 4, "Как работает GIL и как он влияет на многопоточный код?"),
+    ("backend", "python", 4, "Как устроено управление памятью в CPython: подсчёт ссылок и сборщик мусора?"),
+    ("backend", "python", 5, "Как бы ты нашёл и устранил утечку памяти в долгоживущем Python-сервисе?"),
+    ("backend", "ооп", 2, "Что такое наследование и инкапсуляция? Приведи пример из своего кода."),
+    ("backend", "ооп", 3, "Чем отличаются @staticmethod и @classmethod?"),
+    ("backend", "ооп", 4, "Что такое MRO и как Python разрешает множественное наследование?"),
+    ("backend", "sql", 1, "Что делает запрос SELECT и как отфильтровать строки?"),
+    ("backend", "sql", 2, "Чем INNER JOIN отличается от LEFT JOIN?"),
+    ("backend", "sql", 3, "Зачем нужны индексы и когда они могут замедлить работу?"),
+    ("backend", "sql", 3, "Что такое транзакция и какие свойства ACID ты знаешь?"),
+    ("backend", "sql", 4, "Какие уровни изоляции транзакций бывают и какие аномалии они допускают?"),
+    ("backend", "sql", 5, "Как бы ты разбирал медленный запрос в PostgreSQL на большой таблице?"),
+    ("backend", "django", 2, "Что такое модель в Django и как она связана с таблицей в базе?"),
+    ("backend", "django", 3, "Что такое ORM и в чём проблема N+1 запросов?"),
+    ("backend", "django", 3, "Как работают select_related и prefetch_related?"),
+    ("backend", "django", 4, "Как устроены middleware в Django и когда ты писал свой?"),
+    ("backend", "asyncio", 3, "Чем асинхронный код отличается от многопоточного?"),
+    ("backend", "asyncio", 4, "Что произойдёт, если внутри корутины вызвать блокирующую функцию?"),
+    ("backend", "asyncio", 5, "Как бы ты ограничил число одновременных запросов к внешнему API в asyncio?"),
+    ("backend", "git", 1, "Что такое коммит и ветка в Git?"),
+    ("backend", "git", 2, "Чем merge отличается от rebase?"),
+    ("backend", "git", 3, "Как ты решаешь конфликты при слиянии веток?"),
+    ("backend", "rest", 2, "Какие HTTP-методы ты знаешь и чем GET отличается от POST?"),
+    ("backend", "rest", 3, "Что такое идемпотентность и какие HTTP-методы идемпотентны?"),
+    ("backend", "rest", 4, "Как бы ты сделал версионирование и пагинацию в REST API?"),
+    ("backend", "архитектура", 4, "Как бы ты спроектировал сервис сокращения ссылок?"),
+    ("backend", "архитектура", 5, "Как бы ты спроектировал систему уведомлений на миллион пользователей?"),
+    ("backend", "архитектура", 5, "Когда стоит разбивать монолит на микросервисы, а когда нет?"),
+    ("backend", "очереди", 4, "Зачем нужны очереди сообщений и как обеспечить обработку ровно один раз?"),
+    ("frontend", "javascript", 1, "Чем let отличается от const и var?"),
+    ("frontend", "javascript", 2, "Что такое замыкание в JavaScript?"),
+    ("frontend", "javascript", 3, "Как работает event loop в браузере?"),
+    ("frontend", "javascript", 4, "Чем микрозадачи отличаются от макрозадач?"),
+    ("frontend", "react", 2, "Что такое компонент и props в React?"),
+    ("frontend", "react", 3, "Зачем нужен useEffect и как избежать лишних перерисовок?"),
+    ("frontend", "react", 4, "Как работает reconciliation и зачем нужны key в списках?"),
+    ("frontend", "css", 1, "Чем блочный элемент отличается от строчного?"),
+    ("frontend", "css", 2, "Как выровнять элемент по центру с помощью flexbox?"),
+    ("frontend", "архитектура", 5, "Как бы ты организовал состояние большого фронтенд-приложения?"),
+    ("devops", "linux", 1, "Как посмотреть список процессов и свободное место на диске в Linux?"),
+    ("devops", "linux", 2, "Что такое права доступа rwx и как их поменять?"),
+    ("devops", "docker", 2, "Чем образ отличается от контейнера в Docker?"),
+    ("devops", "docker", 3, "Как уменьшить размер Docker-образа?"),
+    ("devops", "kubernetes", 3, "Что такое pod и deployment в Kubernetes?"),
+    ("devops", "kubernetes", 4, "Как в Kubernetes устроены readiness и liveness пробы?"),
+    ("devops", "ci/cd", 2, "Что такое CI/CD и из каких шагов обычно состоит пайплайн?"),
+    ("devops", "ci/cd", 4, "Как бы ты сделал выкладку без простоя?"),
+    ("devops", "архитектура", 5, "Как бы ты построил мониторинг и алертинг для сотни сервисов?"),
+    ("data", "sql", 1, "Как посчитать количество строк по группам в SQL?"),
+    ("data", "sql", 3, "Что такое оконные функции и когда они нужны?"),
+    ("data", "python", 2, "Чем DataFrame в pandas отличается от обычного списка словарей?"),
+    ("data", "python", 3, "Как обработать пропуски в данных в pandas?"),
+    ("data", "статистика", 2, "Чем медиана отличается от среднего и когда она полезнее?"),
+    ("data", "статистика", 3, "Что такое p-value и как интерпретировать A/B-тест?"),
+    ("data", "ml", 4, "Что такое переобучение и как с ним бороться?"),
+    ("data", "ml", 5, "Как бы ты выбирал метрику качества для несбалансированных классов?"),
+]
+
+Entry = Tuple[str, str]  # (тема, вопрос)
+
+
+class QuestionBank:
+    """Вопросы, разложенные по (направление, грейд, сложность) в кортежи, плюс индекс по темам"""
+
+    def __init__(self, questions: Iterable[Tuple[str, str, int, str]] = QUESTIONS):
+        by_level: Dict[Tuple[str, int], List[Entry]] = {}
+        for track, topic, level, text in questions:
+            by_level.setdefault((track, level), []).append((sys.intern(topic), text))
+
+        self._index: Dict[Tuple[str, str, int], Tuple[Entry, ...]] = {}
+        self._topics: Dict[Tuple[str, str], Tuple[Tuple[int, str], ...]] = {}
+        for track in TRACKS:
+            for grade, (lo, hi) in GRADE_LEVELS.items():
+                for level in range(1, 6):
+                    # сложность вне диапазона грейда прижимаем к ближайшей допустимой
+                    self._index[(track, grade, level)] = tuple(by_level.get((track, min(max(level, lo), hi)), ()))
+            topics: Dict[str, List[Tuple[int, str]]] = {}
+            for (t, level), entries in by_level.items():
+                if t == track:
+                    for topic, text in entries:
+                        topics.setdefault(topic, []).append((level, text))
+            for topic, items in topics.items():
+                self._topics[(track, topic)] = tuple(sorted(items))
+
+    @staticmethod
+    def track(position: str) -> str:
+        pos = position.lower()
+        for track, words in TRACKS.items():
+            if any(w in pos for w in words):
+                return track
+        return "backend"
+
+    def pick(self, position: str, grade: str, difficulty: int, topics_done: Iterable[str] = (),
+             asked: Iterable[str] = (), topic: str = "") -> Optional[Entry]:
+        """Подходящий вопрос: сначала по новой теме, потом любой ещё не заданный"""
+        track = self.track(position)
+        asked = set(asked)
+        if topic:
+            items = self._topics.get((track, topic.lower()), ())
+            for level, text in sorted(items, key=lambda x: abs(x[0] - difficulty)):
+                if text not in asked:
+                    return topic.lower(), text
+        entries = self._index.get((track, grade if grade in GRADE_LEVELS else "Junior",
+                                   min(max(difficulty, 1), 5)), ())
+        done = [t.lower() for t in topics_done]
+        fallback = None
+        for entry in entries:
+            if entry[1] in asked:
+                continue
+            if not any(entry[0] in d or d in entry[0] for d in done):
+                return entry
+            fallback = fallback or entry
+        return fallback
+
+
+QUESTION_BANK = QuestionBank()
+
+
+def benchmark(n: int = 100_000):
+    """Замер времени поиска в микросекундах"""
+    build = timeit.timeit(QuestionBank, number=100) / 100
+    cases = {
+        "pick": lambda: QUESTION_BANK.pick("Backend Developer", "Middle", 3),
+        "pick с исключениями": lambda: QUESTION_BANK.pick(
+            "Python Backend", "Middle", 3, topics_done=["python", "sql", "django"], asked=["Что такое ORM?"]),
+        "pick по теме": lambda: QUESTION_BANK.pick("Backend", "Senior", 4, topic="sql"),
+    }
+    print(f"Построение индекса: {build * 1e6:.0f} мкс")
+    for name, fn in cases.items():
+        per_call = timeit.timeit(fn, number=n) / n
+        print(f"{name}: {per_call * 1e6:.2f} мкс")
+
+
+if __name__ == "__main__":
+    benchmark()
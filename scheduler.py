@@ -0,0 +1,144 @@
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from enum import IntEnum
+from typing import Deque, Dict, List, Optional
+
+from config import CFG
+from metrics import LLM_QUEUE_WAIT
+
+
+class Priority(IntEnum):
+    """Классы приоритета вызовов LLM: меньше - важнее"""
+    INTERACTIVE = 0  # то, чего прямо сейчас ждёт кандидат (Interviewer, отчёт)
+    ANALYSIS = 1     # анализ на критическом пути (Observer, FactChecker, MetaReviewer)
+    BACKGROUND = 2   # фоновые оценки (DepthProber, черновик отчёта)
+    SIMULATION = 3   # симуляция кандидата в тестах
+
+
+# вес слота по классу: фоновый вызов обходится сессии дороже в очереди, чем ответ кандидату,
+# поэтому сессия, занятая фоновыми оценками, пропускает вперёд интерактивные вызовы других
+CLASS_WEIGHTS = {Priority.INTERACTIVE: 2.0, Priority.ANALYSIS: 1.0, Priority.BACKGROUND: 0.5,
+                 Priority.SIMULATION: 1.0}
+
+
+@dataclass
+class _Waiter:
+    priority: int
+    session: str
+    enqueued: float
+    future: asyncio.Future
+
+
+class LLMScheduler:
+    """Общая очередь вызовов LLM для всех сессий процесса.
+
+    Слотов max_concurrent, свободный слот получает самый приоритетный ожидающий.
+    Внутри одного приоритета сессии обслуживаются по очереди (weighted fair queuing):
+    каждый выданный слот сдвигает виртуальное время сессии на 1/вес класса вызова.
+    Тот, кто ждёт дольше starvation_sec, проходит вне очереди.
+    """
+
+    def __init__(self, max_concurrent: int = 4, starvation_sec: float = 10.0,
+                 weights: Optional[Dict[Priority, float]] = None):
+        self.max_concurrent = max_concurrent
+        self.starvation_sec = starvation_sec
+        self.weights = weights or CLASS_WEIGHTS  # класс приоритета -> вес слота
+        self.active = 0
+        self._queue: List[_Waiter] = []
+        self._vtime: Dict[str, float] = {}  # виртуальное время каждой сессии
+        self._vclock = 0.0
+        self._waits: Dict[str, Deque[float]] = {p.name: deque(maxlen=1000) for p in Priority}
+        self._counts: Dict[str, int] = {p.name: 0 for p in Priority}
+        self.promoted = 0  # сколько раз сработала защита от голодания
+
+    @asynccontextmanager
+    async def slot(self, priority: Priority = Priority.ANALYSIS, session: str = ""):
+        await self.acquire(priority, session)
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def acquire(self, priority: Priority = Priority.ANALYSIS, session: str = ""):
+        loop = asyncio.get_running_loop()
+        if self.active < self.max_concurrent and not self._queue:
+            self.active += 1
+            self._account(session, priority)
+            self._record(priority, 0.0)
+            return
+
+        waiter = _Waiter(int(priority), session, loop.time(), loop.create_future())
+        self._queue.append(waiter)
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter in self._queue:
+                self._queue.remove(waiter)
+            elif waiter.future.done() and not waiter.future.cancelled():
+                # слот уже выдали, а нас отменили - возвращаем
+                self.release()
+            raise
+        self._record(priority, loop.time() - waiter.enqueued)
+
+    def release(self):
+        self.active -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        while self._queue and self.active < self.max_concurrent:
+            waiter = self._pick()
+            self._queue.remove(waiter)
+            if waiter.future.done():
+                continue
+            self.active += 1
+            self._account(waiter.session, waiter.priority)
+            waiter.future.set_result(None)
+
+    def _pick(self) -> _Waiter:
+        now = asyncio.get_running_loop().time()
+        starving = [w for w in self._queue if now - w.enqueued >= self.starvation_sec]
+        if starving:
+            waiter = min(starving, key=lambda w: w.enqueued)
+            if waiter.priority != min(w.priority for w in self._queue):
+                self.promoted += 1
+            return waiter
+
+        top = min(w.priority for w in self._queue)
+        candidates = [w for w in self._queue if w.priority == top]
+        return min(candidates, key=lambda w: (self._vtime.get(w.session, self._vclock), w.enqueued))
+
+    def _account(self, session: str, priority: int):
+        # start-time fair queuing: сессия "платит" 1/вес класса за каждый выданный слот
+        start = max(self._vtime.get(session, 0.0), self._vclock)
+        self._vclock = start
+        self._vtime[session] = start + 1.0 / self.weights.get(Priority(priority), 1.0)
+
+    def _record(self, priority: Priority, wait: float):
+        name = Priority(priority).name
+        self._waits[name].append(wait)
+        self._counts[name] += 1
+        LLM_QUEUE_WAIT.observe(wait, priority=name)
+
+    def stats(self) -> Dict:
+        """Время ожидания в очереди по классам приоритета (мс)"""
+        result = {}
+        for name, waits in self._waits.items():
+            if not self._counts[name]:
+                continue
+            ordered = sorted(waits)
+            result[name] = {
+                "count": self._counts[name],
+                "avg_ms": round(1000 * sum(ordered) / len(ordered), 1),
+                "p95_ms": round(1000 * ordered[int(0.95 * (len(ordered) - 1))], 1),
+                "max_ms": round(1000 * ordered[-1], 1),
+            }
+        result["queued"] = len(self._queue)
+        result["active"] = self.active
+        result["promoted"] = self.promoted
+        return result
+
+
+# один планировщик на процесс - общий для всех сессий и клиентов
+SCHEDULER = LLMScheduler(CFG.LLM_MAX_CONCURRENCY, CFG.LLM_STARVATION_SEC)
@@ -4,24 +4,56 @@
 Проверяет все агенты включая ContradictionDetector и DepthProber
 """
 
+import re
+import csv
+import sqlite3
 import json
 import asyncio
+import argparse
+import glob
+import inspect
 import os
 import sys
+import time
+from contextvars import ContextVar
 from datetime import datetime
-from dataclasses import dataclass, field
-from typing import List, Dict, Tuple
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import List, Dict, Optional, Set, Tuple
 from enum import Enum
 
-from config import adapt_log_to_tz_format
+from config import CFG, adapt_log_to_tz_format
 from models import Candidate
 from llm_client import GeminiClient
 from orchestrator import InterviewOrchestrator
+from scheduler import Priority, SCHEDULER
+from metrics import CHAOS_FAULTS, FALLBACKS, LLM_RETRIES, start_exporters
+from profiling import Profiler, profiled
+from tokens import ESTIMATOR
+import history
+from pipeline import load_profile
+from fingerprints import agent_fingerprints, core_fingerprint, digest
+from verdicts import VERDICT_CACHE
+from backends import get_backend
+from dryrun import PREFIX_KEY, SuiteEstimator, agent_totals, fmt_sec, print_estimate, stats_path
 
 
 # настройки тестов
 TEST_MODEL = "gemini-2.0-flash"
 USE_SMART_MODE = True
+CHANGED_INDEX = "test_logs/fingerprints.json"  # отпечатки и результаты прошлых прогонов для --changed
+
+
+# вывод сценария: при --jobs копится в буфер и печатается целиком, чтобы сценарии не перемешивались
+_OUTPUT: ContextVar[Optional[List[str]]] = ContextVar("test_output", default=None)
+
+
+def say(text: str = ""):
+    buf = _OUTPUT.get()
+    if buf is None:
+        print(text)
+    else:
+        buf.append(text)
 
 
 class TestResult(Enum):
@@ -37,6 +69,16 @@ class ScenarioConfig:
     behavior: str
     expected_checks: List[str]
     max_turns: int = 8
+    prefix: str = ""  # общее начало из PREFIXES: считается один раз, сценарий продолжает его копию
+
+
+@dataclass
+class PrefixConfig:
+    """Общее начало нескольких сценариев: приветствие и turns ходов с поведением behavior"""
+    name: str
+    candidate: Dict[str, str]
+    behavior: str
+    turns: int = 1
 
 
 @dataclass 
@@ -48,6 +90,53 @@ class TestReport:
     turns_count: int
     log_file: str
     errors: List[str] = field(default_factory=list)
+    pipeline: str = "default"
+    prompts: str = "compact"
+    llm_calls: int = 0
+    llm_tokens: int = 0
+    llm_errors: int = 0  # 429, 5xx, таймауты - в том числе подмешанные --chaos
+    # по ходам, для бенчмарка: время process_message, вызовы и токены LLM за ход
+    turn_sec: List[float] = field(default_factory=list)
+    turn_calls: List[int] = field(default_factory=list)
+    turn_tokens: List[int] = field(default_factory=list)
+    first_message_sec: float = 0.0  # до приветствия; без стриминга это и есть первый токен
+    prefix: str = ""  # продолжение общего начала: его вызовы LLM в отчёт не входят
+    agents: List[str] = field(default_factory=list)  # какие агенты реально вызывались
+    cached: bool = False  # взят из прошлого прогона (--changed), проверки пересчитаны по логу
+    
+    def to_dict(self) -> Dict:
+        return {
+            "name": self.scenario_name,
+            "pipeline": self.pipeline,
+            "prompts": self.prompts,
+            "result": self.result.name,
+            "llm_calls": self.llm_calls,
+            "llm_tokens": self.llm_tokens,
+            "llm_errors": self.llm_errors,
+            "duration": self.duration_sec,
+            "turns": self.turns_count,
+            "log_file": self.log_file,
+            "turn_sec": self.turn_sec,
+            "turn_calls": self.turn_calls,
+            "turn_tokens": self.turn_tokens,
+            "first_message_sec": self.first_message_sec,
+            "prefix": self.prefix,
+            "agents": self.agents,
+            "cached": self.cached,
+            "checks": {k: {"result": v[0].name, "msg": v[1]} for k, v in self.checks.items()},
+            "errors": self.errors
+        }
+    
+    @classmethod
+    def from_dict(cls, d: Dict) -> "TestReport":
+        checks = {k: (TestResult[v["result"]], v["msg"]) for k, v in d.get("checks", {}).items()}
+        return cls(d["name"], TestResult[d["result"]], checks, d.get("duration", 0), d.get("turns", 0),
+                   d.get("log_file", "N/A"), d.get("errors", []), pipeline=d.get("pipeline", "default"),
+                   prompts=d.get("prompts", "compact"), llm_calls=d.get("llm_calls", 0),
+                   llm_tokens=d.get("llm_tokens", 0), llm_errors=d.get("llm_errors", 0), turn_sec=d.get("turn_sec", []),
+                   turn_calls=d.get("turn_calls", []), turn_tokens=d.get("turn_tokens", []),
+                   first_message_sec=d.get("first_message_sec", 0.0), prefix=d.get("prefix", ""),
+                   agents=d.get("agents", []), cached=d.get("cached", False))
 
 
 class CandidateSimulator:
@@ -93,7 +182,7 @@ class CandidateSimulator:
 
 Только реплика:"""
 
-        resp = await self.llm.generate(prompt, temperature=0.7)
+        resp = await self.llm.generate(prompt, temperature=0.7, priority=Priority.SIMULATION)
         if resp:
             return resp.strip().strip('"\'')
         return "Повтори вопрос?"
@@ -373,265 +462,424 @@ SCENARIOS = [
 ]
 
 
+# общие начала для ответвлений: приветствие и самопрезентация одни и те же, дальше - разное поведение
+PREFIXES = {p.name: p for p in [
+    PrefixConfig(
+        name="middle_intro",
+        candidate={
+            "name": "Кирилл Развилкин",
+            "position": "Backend Developer",
+            "grade": "Middle",
+            "experience": "3 года Python, Django, PostgreSQL"
+        },
+        behavior="""Спокойно представься:
+- 3 года на Python, Django и PostgreSQL, пишешь REST API и фоновые задачи на Celery
+- 2-3 предложения, без вопросов к интервьюеру
+""",
+        turns=1
+    ),
+]}
+
+# что было бы, если: один и тот же кандидат после одинакового начала ведёт себя по-разному
+WHAT_IF = [
+    ScenarioConfig(
+        name="fork_solid",
+        candidate=PREFIXES["middle_intro"].candidate,
+        prefix="middle_intro",
+        behavior="""Дальше отвечай уверенно и правильно, с примерами из проектов:
+- Ход 5: "давай фидбэк"
+""",
+        expected_checks=["skills_confirmed", "depth_tracked", "full_feedback"],
+        max_turns=6
+    ),
+    ScenarioConfig(
+        name="fork_hallucinator",
+        candidate=PREFIXES["middle_intro"].candidate,
+        prefix="middle_intro",
+        behavior="""Дальше уверенно ври:
+- Ход 2: "В Django 6.0 ORM убрали, теперь запросы пишут только на SQL"
+- Ход 3: "PostgreSQL 20 сам масштабируется без индексов"
+- Ход 5: "стоп"
+""",
+        expected_checks=["hallucination_detected", "hallucination_corrected", "fact_checker_worked"],
+        max_turns=6
+    ),
+    ScenarioConfig(
+        name="fork_off_topic",
+        candidate=PREFIXES["middle_intro"].candidate,
+        prefix="middle_intro",
+        behavior="""Дальше уводи от темы:
+- Ход 2: "А вы сами где отдыхали летом?"
+- Ход 3: нормальный ответ
+- Ход 4: "хватит, давай результаты"
+""",
+        expected_checks=["off_topic_detected", "returned_to_topic"],
+        max_turns=5
+    ),
+    ScenarioConfig(
+        name="fork_early_stop",
+        candidate=PREFIXES["middle_intro"].candidate,
+        prefix="middle_intro",
+        behavior="""Сразу после самопрезентации:
+- Ход 2: "стоп, давай фидбэк"
+""",
+        expected_checks=["full_feedback", "robustness"],
+        max_turns=3
+    ),
+]
+
+
+# компилируем маркеры всех проверок: одна регулярка на каждое поле хода, ход разбирается один раз
+MARKERS: Dict[str, Tuple[str, Tuple[str, ...]]] = {
+    # группа: (поле, маркеры); thoughts - как есть, *_l - в нижнем регистре
+    "hallucination": ("thoughts_l", ("hallucination", "галлюцин")),
+    "off_topic": ("thoughts_l", ("off_topic", "не по теме")),
+    "off_topic_flag": ("thoughts_l", ("off_topic",)),
+    "toxic": ("thoughts_l", ("toxic", "грубость")),
+    "toxic_flag": ("thoughts_l", ("toxic",)),
+    "candidate_question": ("thoughts_l", ("candidate_question",)),
+    "raised": ("thoughts_l", ("повышена",)),
+    "lowered": ("thoughts_l", ("понижена",)),
+    "contradiction_l": ("thoughts_l", ("противореч",)),
+    "contradiction_flag": ("thoughts_l", ("contradiction",)),
+    "level_word": ("thoughts_l", ("уровень",)),
+    "contradiction_agent": ("thoughts", ("ContradictionDetector",)),
+    "depth_agent": ("thoughts", ("DepthProber",)),
+    "fact_agent": ("thoughts", ("FactChecker",)),
+    "observer_agent": ("thoughts", ("Observer",)),
+    "interviewer_agent": ("thoughts", ("Interviewer",)),
+    "flags_label": ("thoughts", ("Флаги:",)),
+    "out_of_5": ("thoughts", ("/5",)),
+    "depth_high": ("thoughts", ("уровень 4/5", "уровень 5/5")),
+    "depth_high_short": ("thoughts", (": 4/5", ": 5/5")),
+    "corrected": ("msg_l", ("на самом деле", "это не так", "не соответствует",
+                            "не существует", "неверн", "должен отметить", "python 4")),
+    "returned": ("msg_l", ("вернёмся", "вернемся", "продолжим", "интервью", "технический")),
+    "rude": ("msg_l", ("сам дурак", "идиот", "тупой")),
+    "polite": ("msg_l", ("понимаю", "давайте", "предлагаю", "продолжим")),
+    "answered": ("msg_l", ("обычно", "как правило", "тренажёр", "тренажер", "используют", "стек")),
+    "probing": ("msg_l", ("подробнее", "пояснить", "что имеешь в виду", "расскажи больше")),
+    "contradiction_reply": ("msg_l", ("ранее ты говорил", "раньше упоминал", "противореч", "уточни", "пояснить")),
+}
+AGENT_NAMES = ("Observer", "Interviewer", "FactChecker", "ContradictionDetector", "DepthProber",
+               "DifficultyCtrl", "MetaReviewer")
+LEVELS = ("1/5", "2/5", "3/5", "4/5", "5/5")
+
+# от каких агентов зависит проверка: поменялся промпт агента - сценарий с этой проверкой перезапускаем,
+# даже если в прошлый раз агент не вызывался
+CHECK_AGENTS: Dict[str, Tuple[str, ...]] = {
+    "hallucination_detected": ("Observer", "FactChecker", "Evaluator"),
+    "hallucination_corrected": ("FactChecker", "Interviewer"),
+    "off_topic_detected": ("Observer",),
+    "returned_to_topic": ("Interviewer",),
+    "toxic_detected": ("Observer",),
+    "professional_response": ("Interviewer",),
+    "no_hire_recommendation": ("Evaluator",),
+    "candidate_questions_answered": ("Observer", "Interviewer"),
+    "difficulty_increased": ("Observer",),  # DifficultyCtrl без LLM, решает по анализу Observer
+    "difficulty_decreased": ("Observer",),
+    "honesty_high": ("Evaluator",),
+    "low_honesty_score": ("Evaluator",),
+    "engagement_high": ("Evaluator",),
+    "gaps_identified": ("Evaluator",),
+    "roadmap_generated": ("Evaluator",),
+    "skills_confirmed": ("Evaluator",),
+    "few_gaps": ("Evaluator",),
+    "context_maintained": ("Interviewer", "Evaluator"),
+    "robustness": ("Interviewer", "Evaluator"),
+    "stable_performance": ("Interviewer", "Evaluator"),
+    "clarity_low": ("Evaluator",),
+    "probing_questions": ("Interviewer",),
+    "contradiction_detected": ("ContradictionDetector",),
+    "contradiction_handled": ("ContradictionDetector", "Interviewer"),
+    "depth_tracked": ("DepthProber",),
+    "depth_high_levels": ("DepthProber",),
+    "depth_low_levels": ("DepthProber",),
+    "depth_progression": ("DepthProber",),
+    "fact_checker_worked": ("FactChecker",),
+    "observer_flagged": ("Observer",),
+    "interviewer_adapted": ("Interviewer", "MetaReviewer"),
+    "agents_all_present": ("Observer", "Interviewer"),
+    "full_feedback": ("Evaluator",),
+    "positive_feedback": ("Evaluator",),
+}
+# алиасы зависят от того же, что и оригинал
+CHECK_AGENTS.update({
+    "all_agents_logged": CHECK_AGENTS["agents_all_present"],
+    "adaptivity_up": CHECK_AGENTS["difficulty_increased"],
+    "candidate_question_handled": CHECK_AGENTS["candidate_questions_answered"],
+    "not_ignored": CHECK_AGENTS["candidate_questions_answered"],
+    "no_repeated_topics": CHECK_AGENTS["context_maintained"],
+    "difficulty_adjusted": CHECK_AGENTS["difficulty_increased"],
+    "hallucination_caught": CHECK_AGENTS["hallucination_detected"],
+    "question_answered": CHECK_AGENTS["candidate_questions_answered"],
+    "full_feedback_generated": CHECK_AGENTS["full_feedback"],
+})
+
+
+class _Matcher:
+    """Все маркеры поля одной регуляркой; находит и маркеры, вложенные в более длинные"""
+
+    def __init__(self, markers: Dict[str, Tuple[str, ...]]):
+        self.groups: Dict[str, Set[str]] = {}  # маркер -> группы
+        for group, items in markers.items():
+            for m in items:
+                self.groups.setdefault(m, set()).add(group)
+        ordered = sorted(self.groups, key=len, reverse=True)
+        # просмотр вперёд на каждой позиции: на одной позиции берётся самый длинный маркер
+        self.regex = re.compile("(?=(" + "|".join(re.escape(m) for m in ordered) + "))")
+        # маркеры внутри найденного тоже считаются найденными ("toxic" внутри "toxic_behavior")
+        self.implied = {m: {o for o in ordered if o in m} for m in ordered}
+
+    def groups_in(self, text: str) -> Set[str]:
+        found: Set[str] = set()
+        for m in {match.group(1) for match in self.regex.finditer(text)}:
+            for inner in self.implied[m]:
+                found |= self.groups[inner]
+        return found
+
+
+class TurnView:
+    __slots__ = ("thoughts", "hits", "levels")
+
+    def __init__(self, thoughts: str, hits: Set[str], levels: List[int]):
+        self.thoughts = thoughts
+        self.hits = hits
+        self.levels = levels
+
+
+class LogView:
+    """Лог сессии, разобранный один раз: текст нормализован, маркеры всех проверок найдены"""
+
+    def __init__(self, d: Dict, matchers: Dict[str, _Matcher]):
+        self.d = d
+        fb = d.get("final_feedback", {})
+        self.has_feedback = isinstance(fb, dict)  # в формате ТЗ отчёт может быть строкой
+        self.feedback = fb if self.has_feedback else {}
+        self.turns: List[TurnView] = []
+        for t in d.get("turns", []):
+            thoughts = t.get("internal_thoughts", "")
+            fields = {"thoughts": thoughts, "thoughts_l": thoughts.lower(),
+                      "msg_l": t.get("agent_visible_message", "").lower()}
+            hits = set()
+            for field_name, matcher in matchers.items():
+                hits |= matcher.groups_in(fields[field_name])
+            levels = [int(lvl[0]) for lvl in LEVELS if lvl in thoughts] if "out_of_5" in hits else []
+            self.turns.append(TurnView(thoughts, hits, levels))
+        self.agents = {a for t in self.turns for a in AGENT_NAMES if a in t.thoughts}
+
+    def any_turn(self, group: str) -> bool:
+        return any(group in t.hits for t in self.turns)
+
+    def score(self, section: str, name: str, default: int) -> int:
+        return self.feedback.get(section, {}).get(name, {}).get("score", default)
+
+
 class TestChecker:
-    """Проверяет результаты"""
+    """Проверяет результаты: лог разбирается один раз (LogView), проверки читают готовые совпадения"""
+    
+    def __init__(self):
+        by_field: Dict[str, Dict[str, Tuple[str, ...]]] = {}
+        for group, (field_name, items) in MARKERS.items():
+            by_field.setdefault(field_name, {})[group] = items
+        self.matchers = {f: _Matcher(m) for f, m in by_field.items()}
+    
+    def compile(self, d: Dict) -> LogView:
+        return LogView(d, self.matchers)
     
     # === БАЗОВЫЕ ПРОВЕРКИ ===
     
-    def check_hallucination_detected(self, d: Dict) -> Tuple[TestResult, str]:
-        for t in d.get("turns", []):
-            thoughts = t.get("internal_thoughts", "").lower()
-            if "hallucination" in thoughts or "галлюцин" in thoughts:
-                return TestResult.PASS, "Галлюцинация обнаружена"
+    def check_hallucination_detected(self, v: LogView) -> Tuple[TestResult, str]:
+        if v.any_turn("hallucination"):
+            return TestResult.PASS, "Галлюцинация обнаружена"
         
         # проверяем red_flags
-        fb = d.get("final_feedback", {})
-        if isinstance(fb, dict):
-            for flag in fb.get("red_flags", []):
-                if "ложь" in flag.lower() or "неправд" in flag.lower():
-                    return TestResult.PASS, "Галлюцинация в red_flags"
+        for flag in v.feedback.get("red_flags", []):
+            if "ложь" in flag.lower() or "неправд" in flag.lower():
+                return TestResult.PASS, "Галлюцинация в red_flags"
         
         return TestResult.FAIL, "Галлюцинация не обнаружена"
     
-    def check_hallucination_corrected(self, d: Dict) -> Tuple[TestResult, str]:
-        markers = ["на самом деле", "это не так", "не соответствует", 
-                   "не существует", "неверн", "должен отметить", "python 4"]
-        for t in d.get("turns", []):
-            msg = t.get("agent_visible_message", "").lower()
-            if any(m in msg for m in markers):
-                return TestResult.PASS, "Агент исправил"
+    def check_hallucination_corrected(self, v: LogView) -> Tuple[TestResult, str]:
+        if v.any_turn("corrected"):
+            return TestResult.PASS, "Агент исправил"
         return TestResult.FAIL, "Не исправлено"
     
-    def check_off_topic_detected(self, d: Dict) -> Tuple[TestResult, str]:
-        for t in d.get("turns", []):
-            thoughts = t.get("internal_thoughts", "").lower()
-            if "off_topic" in thoughts or "не по теме" in thoughts:
-                return TestResult.PASS, "Off-topic обнаружен"
+    def check_off_topic_detected(self, v: LogView) -> Tuple[TestResult, str]:
+        if v.any_turn("off_topic"):
+            return TestResult.PASS, "Off-topic обнаружен"
         return TestResult.FAIL, "Off-topic не обнаружен"
     
-    def check_returned_to_topic(self, d: Dict) -> Tuple[TestResult, str]:
+    def check_returned_to_topic(self, v: LogView) -> Tuple[TestResult, str]:
         found = False
-        for t in d.get("turns", []):
-            if "off_topic" in t.get("internal_thoughts", "").lower():
-                found = True
-            if found:
-                msg = t.get("agent_visible_message", "").lower()
-                markers = ["вернёмся", "вернемся", "продолжим", "интервью", "технический"]
-                if any(m in msg for m in markers):
-                    return TestResult.PASS, "Вернул к теме"
+        for t in v.turns:
+            found = found or "off_topic_flag" in t.hits
+            if found and "returned" in t.hits:
+                return TestResult.PASS, "Вернул к теме"
         return TestResult.WARN if not found else TestResult.FAIL, "Не вернул"
     
-    def check_toxic_detected(self, d: Dict) -> Tuple[TestResult, str]:
-        for t in d.get("turns", []):
-            thoughts = t.get("internal_thoughts", "").lower()
-            if "toxic" in thoughts or "грубость" in thoughts:
-                return TestResult.PASS, "Токсичность обнаружена"
+    def check_toxic_detected(self, v: LogView) -> Tuple[TestResult, str]:
+        if v.any_turn("toxic"):
+            return TestResult.PASS, "Токсичность обнаружена"
         return TestResult.FAIL, "Токсичность не обнаружена"
     
-    def check_professional_response(self, d: Dict) -> Tuple[TestResult, str]:
-        bad = ["сам дурак", "идиот", "тупой"]
-        good = ["понимаю", "давайте", "предлагаю", "продолжим"]
-        
-        for t in d.get("turns", []):
-            if "toxic" in t.get("internal_thoughts", "").lower():
-                msg = t.get("agent_visible_message", "").lower()
-                if any(b in msg for b in bad):
+    def check_professional_response(self, v: LogView) -> Tuple[TestResult, str]:
+        for t in v.turns:
+            if "toxic_flag" in t.hits:
+                if "rude" in t.hits:
                     return TestResult.FAIL, "Агент нагрубил"
-                if any(g in msg for g in good):
+                if "polite" in t.hits:
                     return TestResult.PASS, "Профессионализм сохранён"
         return TestResult.WARN, "Не проверено"
     
-    def check_no_hire_recommendation(self, d: Dict) -> Tuple[TestResult, str]:
-        fb = d.get("final_feedback", {})
-        if isinstance(fb, dict):
-            rec = fb.get("decision", {}).get("hiring_recommendation", "").lower()
-            if "no hire" in rec or "no_hire" in rec:
-                return TestResult.PASS, f"Рекомендация: {rec}"
+    def check_no_hire_recommendation(self, v: LogView) -> Tuple[TestResult, str]:
+        rec = v.feedback.get("decision", {}).get("hiring_recommendation", "").lower()
+        if "no hire" in rec or "no_hire" in rec:
+            return TestResult.PASS, f"Рекомендация: {rec}"
         return TestResult.FAIL, "Ожидался No Hire"
     
-    def check_candidate_questions_answered(self, d: Dict) -> Tuple[TestResult, str]:
-        markers = ["обычно", "как правило", "тренажёр", "тренажер", "используют", "стек"]
-        for t in d.get("turns", []):
-            if "candidate_question" in t.get("internal_thoughts", "").lower():
-                msg = t.get("agent_visible_message", "").lower()
-                if any(m in msg for m in markers):
-                    return TestResult.PASS, "Ответил на вопрос"
+    def check_candidate_questions_answered(self, v: LogView) -> Tuple[TestResult, str]:
+        if any("candidate_question" in t.hits and "answered" in t.hits for t in v.turns):
+            return TestResult.PASS, "Ответил на вопрос"
         return TestResult.WARN, "Вопросы не найдены"
     
-    def check_difficulty_increased(self, d: Dict) -> Tuple[TestResult, str]:
-        for t in d.get("turns", []):
-            thoughts = t.get("internal_thoughts", "").lower()
-            if "повышена" in thoughts:
-                return TestResult.PASS, "Сложность повышалась"
+    def check_difficulty_increased(self, v: LogView) -> Tuple[TestResult, str]:
+        if v.any_turn("raised"):
+            return TestResult.PASS, "Сложность повышалась"
         return TestResult.WARN, "Повышение не зафиксировано"
     
-    def check_difficulty_decreased(self, d: Dict) -> Tuple[TestResult, str]:
-        for t in d.get("turns", []):
-            if "понижена" in t.get("internal_thoughts", "").lower():
-                return TestResult.PASS, "Сложность понижалась"
+    def check_difficulty_decreased(self, v: LogView) -> Tuple[TestResult, str]:
+        if v.any_turn("lowered"):
+            return TestResult.PASS, "Сложность понижалась"
         return TestResult.WARN, "Понижение не зафиксировано"
     
-    def check_honesty_high(self, d: Dict) -> Tuple[TestResult, str]:
-        fb = d.get("final_feedback", {})
-        if isinstance(fb, dict):
-            score = fb.get("soft_skills_review", {}).get("honesty", {}).get("score", 0)
+    def check_honesty_high(self, v: LogView) -> Tuple[TestResult, str]:
+        if v.has_feedback:
+            score = v.score("soft_skills_review", "honesty", 0)
             if score >= 7:
                 return TestResult.PASS, f"Честность: {score}/10"
             if score >= 5:
                 return TestResult.WARN, f"Средняя: {score}/10"
         return TestResult.FAIL, "Низкая честность"
     
-    def check_low_honesty_score(self, d: Dict) -> Tuple[TestResult, str]:
-        fb = d.get("final_feedback", {})
-        if isinstance(fb, dict):
-            score = fb.get("soft_skills_review", {}).get("honesty", {}).get("score", 10)
+    def check_low_honesty_score(self, v: LogView) -> Tuple[TestResult, str]:
+        if v.has_feedback:
+            score = v.score("soft_skills_review", "honesty", 10)
             if score <= 5:
                 return TestResult.PASS, f"Честность низкая: {score}/10"
         return TestResult.FAIL, "Честность должна быть низкой"
     
-    def check_engagement_high(self, d: Dict) -> Tuple[TestResult, str]:
-        fb = d.get("final_feedback", {})
-        if isinstance(fb, dict):
-            score = fb.get("soft_skills_review", {}).get("engagement", {}).get("score", 0)
-            if score >= 7:
-                return TestResult.PASS, f"Вовлечённость: {score}/10"
+    def check_engagement_high(self, v: LogView) -> Tuple[TestResult, str]:
+        score = v.score("soft_skills_review", "engagement", 0)
+        if score >= 7:
+            return TestResult.PASS, f"Вовлечённость: {score}/10"
         return TestResult.WARN, "Вовлечённость не высокая"
     
-    def check_gaps_identified(self, d: Dict) -> Tuple[TestResult, str]:
-        fb = d.get("final_feedback", {})
-        if isinstance(fb, dict):
-            gaps = fb.get("technical_review", {}).get("knowledge_gaps", [])
-            if len(gaps) > 0:
-                return TestResult.PASS, f"Пробелов: {len(gaps)}"
+    def check_gaps_identified(self, v: LogView) -> Tuple[TestResult, str]:
+        gaps = v.feedback.get("technical_review", {}).get("knowledge_gaps", [])
+        if len(gaps) > 0:
+            return TestResult.PASS, f"Пробелов: {len(gaps)}"
         return TestResult.WARN, "Пробелы не выявлены"
     
-    def check_roadmap_generated(self, d: Dict) -> Tuple[TestResult, str]:
-        fb = d.get("final_feedback", {})
-        if isinstance(fb, dict):
-            topics = fb.get("roadmap", {}).get("priority_topics", [])
-            if len(topics) > 0:
-                has_res = any(t.get("resources") for t in topics)
-                if has_res:
-                    return TestResult.PASS, f"Roadmap: {len(topics)} тем с ресурсами"
-                return TestResult.WARN, f"Roadmap без ресурсов"
+    def check_roadmap_generated(self, v: LogView) -> Tuple[TestResult, str]:
+        topics = v.feedback.get("roadmap", {}).get("priority_topics", [])
+        if len(topics) > 0:
+            has_res = any(t.get("resources") for t in topics)
+            if has_res:
+                return TestResult.PASS, f"Roadmap: {len(topics)} тем с ресурсами"
+            return TestResult.WARN, f"Roadmap без ресурсов"
         return TestResult.FAIL, "Roadmap пустой"
     
-    def check_skills_confirmed(self, d: Dict) -> Tuple[TestResult, str]:
-        fb = d.get("final_feedback", {})
-        if isinstance(fb, dict):
-            skills = fb.get("technical_review", {}).get("confirmed_skills", [])
-            if len(skills) >= 3:
-                return TestResult.PASS, f"Навыков: {len(skills)}"
-            if len(skills) > 0:
-                return TestResult.WARN, f"Мало навыков: {len(skills)}"
+    def check_skills_confirmed(self, v: LogView) -> Tuple[TestResult, str]:
+        skills = v.feedback.get("technical_review", {}).get("confirmed_skills", [])
+        if len(skills) >= 3:
+            return TestResult.PASS, f"Навыков: {len(skills)}"
+        if len(skills) > 0:
+            return TestResult.WARN, f"Мало навыков: {len(skills)}"
         return TestResult.FAIL, "Навыки не подтверждены"
     
-    def check_few_gaps(self, d: Dict) -> Tuple[TestResult, str]:
-        fb = d.get("final_feedback", {})
-        if isinstance(fb, dict):
-            tech = fb.get("technical_review", {})
+    def check_few_gaps(self, v: LogView) -> Tuple[TestResult, str]:
+        if v.has_feedback:
+            tech = v.feedback.get("technical_review", {})
             gaps = len(tech.get("knowledge_gaps", []))
             skills = len(tech.get("confirmed_skills", []))
             if gaps <= skills:
                 return TestResult.PASS, f"Навыков {skills} >= пробелов {gaps}"
         return TestResult.WARN, "Много пробелов"
     
-    def check_context_maintained(self, d: Dict) -> Tuple[TestResult, str]:
-        turns = d.get("turns", [])
-        if len(turns) < 3:
+    def check_context_maintained(self, v: LogView) -> Tuple[TestResult, str]:
+        turns = len(v.turns)
+        if turns < 3:
             return TestResult.WARN, "Мало ходов"
         
         # проверяем что есть прогресс и финальный отчёт
-        if d.get("final_feedback"):
-            return TestResult.PASS, f"Контекст ок, {len(turns)} ходов"
+        if v.d.get("final_feedback"):
+            return TestResult.PASS, f"Контекст ок, {turns} ходов"
         return TestResult.WARN, "Нет финального отчёта"
 
     
-    def check_robustness(self, d: Dict) -> Tuple[TestResult, str]:
-        if d.get("final_feedback"):
+    def check_robustness(self, v: LogView) -> Tuple[TestResult, str]:
+        if v.d.get("final_feedback"):
             return TestResult.PASS, "Система устойчива"
         return TestResult.FAIL, "Нет отчёта"
     
-    def check_stable_performance(self, d: Dict) -> Tuple[TestResult, str]:
-        turns = len(d.get("turns", []))
-        if turns >= 10 and d.get("final_feedback"):
+    def check_stable_performance(self, v: LogView) -> Tuple[TestResult, str]:
+        turns = len(v.turns)
+        if turns >= 10 and v.d.get("final_feedback"):
             return TestResult.PASS, f"Стабильно: {turns} ходов"
         return TestResult.WARN, f"Только {turns} ходов"
     
-    def check_clarity_low(self, d: Dict) -> Tuple[TestResult, str]:
-        fb = d.get("final_feedback", {})
-        if isinstance(fb, dict):
-            score = fb.get("soft_skills_review", {}).get("clarity", {}).get("score", 10)
-            if score <= 5:
-                return TestResult.PASS, f"Ясность низкая: {score}/10"
+    def check_clarity_low(self, v: LogView) -> Tuple[TestResult, str]:
+        score = v.score("soft_skills_review", "clarity", 10)
+        if score <= 5:
+            return TestResult.PASS, f"Ясность низкая: {score}/10"
         return TestResult.WARN, "Ясность не низкая"
     
-    def check_probing_questions(self, d: Dict) -> Tuple[TestResult, str]:
-        markers = ["подробнее", "пояснить", "что имеешь в виду", "расскажи больше"]
-        for t in d.get("turns", []):
-            msg = t.get("agent_visible_message", "").lower()
-            if any(m in msg for m in markers):
-                return TestResult.PASS, "Уточняющие вопросы есть"
+    def check_probing_questions(self, v: LogView) -> Tuple[TestResult, str]:
+        if v.any_turn("probing"):
+            return TestResult.PASS, "Уточняющие вопросы есть"
         return TestResult.WARN, "Уточнений нет"
     
     # === НОВЫЕ ПРОВЕРКИ ДЛЯ АГЕНТОВ ===
     
-    def check_contradiction_detected(self, d: Dict) -> Tuple[TestResult, str]:
+    def check_contradiction_detected(self, v: LogView) -> Tuple[TestResult, str]:
         """Проверяет что ContradictionDetector сработал"""
-        for t in d.get("turns", []):
-            thoughts = t.get("internal_thoughts", "")
-            if "ContradictionDetector" in thoughts or "противореч" in thoughts.lower():
-                return TestResult.PASS, "Противоречие обнаружено"
+        if v.any_turn("contradiction_agent") or v.any_turn("contradiction_l"):
+            return TestResult.PASS, "Противоречие обнаружено"
         return TestResult.FAIL, "Противоречие не обнаружено"
     
-    def check_contradiction_handled(self, d: Dict) -> Tuple[TestResult, str]:
+    def check_contradiction_handled(self, v: LogView) -> Tuple[TestResult, str]:
         """Проверяет что агент отреагировал на противоречие"""
-        markers = ["ранее ты говорил", "раньше упоминал", "противореч", "уточни", "пояснить"]
-        for t in d.get("turns", []):
-            if "contradiction" in t.get("internal_thoughts", "").lower():
-                msg = t.get("agent_visible_message", "").lower()
-                if any(m in msg for m in markers):
-                    return TestResult.PASS, "Противоречие обработано"
+        if any("contradiction_flag" in t.hits and "contradiction_reply" in t.hits for t in v.turns):
+            return TestResult.PASS, "Противоречие обработано"
         return TestResult.WARN, "Реакция на противоречие не найдена"
     
-    def check_depth_tracked(self, d: Dict) -> Tuple[TestResult, str]:
+    def check_depth_tracked(self, v: LogView) -> Tuple[TestResult, str]:
         """Проверяет что DepthProber работал"""
-        for t in d.get("turns", []):
-            thoughts = t.get("internal_thoughts", "")
-            if "DepthProber" in thoughts or "уровень" in thoughts.lower() and "/5" in thoughts:
+        for t in v.turns:
+            if "depth_agent" in t.hits or "level_word" in t.hits and "out_of_5" in t.hits:
                 return TestResult.PASS, "Глубина отслеживается"
         return TestResult.WARN, "DepthProber не зафиксирован"
     
-    def check_depth_high_levels(self, d: Dict) -> Tuple[TestResult, str]:
+    def check_depth_high_levels(self, v: LogView) -> Tuple[TestResult, str]:
         """Проверяет высокие уровни глубины для сеньора"""
-        for t in d.get("turns", []):
-            thoughts = t.get("internal_thoughts", "")
+        for t in v.turns:
             # ищем уровни 4 или 5
-            if "уровень 4/5" in thoughts or "уровень 5/5" in thoughts:
+            if "depth_high" in t.hits:
                 return TestResult.PASS, "Высокая глубина зафиксирована"
-            if ": 4/5" in thoughts or ": 5/5" in thoughts:
+            if "depth_high_short" in t.hits:
                 return TestResult.PASS, "Глубина 4-5"
         return TestResult.WARN, "Высокая глубина не найдена"
     
-    def check_depth_low_levels(self, d: Dict) -> Tuple[TestResult, str]:
+    def check_depth_low_levels(self, v: LogView) -> Tuple[TestResult, str]:
         """Проверяет низкие уровни для молчуна"""
-        high_found = False
-        for t in d.get("turns", []):
-            thoughts = t.get("internal_thoughts", "")
-            if "уровень 4/5" in thoughts or "уровень 5/5" in thoughts:
-                high_found = True
-        if not high_found:
+        if not v.any_turn("depth_high"):
             return TestResult.PASS, "Глубина не высокая"
         return TestResult.WARN, "Неожиданно высокая глубина"
     
-    def check_depth_progression(self, d: Dict) -> Tuple[TestResult, str]:
+    def check_depth_progression(self, v: LogView) -> Tuple[TestResult, str]:
         """Проверяет прогрессию глубины"""
-        levels = []
-        for t in d.get("turns", []):
-            thoughts = t.get("internal_thoughts", "")
-            for lvl in ["1/5", "2/5", "3/5", "4/5", "5/5"]:
-                if lvl in thoughts:
-                    levels.append(int(lvl[0]))
+        levels = [lvl for t in v.turns for lvl in t.levels]
         
         if len(levels) >= 2 and levels[-1] > levels[0]:
             return TestResult.PASS, f"Прогрессия: {levels[0]} → {levels[-1]}"
@@ -639,55 +887,41 @@ class TestChecker:
             return TestResult.WARN, f"Уровни: {levels}"
         return TestResult.WARN, "Прогрессия не отслежена"
     
-    def check_fact_checker_worked(self, d: Dict) -> Tuple[TestResult, str]:
+    def check_fact_checker_worked(self, v: LogView) -> Tuple[TestResult, str]:
         """Проверяет что FactChecker работал"""
-        for t in d.get("turns", []):
-            thoughts = t.get("internal_thoughts", "")
-            if "FactChecker" in thoughts:
-                return TestResult.PASS, "FactChecker работал"
+        if v.any_turn("fact_agent"):
+            return TestResult.PASS, "FactChecker работал"
         return TestResult.WARN, "FactChecker не зафиксирован"
     
-    def check_observer_flagged(self, d: Dict) -> Tuple[TestResult, str]:
+    def check_observer_flagged(self, v: LogView) -> Tuple[TestResult, str]:
         """Проверяет что Observer выставлял флаги"""
-        for t in d.get("turns", []):
-            thoughts = t.get("internal_thoughts", "")
-            if "Observer" in thoughts and "Флаги:" in thoughts:
-                if "[]" not in thoughts.split("Флаги:")[1][:20]:
+        for t in v.turns:
+            if "observer_agent" in t.hits and "flags_label" in t.hits:
+                if "[]" not in t.thoughts.split("Флаги:")[1][:20]:
                     return TestResult.PASS, "Observer выставил флаги"
         return TestResult.WARN, "Флаги не найдены"
     
-    def check_interviewer_adapted(self, d: Dict) -> Tuple[TestResult, str]:
+    def check_interviewer_adapted(self, v: LogView) -> Tuple[TestResult, str]:
         """Проверяет что Interviewer адаптировался"""
-        for t in d.get("turns", []):
-            thoughts = t.get("internal_thoughts", "")
-            if "Interviewer" in thoughts:
-                return TestResult.PASS, "Interviewer активен"
+        if v.any_turn("interviewer_agent"):
+            return TestResult.PASS, "Interviewer активен"
         return TestResult.WARN, "Interviewer не найден"
     
-    def check_agents_all_present(self, d: Dict) -> Tuple[TestResult, str]:
+    def check_agents_all_present(self, v: LogView) -> Tuple[TestResult, str]:
         """Проверяет присутствие всех агентов в логах"""
-        agents = set()
         expected = {"Observer", "Interviewer"}
-        
-        for t in d.get("turns", []):
-            thoughts = t.get("internal_thoughts", "")
-            for agent in ["Observer", "Interviewer", "FactChecker", 
-                         "ContradictionDetector", "DepthProber", "DifficultyCtrl", "MetaReviewer"]:
-                if agent in thoughts:
-                    agents.add(agent)
-        
-        if expected.issubset(agents):
-            return TestResult.PASS, f"Агенты: {', '.join(agents)}"
-        missing = expected - agents
+        if expected.issubset(v.agents):
+            return TestResult.PASS, f"Агенты: {', '.join(v.agents)}"
+        missing = expected - v.agents
         return TestResult.WARN, f"Нет агентов: {missing}"
     
-    def check_all_agents_logged(self, d: Dict) -> Tuple[TestResult, str]:
+    def check_all_agents_logged(self, v: LogView) -> Tuple[TestResult, str]:
         """Алиас для agents_all_present"""
-        return self.check_agents_all_present(d)
+        return self.check_agents_all_present(v)
     
-    def check_full_feedback(self, d: Dict) -> Tuple[TestResult, str]:
+    def check_full_feedback(self, v: LogView) -> Tuple[TestResult, str]:
         """Проверяет полноту отчёта"""
-        fb = d.get("final_feedback", {})
+        fb = v.d.get("final_feedback", {})
         if isinstance(fb, str):
             # если строка - значит summary, ок для формата ТЗ
             return TestResult.PASS, "Отчёт есть (строка)"
@@ -701,77 +935,153 @@ class TestChecker:
     
     # === АЛИАСЫ ===
     
-    def check_adaptivity_up(self, d): return self.check_difficulty_increased(d)
-    def check_candidate_question_handled(self, d): return self.check_candidate_questions_answered(d)
-    def check_positive_feedback(self, d):
-        fb = d.get("final_feedback", {})
-        if isinstance(fb, dict):
-            rec = fb.get("decision", {}).get("hiring_recommendation", "").lower()
-            if "hire" in rec and "no" not in rec:
-                return TestResult.PASS, f"Позитивная: {rec}"
+    def check_adaptivity_up(self, v): return self.check_difficulty_increased(v)
+    def check_candidate_question_handled(self, v): return self.check_candidate_questions_answered(v)
+    def check_positive_feedback(self, v):
+        rec = v.feedback.get("decision", {}).get("hiring_recommendation", "").lower()
+        if "hire" in rec and "no" not in rec:
+            return TestResult.PASS, f"Позитивная: {rec}"
         return TestResult.WARN, "Рекомендация неясна"
     
-    def check_not_ignored(self, d): return self.check_candidate_questions_answered(d)
-    def check_no_repeated_topics(self, d): return self.check_context_maintained(d)
-    def check_difficulty_adjusted(self, d):
-        inc = self.check_difficulty_increased(d)
-        dec = self.check_difficulty_decreased(d)
+    def check_not_ignored(self, v): return self.check_candidate_questions_answered(v)
+    def check_no_repeated_topics(self, v): return self.check_context_maintained(v)
+    def check_difficulty_adjusted(self, v):
+        inc = self.check_difficulty_increased(v)
+        dec = self.check_difficulty_decreased(v)
         if inc[0] == TestResult.PASS or dec[0] == TestResult.PASS:
             return TestResult.PASS, "Сложность адаптировалась"
         return TestResult.WARN, "Изменение не зафиксировано"
     
-    def check_hallucination_caught(self, d): return self.check_hallucination_detected(d)
-    def check_question_answered(self, d): return self.check_candidate_questions_answered(d)
-    def check_full_feedback_generated(self, d): return self.check_full_feedback(d)
+    def check_hallucination_caught(self, v): return self.check_hallucination_detected(v)
+    def check_question_answered(self, v): return self.check_candidate_questions_answered(v)
+    def check_full_feedback_generated(self, v): return self.check_full_feedback(v)
+    
+    @classmethod
+    def names(cls) -> List[str]:
+        return [m[len("check_"):] for m in dir(cls) if m.startswith("check_")]
     
-    def run_check(self, name: str, d: Dict) -> Tuple[TestResult, str]:
+    def run_check(self, name: str, d) -> Tuple[TestResult, str]:
+        view = d if isinstance(d, LogView) else self.compile(d)
         method = f"check_{name}"
         if hasattr(self, method):
             try:
-                return getattr(self, method)(d)
+                return getattr(self, method)(view)
             except Exception as e:
                 return TestResult.FAIL, f"Ошибка: {e}"
         return TestResult.WARN, f"Проверка {name} не реализована"
+    
+    def run_checks(self, names: List[str], d: Dict) -> Dict[str, Tuple[TestResult, str]]:
+        """Все проверки по одному разбору лога"""
+        view = self.compile(d)
+        return {name: self.run_check(name, view) for name in names}
+
+
+def validate_scenarios(scenarios: List[ScenarioConfig]):
+    """Каждая ожидаемая проверка сценария должна быть методом TestChecker, иначе она молча станет WARN"""
+    known = set(TestChecker.names())
+    missing = sorted({c for sc in scenarios for c in sc.expected_checks if c not in known})
+    if missing:
+        raise ValueError(f"Неизвестные проверки в сценариях: {missing}")
+
+
+validate_scenarios(SCENARIOS + WHAT_IF)
+
+
+def overall_result(checks: Dict[str, Tuple[TestResult, str]]) -> TestResult:
+    results = [r for r, _ in checks.values()]
+    if TestResult.FAIL in results:
+        return TestResult.FAIL
+    if TestResult.WARN in results:
+        return TestResult.WARN
+    return TestResult.PASS
 
 
 class TestRunner:
     """Запускает тесты"""
     
-    def __init__(self):
+    def __init__(self, trace: bool = False, otlp: bool = False,
+                 profile: bool = False, profile_mem: bool = False, pipelines: List[str] = None,
+                 prompt_variants: List[str] = None, jobs: int = 1, shard: Optional[Tuple[int, int]] = None,
+                 changed: bool = False):
+        self.trace = trace  # сохранять chrome trace каждого сценария
+        self.otlp = otlp  # плюс OTLP JSON рядом
+        self.profile = profile or profile_mem  # cProfile + стеки на каждый ход
+        self.profile_mem = profile_mem  # плюс tracemalloc
+        self.pipelines = pipelines or [CFG.PIPELINE_PROFILE]  # профили конвейера для сравнения
+        self.prompt_variants = prompt_variants or [CFG.PROMPT_VARIANT]  # A/B вариантов промптов
+        self.jobs = max(1, jobs)  # сценариев одновременно; лимит запросов к API общий - SCHEDULER
+        self.wall_sec = 0.0
+        self.shard = shard  # (i, n): гоняем только i-ю из n частей матрицы, итог - частичный файл
+        self.shards = 0  # из скольких частей собран итог (после merge)
+        self.shard_dir = "test_logs/shards"
+        self.queue_wait: Optional[Dict] = None  # ожидание в очереди LLM, сведённое по частям
+        self.changed = changed  # перезапускать только сценарии, задетые изменившимися агентами
         self.llm = GeminiClient()
         self.llm.set_model(TEST_MODEL)
+        self.llm.chaos = ""  # кандидат - часть стенда, сбои только у интервьюера
+        self.chaos: Optional[Dict] = None  # подмешанные сбои и их последствия, при --chaos
         self.simulator = CandidateSimulator(self.llm)
         self.checker = TestChecker()
         self.reports: List[TestReport] = []
+        # общие начала: (префикс, конвейер, промпты) -> задача, считающая снимок; ответвления ждут одну и ту же
+        self._prefixes: Dict[Tuple[str, str, str], asyncio.Task] = {}
+        self.prefix_costs: Dict[str, Dict] = {}
+        self.estimator = SuiteEstimator(stats_path(CFG.LLM_BACKEND))
+        self.forecast: Optional[Dict] = None  # прогноз dryrun.py и факт прогона
+        self.serial_baseline = 0.0  # прогноз последовательного прогона, если dryrun калиброван на таком
     
-    async def run_scenario(self, scenario: ScenarioConfig) -> TestReport:
-        print(f"\n{'='*60}")
-        print(f"🧪 {scenario.name}")
-        print(f"   Модель: {TEST_MODEL} | Smart: {USE_SMART_MODE}")
-        print(f"{'='*60}")
+    async def run_scenario(self, scenario: ScenarioConfig, pipeline: str = None,
+                           prompt_variant: str = None) -> TestReport:
+        pipeline = pipeline or self.pipelines[0]
+        prompt_variant = prompt_variant or self.prompt_variants[0]
+        say(f"\n{'='*60}")
+        say(f"🧪 {scenario.name}")
+        say(f"   Модель: {TEST_MODEL} | Smart: {USE_SMART_MODE} | Конвейер: {pipeline} | Промпты: {prompt_variant}")
+        say(f"{'='*60}")
         
         start = datetime.now()
+        # при сравнении вариантов один сценарий идёт несколько раз - не затираем логи
+        tag = scenario.name
+        if len(self.pipelines) * len(self.prompt_variants) > 1:
+            tag = f"{scenario.name}_{Path(pipeline).stem}_{prompt_variant}"
         errors = []
         
-        orch = InterviewOrchestrator(smart_mode=USE_SMART_MODE)
+        history = []
+        if scenario.prefix:
+            snapshot, history = await self.prefix_snapshot(scenario.prefix, pipeline, prompt_variant)
+            orch = InterviewOrchestrator.fork(snapshot)
+            history = list(history)
+        else:
+            orch = InterviewOrchestrator(smart_mode=USE_SMART_MODE, pipeline=pipeline, prompt_variant=prompt_variant)
         orch.set_model(TEST_MODEL)
-        cand = Candidate(**scenario.candidate)
-        orch.start_session(cand)
+        orch.tracer.enabled = self.trace or self.otlp
+        if not scenario.prefix:
+            orch.start_session(Candidate(**scenario.candidate))
         
-        history = []
+        turn_sec, turn_calls, turn_tokens = [], [], []
+        first_message_sec = 0.0
+        profiler = None
+        if self.profile:
+            profiler = Profiler(f"test_logs/profile/{tag}_{datetime.now().strftime('%H%M%S')}",
+                                memory=self.profile_mem)
         
         try:
-            # приветствие
-            res = await orch.generate_greeting()
-            if "error" in res:
-                errors.append(f"Ошибка приветствия: {res['error']}")
+            # приветствие (у ответвления оно уже в общем начале)
+            if scenario.prefix:
+                say(f"🍴 Продолжаем общее начало {scenario.prefix} с хода {len(orch.session.turns) + 1}")
             else:
-                msg = res["message"]
-                print(f"🤖 {msg[:80]}...")
-                history.append({"role": "agent", "text": msg})
+                t0 = time.perf_counter()
+                res = await orch.generate_greeting()
+                first_message_sec = time.perf_counter() - t0
+                if "error" in res:
+                    errors.append(f"Ошибка приветствия: {res['error']}")
+                else:
+                    msg = res["message"]
+                    say(f"🤖 {msg[:80]}...")
+                    history.append({"role": "agent", "text": msg})
             
             # диалог
-            turn = 1
+            turn = len(orch.session.turns) + 1
             while turn <= scenario.max_turns:
                 last_msg = history[-1]["text"] if history else ""
                 
@@ -779,13 +1089,18 @@ class TestRunner:
                     last_msg, scenario.behavior, history, turn, scenario.candidate
                 )
                 
-                print(f"👤 {reply[:80]}{'...' if len(reply) > 80 else ''}")
+                say(f"👤 {reply[:80]}{'...' if len(reply) > 80 else ''}")
                 history.append({"role": "user", "text": reply})
                 
-                res = await orch.process_message(reply)
+                t0, calls0, tokens0 = time.perf_counter(), orch.llm.calls, orch.llm.tokens
+                res = await profiled(profiler, f"turn_{turn:02d}", orch.process_message(reply))
+                if not res.get("finished"):
+                    turn_sec.append(round(time.perf_counter() - t0, 3))
+                    turn_calls.append(orch.llm.calls - calls0)
+                    turn_tokens.append(orch.llm.tokens - tokens0)
                 
                 if res.get("finished"):
-                    print("📊 Завершено")
+                    say("📊 Завершено")
                     break
                 
                 if "error" in res:
@@ -793,26 +1108,29 @@ class TestRunner:
                     break
                 
                 msg = res["message"]
-                print(f"🤖 {msg[:80]}...")
+                say(f"🤖 {msg[:80]}...")
                 history.append({"role": "agent", "text": msg})
                 
                 turn += 1
             
             if not orch.session.finished:
-                await orch.finish_interview()
+                await profiled(profiler, "finish", orch.finish_interview())
             
         except Exception as e:
             errors.append(f"Exception: {e}")
             import traceback
             traceback.print_exc()
         
+        if profiler:
+            say(f"🔬 Профиль: {profiler.finish()}")
+        
         # получаем данные сессии
         sess = orch.session.to_dict()
 
         
         # сохраняем логи
         # сохраняем логи
-        log_file = f"test_logs/{scenario.name}_{datetime.now().strftime('%H%M%S')}.json"
+        log_file = f"test_logs/{tag}_{datetime.now().strftime('%H%M%S')}.json"
         try:
             os.makedirs("test_logs", exist_ok=True)
             
@@ -825,32 +1143,67 @@ class TestRunner:
             with open(log_file.replace('.json', '_tz.json'), 'w', encoding='utf-8') as f:
                 json.dump(sess, f, ensure_ascii=False, indent=2)
 
+            if self.trace:
+                orch.tracer.export_chrome(log_file.replace('.json', '.trace.json'))
+            if self.otlp:
+                orch.tracer.export_otlp(log_file.replace('.json', '.otlp.json'))
+
         except Exception as e:
             errors.append(f"Сохранение: {e}")
             log_file = "N/A"
         
         # проверки
-        checks = {}
-        for name in scenario.expected_checks:
-            result, msg = self.checker.run_check(name, sess)
-            checks[name] = (result, msg)
-            print(f"  {result.value} {name}: {msg}")
-        
-        # итог
-        results = [r for r, _ in checks.values()]
-        if TestResult.FAIL in results:
-            overall = TestResult.FAIL
-        elif TestResult.WARN in results:
-            overall = TestResult.WARN
-        else:
-            overall = TestResult.PASS
+        checks = self.checker.run_checks(scenario.expected_checks, sess)
+        for name, (result, msg) in checks.items():
+            say(f"  {result.value} {name}: {msg}")
         
+        overall = overall_result(checks)
         duration = (datetime.now() - start).total_seconds()
         turns_count = len(sess.get("turns", []))
+        llm_calls, llm_tokens, llm_errors = orch.llm.calls, orch.llm.tokens, orch.llm.errors
+        used_agents = sorted(orch.llm.agent_calls)
         
         await orch.close()
         
-        return TestReport(scenario.name, overall, checks, duration, turns_count, log_file, errors)
+        return TestReport(scenario.name, overall, checks, duration, turns_count, log_file, errors,
+                          pipeline=orch.pipeline.name, prompts=prompt_variant,
+                          llm_calls=llm_calls, llm_tokens=llm_tokens, llm_errors=llm_errors, turn_sec=turn_sec,
+                          turn_calls=turn_calls, turn_tokens=turn_tokens,
+                          first_message_sec=round(first_message_sec, 3), prefix=scenario.prefix,
+                          agents=used_agents)
+    
+    async def prefix_snapshot(self, name: str, pipeline: str, variant: str) -> Tuple[Dict, List[Dict]]:
+        key = (name, pipeline, variant)
+        if key not in self._prefixes:
+            self._prefixes[key] = asyncio.ensure_future(self._run_prefix(PREFIXES[name], pipeline, variant))
+        return await self._prefixes[key]
+    
+    async def _run_prefix(self, prefix: PrefixConfig, pipeline: str, variant: str) -> Tuple[Dict, List[Dict]]:
+        """Приветствие и первые ходы один раз, дальше от снимка ответвляются сценарии"""
+        started = time.perf_counter()
+        orch = InterviewOrchestrator(smart_mode=USE_SMART_MODE, pipeline=pipeline, prompt_variant=variant)
+        orch.set_model(TEST_MODEL)
+        orch.start_session(Candidate(**prefix.candidate))
+        history = []
+        try:
+            res = await orch.generate_greeting()
+            if "message" in res:
+                history.append({"role": "agent", "text": res["message"]})
+            for turn in range(1, prefix.turns + 1):
+                last_msg = history[-1]["text"] if history else ""
+                reply = await self.simulator.generate_reply(last_msg, prefix.behavior, history, turn, prefix.candidate)
+                history.append({"role": "user", "text": reply})
+                res = await orch.process_message(reply)
+                if "message" not in res:
+                    break
+                history.append({"role": "agent", "text": res["message"]})
+            snapshot = await orch.snapshot()
+        finally:
+            await orch.close()
+        self.prefix_costs[f"{prefix.name} [{Path(pipeline).stem}/{variant}]"] = {
+            "turns": prefix.turns, "llm_calls": orch.llm.calls, "llm_tokens": orch.llm.tokens,
+            "sec": round(time.perf_counter() - started, 1)}
+        return snapshot, history
     
     async def run_all(self, scenarios: List[ScenarioConfig] = None):
         if scenarios is None:
@@ -861,21 +1214,242 @@ class TestRunner:
         print(f"📋 Сценариев: {len(scenarios)}")
         print(f"🤖 Модель: {TEST_MODEL}")
         print(f"🧠 Smart Mode: {USE_SMART_MODE}")
+        print(f"🔀 Конвейер: {', '.join(self.pipelines)} | Промпты: {', '.join(self.prompt_variants)}")
         print("="*70)
         
-        for sc in scenarios:
-            try:
-                rep = await self.run_scenario(sc)
-                self.reports.append(rep)
-            except Exception as e:
-                print(f"❌ Критическая ошибка {sc.name}: {e}")
-                self.reports.append(TestReport(sc.name, TestResult.FAIL, {}, 0, 0, "N/A", [str(e)]))
-            
-
-            await asyncio.sleep(4)  # пауза между тестами чтобы не ловить 429
+        matrix, indexes = self._matrix(scenarios)
+        index = self.load_index()
+        fingerprints = {self._key(*m): self.fingerprint(*m) for m in matrix}
+        cached: Dict[int, TestReport] = {}
+        if self.changed:
+            cached = self.select_unchanged(matrix, index, fingerprints)
+        todo = [m for k, m in enumerate(matrix) if k not in cached]
+        predicted = None if self.shard else self.estimate(todo)
+        if predicted:
+            print(f"🔮 Прогноз: ~{predicted.calls:.0f} вызовов LLM, ~{predicted.tokens:.0f} токенов, "
+                  f"~{fmt_sec(predicted.parallel_sec if self.jobs > 1 else predicted.serial_sec)}")
+        if predicted and "serial" in self.estimator.correction:
+            self.serial_baseline = predicted.serial_sec
+        totals0 = agent_totals()
+        fallbacks0, retries0, faults0 = dict(FALLBACKS.values), sum(LLM_RETRIES.values.values()), dict(CHAOS_FAULTS.values)
+        started = time.perf_counter()
+        if self.jobs > 1:
+            print(f"⚡ Параллельно: до {self.jobs} сценариев одновременно")
+            fresh = await self._run_parallel(todo)
+        else:
+            fresh = []
+            for sc, pipeline, variant in todo:
+                fresh.append(await self._run_safe(sc, pipeline, variant))
+                await asyncio.sleep(4)  # пауза между тестами чтобы не ловить 429
+        self.wall_sec = time.perf_counter() - started
+        fresh_iter = iter(fresh)
+        self.reports.extend(cached[k] if k in cached else next(fresh_iter) for k in range(len(matrix)))
+        if CFG.LLM_CHAOS:
+            self.chaos = self.chaos_stats(fresh, fallbacks0, retries0, faults0)
+        if not self.shard:  # части пула не пишут общий индекс и статистику прогноза одновременно
+            self.save_index(index, [(m, r) for m, r in zip(todo, fresh)], fingerprints)
+            self.calibrate(todo, fresh, totals0, predicted)
         
         await self.llm.close()
-        self.print_summary()
+        # usageMetadata прогона калибрует локальный оценщик токенов
+        if CFG.TOKEN_CALIBRATION_FILE and ESTIMATOR.fit():
+            ESTIMATOR.save(CFG.TOKEN_CALIBRATION_FILE)
+        if self.shard:
+            self.save_partial(indexes, fingerprints)
+        else:
+            self.print_summary()
+    
+    def _matrix(self, scenarios: List[ScenarioConfig]) -> Tuple[List[Tuple[ScenarioConfig, str, str]], List[int]]:
+        matrix = [(sc, pipeline, variant) for pipeline in self.pipelines
+                  for variant in self.prompt_variants for sc in scenarios]
+        indexes = list(range(len(matrix)))
+        if self.shard:
+            i, n = self.shard
+            indexes = indexes[i - 1::n]
+            matrix = [matrix[k] for k in indexes]
+        return matrix, indexes
+    
+    @staticmethod
+    def _estimate_rows(matrix: List[Tuple[ScenarioConfig, str, str]]) -> List[Tuple[str, int, str, str, int]]:
+        """Строки для dryrun: общее начало считается один раз на конвейер и промпты, ответвления - с хода после него"""
+        rows, seen = [], set()
+        for sc, pipeline, variant in matrix:
+            start = 1
+            if sc.prefix:
+                prefix = PREFIXES[sc.prefix]
+                start = prefix.turns + 1
+                if (sc.prefix, pipeline, variant) not in seen:
+                    seen.add((sc.prefix, pipeline, variant))
+                    rows.append((PREFIX_KEY + sc.prefix, prefix.turns, pipeline, variant, 1))
+            rows.append((sc.name, sc.max_turns, pipeline, variant, start))
+        return rows
+    
+    def estimate(self, matrix: List[Tuple[ScenarioConfig, str, str]]):
+        return self.estimator.suite(self._estimate_rows(matrix), self.jobs, USE_SMART_MODE)
+    
+    def dry_run(self, scenarios: List[ScenarioConfig]):
+        """Прогноз вызовов, токенов и времени без запуска сценариев"""
+        matrix, _ = self._matrix(scenarios)
+        if self.changed:
+            index = self.load_index()
+            cached = self.select_unchanged(matrix, index, {self._key(*m): self.fingerprint(*m) for m in matrix})
+            matrix = [m for k, m in enumerate(matrix) if k not in cached]
+        print_estimate(self.estimate(matrix), self.estimator.runs)
+    
+    def calibrate(self, todo: List[Tuple[ScenarioConfig, str, str]], fresh: List[TestReport], totals0: Dict, predicted):
+        """Уточняем статистику прогноза по факту и запоминаем, насколько прогноз ошибся"""
+        if not fresh:
+            return
+        totals = agent_totals()
+        delta = {k: sum(a[k] - totals0.get(n, {}).get(k, 0) for n, a in totals.items()) for k in ("calls", "tokens")}
+        self.forecast = {
+            "calls": [round(predicted.calls), round(delta["calls"])],
+            "tokens": [round(predicted.tokens), round(delta["tokens"])],
+            "wall_sec": [round(predicted.parallel_sec if self.jobs > 1 else predicted.serial_sec, 1),
+                         round(self.wall_sec, 1)],
+        }
+        if CFG.LLM_CHAOS:
+            return  # подмешанные сбои не должны попасть в статистику
+        failed = any(r.errors or r.log_file == "N/A" for r in fresh)  # время с упавшими сценариями не показательно
+        runs = [(PREFIX_KEY + name, PREFIXES[name].turns, pipeline, PREFIXES[name].turns, 1)
+                for name, pipeline, _ in self._prefixes]
+        for (sc, pipeline, _), r in zip(todo, fresh):
+            start = PREFIXES[sc.prefix].turns + 1 if sc.prefix else 1
+            runs.append((sc.name, sc.max_turns, pipeline, r.turns_count, start))
+        self.estimator.observe_run(runs, totals0, totals, self._estimate_rows(todo), self.jobs,
+                                   0.0 if failed else self.wall_sec, USE_SMART_MODE)
+    
+    @staticmethod
+    def _key(sc: ScenarioConfig, pipeline: str, variant: str) -> str:
+        return f"{sc.name}|{pipeline}|{variant}"
+    
+    def fingerprint(self, sc: ScenarioConfig, pipeline: str, variant: str) -> Dict:
+        """Общий отпечаток (ход, настройки, сценарий, симулятор кандидата) и отпечатки по агентам"""
+        prefix = asdict(PREFIXES[sc.prefix]) if sc.prefix else None
+        core = digest(core_fingerprint(CFG), asdict(sc), prefix, inspect.getsource(CandidateSimulator),
+                      TEST_MODEL, USE_SMART_MODE)
+        return {"core": core, "agents": agent_fingerprints(CFG, load_profile(pipeline), variant)}
+    
+    @staticmethod
+    def load_index() -> Dict[str, Dict]:
+        try:
+            with open(CHANGED_INDEX, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+    
+    def save_index(self, index: Dict[str, Dict], runs: List[Tuple[Tuple[ScenarioConfig, str, str], TestReport]],
+                   fingerprints: Dict[str, Dict]):
+        """Запоминаем, с какими отпечатками прошёл сценарий, каких агентов вызвал и от каких зависят проверки"""
+        for m, r in runs:
+            if r.errors or r.log_file == "N/A":
+                continue  # упавший прогон не переиспользуем
+            sc = m[0]
+            key = self._key(*m)
+            index[key] = {
+                "saved": datetime.now().isoformat(timespec="seconds"),
+                "core": fingerprints[key]["core"],
+                "agents": fingerprints[key]["agents"],
+                "agents_used": r.agents,
+                "check_agents": {c: list(CHECK_AGENTS.get(c, ())) for c in sc.expected_checks},
+                "report": r.to_dict(),
+            }
+        if runs:
+            os.makedirs(os.path.dirname(CHANGED_INDEX), exist_ok=True)
+            with open(CHANGED_INDEX, 'w', encoding='utf-8') as f:
+                json.dump(index, f, ensure_ascii=False, indent=2)
+    
+    def select_unchanged(self, matrix: List[Tuple[ScenarioConfig, str, str]], index: Dict[str, Dict],
+                         fingerprints: Dict[str, Dict]) -> Dict[int, TestReport]:
+        """Сценарии, которых изменения не коснулись: отчёт из прошлого прогона, проверки - заново по его логу"""
+        cached: Dict[int, TestReport] = {}
+        for k, m in enumerate(matrix):
+            sc = m[0]
+            key = self._key(*m)
+            entry, fp = index.get(key), fingerprints[key]
+            if entry is None:
+                reason = "нет прошлого прогона"
+            elif entry["core"] != fp["core"]:
+                reason = "общий код или настройки"
+            else:
+                relevant = set(entry["agents_used"]) | {a for c in sc.expected_checks for a in CHECK_AGENTS.get(c, ())}
+                touched = sorted(a for a in relevant if entry["agents"].get(a) != fp["agents"].get(a))
+                reason = f"агенты: {', '.join(touched)}" if touched else ""
+            if not reason:
+                report = TestReport.from_dict(entry["report"])
+                tz_log = report.log_file.replace('.json', '_tz.json')
+                if not os.path.exists(tz_log):
+                    reason = "лог прошлого прогона удалён"
+                else:
+                    with open(tz_log, 'r', encoding='utf-8') as f:
+                        report.checks = self.checker.run_checks(sc.expected_checks, json.load(f))
+                    report.result = overall_result(report.checks)
+                    report.cached = True
+                    cached[k] = report
+                    continue
+            print(f"🔁 {sc.name} [{m[1]}/{m[2]}]: {reason}")
+        print(f"♻️ Без изменений: {len(cached)} из {len(matrix)}, перезапуск: {len(matrix) - len(cached)}")
+        return cached
+    
+    @staticmethod
+    def chaos_stats(reports: List[TestReport], fallbacks0: Dict, retries0: float, faults0: Dict) -> Dict:
+        """Что подмешали и чем это обошлось: задержка хода, ошибки, запасные пути, проверки"""
+        def delta(now: Dict, before: Dict) -> Dict[str, int]:
+            out = {"/".join(k): int(v - before.get(k, 0)) for k, v in now.items()}
+            return {k: v for k, v in out.items() if v}
+        turn_sec = sorted(t for r in reports for t in r.turn_sec)
+        turns = len(turn_sec) or 1
+        calls = sum(r.llm_calls for r in reports) or 1
+        fallbacks = delta(FALLBACKS.values, fallbacks0)
+        checks = [res for r in reports for res, _ in r.checks.values()]
+        return {
+            "spec": CFG.LLM_CHAOS,
+            "faults": delta(CHAOS_FAULTS.values, faults0),
+            "turn_p50": turn_sec[len(turn_sec) // 2] if turn_sec else 0.0,
+            "turn_p95": turn_sec[min(int(0.95 * len(turn_sec)), len(turn_sec) - 1)] if turn_sec else 0.0,
+            "llm_errors": sum(r.llm_errors for r in reports),
+            "error_rate": round(sum(r.llm_errors for r in reports) / calls, 3),
+            "retries": int(sum(LLM_RETRIES.values.values()) - retries0),
+            "fallbacks": fallbacks,
+            "fallbacks_per_turn": round(sum(fallbacks.values()) / turns, 2),
+            "checks_passed": f"{sum(1 for c in checks if c == TestResult.PASS)}/{len(checks)}",
+            "check_pass_rate": round(sum(1 for c in checks if c == TestResult.PASS) / len(checks), 3) if checks else 0.0,
+        }
+    
+    def save_partial(self, indexes: List[int], fingerprints: Dict[str, Dict]):
+        """Результаты своей части матрицы - их соберёт merge_shards (и по отпечаткам запишет индекс --changed)"""
+        i, n = self.shard
+        os.makedirs(self.shard_dir, exist_ok=True)
+        path = os.path.join(self.shard_dir, f"shard_{i}_of_{n}.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({"shard": [i, n], "jobs": self.jobs, "wall_sec": round(self.wall_sec, 1), "llm_queue_wait": SCHEDULER.stats(),
+                       "fingerprints": fingerprints,
+                       "reports": [dict(r.to_dict(), index=k) for k, r in zip(indexes, self.reports)]},
+                      f, ensure_ascii=False, indent=2)
+        print(f"💾 Часть {i}/{n}: {path}")
+    
+    async def _run_safe(self, sc: ScenarioConfig, pipeline: str, variant: str) -> TestReport:
+        try:
+            return await self.run_scenario(sc, pipeline, variant)
+        except Exception as e:
+            say(f"❌ Критическая ошибка {sc.name}: {e}")
+            return TestReport(sc.name, TestResult.FAIL, {}, 0, 0, "N/A", [str(e)],
+                              pipeline=pipeline, prompts=variant)
+    
+    async def _run_parallel(self, matrix: List[Tuple[ScenarioConfig, str, str]]) -> List[TestReport]:
+        """Сценарии на одном event loop, не больше jobs сразу; отчёты в порядке матрицы, а не завершения"""
+        sem = asyncio.Semaphore(self.jobs)
+        
+        async def run(sc: ScenarioConfig, pipeline: str, variant: str) -> TestReport:
+            async with sem:
+                buf: List[str] = []
+                _OUTPUT.set(buf)  # у каждой задачи свой контекст
+                try:
+                    return await self._run_safe(sc, pipeline, variant)
+                finally:
+                    print("\n".join(buf), flush=True)
+        
+        return list(await asyncio.gather(*[run(*m) for m in matrix]))
     
     def print_summary(self):
         print("\n" + "="*70)
@@ -891,11 +1465,70 @@ class TestRunner:
         print(f"⚠️  Замечания: {warned}")
         print(f"❌ Провалено: {failed}")
         print(f"📈 Результат: {passed}/{total} ({100*passed//total if total else 0}%)")
+        reused = sum(1 for r in self.reports if r.cached)
+        if reused:
+            print(f"♻️ Из прошлого прогона: {reused} (--changed)")
+        # длительности сценариев при параллельном прогоне включают ожидание в общей очереди LLM,
+        # поэтому их сумма завышает ускорение; честнее сравнивать с прогнозом последовательного прогона
+        basis = "serial_forecast" if self.serial_baseline else "sum_of_durations"
+        serial_sec = self.serial_baseline or sum(r.duration_sec for r in self.reports if not r.cached)
+        speedup = round(serial_sec / self.wall_sec, 2) if self.wall_sec else 0
+        if self.jobs > 1 or self.shards:
+            mode = f"{self.shards} процессах" if self.shards else f"--jobs {self.jobs}"
+            if self.serial_baseline:
+                print(f"⚡ {self.wall_sec:.1f}с на {mode}, последовательно по прогнозу ~{serial_sec:.1f}с "
+                      f"(ускорение ~x{speedup})")
+            elif self.shards:
+                # части с --jobs 1 ещё и ждут паузы между сценариями, а в сумму длительностей они не входят
+                print(f"⚡ {self.wall_sec:.1f}с на {mode}, сумма длительностей сценариев {serial_sec:.1f}с "
+                      f"(x{speedup} - не оценка ускорения: без пауз между сценариями, но с ожиданием в очереди)")
+            else:
+                print(f"⚡ {self.wall_sec:.1f}с на {mode}, сумма длительностей сценариев {serial_sec:.1f}с "
+                      f"(оценка ускорения сверху x{speedup}: длительности включают ожидание в очереди)")
+        
+        waits = self.queue_wait if self.queue_wait is not None else SCHEDULER.stats()
+        for prio in Priority:
+            if prio.name in waits:
+                w = waits[prio.name]
+                print(f"⏳ Очередь LLM {prio.name}: {w['count']} вызовов, avg {w['avg_ms']}мс, p95 {w['p95_ms']}мс")
+        
+        if self.prefix_costs:
+            branches = sum(1 for r in self.reports if r.prefix and not r.cached)
+            calls = sum(c["llm_calls"] for c in self.prefix_costs.values())
+            saved = sum(c["llm_calls"] for c in self.prefix_costs.values()) * branches / len(self.prefix_costs) - calls
+            print(f"🍴 Общих начал: {len(self.prefix_costs)} на {branches} ответвлений, {calls} вызовов LLM "
+                  f"(сэкономлено ~{saved:.0f})")
+        
+        if self.forecast:
+            f = self.forecast
+            print(f"🔮 Прогноз/факт: вызовов {f['calls'][0]}/{f['calls'][1]}, токенов {f['tokens'][0]}/{f['tokens'][1]}, "
+                  f"время {f['wall_sec'][0]:.0f}/{f['wall_sec'][1]:.0f}с")
+        
+        if self.chaos:
+            c = self.chaos
+            print(f"\n💥 Сбои LLM ({c['spec']}): " + (", ".join(f"{k} {v}" for k, v in c["faults"].items()) or "не выпали"))
+            print(f"   Ход p50/p95: {c['turn_p50']:.2f}/{c['turn_p95']:.2f}с | ошибок LLM {c['llm_errors']} "
+                  f"({c['error_rate']:.0%} вызовов), ретраев {c['retries']}")
+            print(f"   Запасной путь: {c['fallbacks_per_turn']} на ход " +
+                  (f"({', '.join(f'{k} {v}' for k, v in c['fallbacks'].items())})" if c["fallbacks"] else ""))
+            print(f"   Проверок пройдено: {c['checks_passed']} ({c['check_pass_rate']:.0%})")
+        if CFG.LLM_BACKEND.startswith("fake"):
+            # заглушка отвечает и за кандидата ("Ок, понял."), так что доля PASS ничего не говорит о качестве
+            print("\nℹ️ Бэкенд fake: проверки не показательны, смотрите задержки, ошибки и запасные пути")
+        
+        variants = self.variant_stats()
+        if len(variants) > 1:
+            print("\n🔀 Сравнение вариантов (конвейер/промпты):")
+            for name, st in variants.items():
+                print(f"   {name:<18} пройдено {st['passed']}/{st['total']} (проверок {st['checks_passed']}) | "
+                      f"{st['avg_turn_sec']}с на ход | {st['calls_per_turn']} вызовов, "
+                      f"{st['tokens_per_turn']} токенов LLM на ход")
         
         print("\n" + "-"*70)
         for r in self.reports:
-            print(f"\n{r.result.value} {r.scenario_name}")
-            print(f"   ⏱️ {r.duration_sec:.1f}с | Ходов: {r.turns_count}")
+            print(f"\n{r.result.value} {r.scenario_name} [{r.pipeline}/{r.prompts}]{' ♻️' if r.cached else ''}")
+            print(f"   ⏱️ {r.duration_sec:.1f}с | Ходов: {r.turns_count} | Вызовов LLM: {r.llm_calls} | "
+                  f"Токенов: {r.llm_tokens}")
             print(f"   📁 {r.log_file}")
             
             for err in r.errors:
@@ -909,26 +1542,38 @@ class TestRunner:
             "timestamp": datetime.now().isoformat(),
             "model": TEST_MODEL,
             "smart_mode": USE_SMART_MODE,
+            "backend": CFG.LLM_BACKEND,
             "total": total,
             "passed": passed,
             "warned": warned,
             "failed": failed,
-            "scenarios": [
-                {
-                    "name": r.scenario_name,
-                    "result": r.result.name,
-                    "duration": r.duration_sec,
-                    "turns": r.turns_count,
-                    "checks": {k: {"result": v[0].name, "msg": v[1]} for k, v in r.checks.items()},
-                    "errors": r.errors
-                }
-                for r in self.reports
-            ]
+            "llm_queue_wait": waits,
+            "jobs": self.jobs,
+            "wall_sec": round(self.wall_sec, 1),
+            "speedup": speedup,
+            "speedup_basis": basis,
+            "variants": variants,
+            "scenarios": [r.to_dict() for r in self.reports]
         }
+        if self.shards:
+            summary["shards"] = self.shards
+        if self.chaos:
+            summary["chaos"] = self.chaos
+        if self.prefix_costs:
+            summary["prefixes"] = self.prefix_costs
+        if self.forecast:
+            summary["forecast"] = self.forecast
         
         os.makedirs("test_logs", exist_ok=True)
-        with open(f"test_logs/summary_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json", 'w', encoding='utf-8') as f:
+        summary_file = f"test_logs/summary_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        with open(summary_file, 'w', encoding='utf-8') as f:
             json.dump(summary, f, ensure_ascii=False, indent=2)
+        try:  # история прогонов для трендов: python history.py trend
+            conn = history.connect()
+            history.ingest_summary(conn, summary_file)
+            conn.close()
+        except sqlite3.Error as e:
+            print(f"⚠️ История прогонов не обновлена: {e}")
         
         print("\n" + "="*70)
         if failed == 0:
@@ -938,19 +1583,260 @@ class TestRunner:
         print("="*70)
 
 
+    def variant_stats(self) -> Dict[str, Dict]:
+        """Сводка по каждой паре конвейер/промпты для сравнения бок о бок"""
+        stats = {}
+        for name in dict.fromkeys(f"{r.pipeline}/{r.prompts}" for r in self.reports):
+            reps = [r for r in self.reports if f"{r.pipeline}/{r.prompts}" == name]
+            turns = sum(r.turns_count for r in reps) or 1
+            checks = [res for r in reps for res, _ in r.checks.values()]
+            stats[name] = {
+                "total": len(reps),
+                "passed": sum(1 for r in reps if r.result == TestResult.PASS),
+                "checks_passed": f"{sum(1 for c in checks if c == TestResult.PASS)}/{len(checks)}",
+                "avg_turn_sec": round(sum(r.duration_sec for r in reps) / turns, 2),
+                "calls_per_turn": round(sum(r.llm_calls for r in reps) / turns, 1),
+                "tokens_per_turn": round(sum(r.llm_tokens for r in reps) / turns),
+            }
+        return stats
+
+
+_CHECKER: Optional[TestChecker] = None  # свой в каждом процессе пула
+
+
+def _recheck_file(path: str) -> Tuple[str, Dict[str, str]]:
+    global _CHECKER
+    _CHECKER = _CHECKER or TestChecker()
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            d = json.load(f)
+    except (OSError, ValueError) as e:
+        return path, {"error": str(e)}
+    return path, {name: res.name for name, (res, _) in _CHECKER.run_checks(TestChecker.names(), d).items()}
+
+
+def _scenario_of(path: str) -> Optional[ScenarioConfig]:
+    base = os.path.basename(path)
+    found = [s for s in SCENARIOS + WHAT_IF if base.startswith(s.name + "_")]
+    return max(found, key=lambda s: len(s.name)) if found else None
+
+
+def recheck_logs(directory: str = "test_logs", workers: int = 0) -> str:
+    """Все проверки по всем сохранённым логам параллельно; матрица лог x проверка в CSV"""
+    from concurrent.futures import ProcessPoolExecutor
+
+    files = sorted(glob.glob(os.path.join(directory, "*_tz.json")))
+    if not files:
+        print(f"Нет логов *_tz.json в {directory}")
+        return ""
+    names = TestChecker.names()
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers or None) as pool:
+        rows = list(pool.map(_recheck_file, files, chunksize=max(1, len(files) // (4 * (workers or os.cpu_count() or 1)))))
+    elapsed = time.perf_counter() - started
+
+    icon = {"PASS": "✅", "WARN": "⚠️", "FAIL": "❌"}
+    print(f"\n🔁 Перепроверка {len(files)} логов x {len(names)} проверок: {elapsed:.2f}с")
+    for path, res in rows:
+        if "error" in res:
+            print(f"   🔴 {os.path.basename(path)}: {res['error']}")
+            continue
+        sc = _scenario_of(path)
+        expected = " ".join(f"{icon[res[c]]}{c}" for c in sc.expected_checks if c in res) if sc else "сценарий неизвестен"
+        counts = {k: sum(1 for v in res.values() if v == k) for k in icon}
+        print(f"   {os.path.basename(path):<40} {counts['PASS']:>3}/{counts['WARN']:>3}/{counts['FAIL']:>3} | {expected}")
+    ok_rows = [res for _, res in rows if "error" not in res]
+    if ok_rows:
+        print("\n   Доля PASS по проверкам:")
+        for name in names:
+            print(f"   {name:<30} {sum(r[name] == 'PASS' for r in ok_rows) / len(ok_rows):>5.0%}")
+
+    out = os.path.join(directory, f"recheck_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv")
+    with open(out, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(["log", "scenario"] + names)
+        for path, res in rows:
+            sc = _scenario_of(path)
+            writer.writerow([os.path.basename(path), sc.name if sc else ""] + [res.get(n, "") for n in names])
+    print(f"\n📁 Матрица: {out}")
+    return out
+
+
+def _merge_waits(parts: List[Dict]) -> Dict:
+    """Ожидание в очереди по частям: среднее взвешиваем по числу вызовов, p95 и max - худшие"""
+    merged: Dict[str, Dict] = {}
+    for waits in parts:
+        for name, w in waits.items():
+            if not isinstance(w, dict):
+                continue
+            m = merged.setdefault(name, {"count": 0, "avg_ms": 0.0, "p95_ms": 0.0, "max_ms": 0.0})
+            total = m["count"] + w["count"]
+            m["avg_ms"] = round((m["avg_ms"] * m["count"] + w["avg_ms"] * w["count"]) / total, 1) if total else 0.0
+            m["count"] = total
+            m["p95_ms"] = max(m["p95_ms"], w["p95_ms"])
+            m["max_ms"] = max(m["max_ms"], w["max_ms"])
+    return merged
+
+
+def merge_shards(shard_dir: str, wall_sec: float = 0.0, allow_missing: bool = False) -> TestRunner:
+    """Собирает частичные результаты в один summary_*.json в исходном порядке матрицы.
+
+    Все части должны быть из одного разбиения i/n и все на месте: иначе итог молча
+    получит дубли от прошлого прогона или недосчитается сценариев.
+    """
+    parts = []
+    for path in sorted(glob.glob(os.path.join(shard_dir, "shard_*.json"))):
+        with open(path, 'r', encoding='utf-8') as f:
+            parts.append(json.load(f))
+    if not parts:
+        raise FileNotFoundError(f"Нет частичных результатов в {shard_dir}")
+    splits = sorted({p["shard"][1] for p in parts})
+    if len(splits) > 1:
+        raise ValueError(f"В {shard_dir} части разных прогонов (на {splits} частей) - уберите старые")
+    n = splits[0]
+    missing = sorted(set(range(1, n + 1)) - {p["shard"][0] for p in parts})
+    if missing and not allow_missing:
+        raise ValueError(f"Нет частей {missing} из {n} в {shard_dir}")
+    reports = sorted((r for p in parts for r in p["reports"]), key=lambda r: r["index"])
+    runner = TestRunner(pipelines=list(dict.fromkeys(r["pipeline"] for r in reports)),
+                        prompt_variants=list(dict.fromkeys(r["prompts"] for r in reports)))
+    runner.reports = [TestReport.from_dict(r) for r in reports]
+    runner.shards = len(parts)
+    runner.jobs = parts[0].get("jobs", 1)
+    runner.wall_sec = wall_sec or max(p["wall_sec"] for p in parts)
+    runner.queue_wait = _merge_waits([p["llm_queue_wait"] for p in parts])
+    # индекс --changed пишет только сборка: части читают его, но не пишут одновременно
+    fingerprints = {k: fp for p in parts for k, fp in p.get("fingerprints", {}).items()}
+    by_name = {s.name: s for s in SCENARIOS + WHAT_IF}
+    runs = [((by_name[r.scenario_name], r.pipeline, r.prompts), r) for r in runner.reports
+            if not r.cached and r.scenario_name in by_name]
+    runner.save_index(runner.load_index(), [(m, r) for m, r in runs if TestRunner._key(*m) in fingerprints],
+                      fingerprints)
+    # ускорение - как в run_all: от прогноза последовательного прогона (с паузами), если dryrun на нём калиброван
+    if "serial" in runner.estimator.correction:
+        runner.serial_baseline = runner.estimate([m for m, _ in runs]).serial_sec
+    runner.print_summary()
+    return runner
+
+
+async def run_sharded(args: argparse.Namespace):
+    """Пул процессов: каждый гоняет свою часть матрицы, потом собираем итог"""
+    run_dir = os.path.join("test_logs", "shards", datetime.now().strftime('%Y%m%d_%H%M%S'))
+    argv = [os.path.abspath(__file__), "--pipeline", args.pipeline, "--prompts", args.prompts,
+            "--jobs", str(args.jobs), "--shard-dir", run_dir, "--backend", args.backend, "--chaos", args.chaos]
+    argv += [flag for flag, on in (("--trace", args.trace), ("--otlp", args.otlp), ("--profile", args.profile),
+                                   ("--profile-mem", args.profile_mem), ("--what-if", args.what_if),
+                                   ("--changed", args.changed)) if on]
+    if args.scenario:
+        argv.insert(1, args.scenario)
+    started = time.perf_counter()
+    # слоты LLM общие на ключ API: делим их между процессами, а не даём каждому по LLM_MAX_CONCURRENCY
+    total = args.llm_concurrency or CFG.LLM_MAX_CONCURRENCY
+    slots = [max(1, total // args.workers + (i <= total % args.workers)) for i in range(1, args.workers + 1)]
+    procs = [await asyncio.create_subprocess_exec(sys.executable, *argv, "--shard", f"{i}/{args.workers}",
+                                                  "--llm-concurrency", str(slots[i - 1]))
+             for i in range(1, args.workers + 1)]
+    codes = await asyncio.gather(*(p.wait() for p in procs))
+    failed = [i + 1 for i, code in enumerate(codes) if code]
+    if failed:
+        print(f"❌ Части {failed} завершились с ошибкой, итог неполный")
+    merge_shards(run_dir, time.perf_counter() - started, allow_missing=bool(failed))
+
+
+def parse_shard(value: str) -> Tuple[int, int]:
+    try:
+        i, n = (int(x) for x in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError("ожидается i/n, например 2/4")
+    if not 1 <= i <= n:
+        raise argparse.ArgumentTypeError("номер части от 1 до n")
+    return i, n
+
+
+def parse_backend(value: str) -> str:
+    try:
+        get_backend(value)  # экземпляр один на процесс, клиенты потом возьмут этот же
+    except (ValueError, OSError) as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return value
+
+
 async def main():
-    runner = TestRunner()
+    parser = argparse.ArgumentParser(description="Прогон сценариев интервью")
+    parser.add_argument("scenario", nargs="?", help="имя сценария (по умолчанию все)")
+    parser.add_argument("--trace", action="store_true", help="сохранить chrome trace каждого сценария")
+    parser.add_argument("--otlp", action="store_true", help="сохранить трейс в OTLP JSON")
+    parser.add_argument("--profile", action="store_true", help="cProfile и стеки по каждому ходу")
+    parser.add_argument("--profile-mem", action="store_true", help="--profile плюс снимки tracemalloc")
+    parser.add_argument("--pipeline", default=CFG.PIPELINE_PROFILE,
+                        help="профили конвейера через запятую, например lean,default,rich")
+    parser.add_argument("--prompts", default=CFG.PROMPT_VARIANT,
+                        help="варианты промптов для A/B через запятую: full,compact,lean")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="сколько сценариев гонять одновременно на одном event loop")
+    parser.add_argument("--shard", type=parse_shard, help="гонять только часть i/n матрицы сценариев")
+    parser.add_argument("--shard-dir", default="test_logs/shards", help="куда писать частичный результат")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="разбить матрицу на N процессов и собрать общий итог")
+    parser.add_argument("--merge", metavar="DIR", help="только собрать итог из частичных результатов")
+    parser.add_argument("--llm-concurrency", type=int, default=0,
+                        help="одновременных запросов к LLM на процесс, 0 - из конфига (--workers делит их между частями)")
+    parser.add_argument("--backend", default=CFG.LLM_BACKEND, type=parse_backend,
+                        help="live, replay:кассета.jsonl[@скорость] или fake[:распределение], например fake:0.01 или fake:exp:0.5")
+    parser.add_argument("--chaos", default=CFG.LLM_CHAOS, metavar="SPEC",
+                        help="подмешивать сбои LLM, например 429=0.1,slow=0.2,delay=exp:3,malformed=0.05")
+    parser.add_argument("--what-if", action="store_true",
+                        help="ответвления от общего начала (WHAT_IF): начало считается один раз")
+    parser.add_argument("--changed", action="store_true",
+                        help="перезапустить только сценарии, задетые изменёнными промптами, моделью и конвейером")
+    parser.add_argument("--recheck", nargs="?", const="test_logs", metavar="DIR",
+                        help="прогнать все проверки по сохранённым логам без LLM (процессов - --jobs)")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="только прогноз вызовов LLM, токенов и времени по статистике прошлых прогонов")
+    args = parser.parse_args()
+    CFG.LLM_BACKEND, CFG.LLM_CHAOS = args.backend, args.chaos  # до создания клиентов
+    if CFG.LLM_BACKEND != "live":
+        CFG.FACT_CACHE_FILE = ""  # заглушечные вердикты не должны попасть в общий кэш
+        VERDICT_CACHE.use_file("")
+    if args.recheck:
+        recheck_logs(args.recheck, args.jobs if args.jobs > 1 else 0)
+        return
+    if args.merge:
+        try:
+            merge_shards(args.merge)
+        except (FileNotFoundError, ValueError) as e:
+            print(f"❌ {e}")
+        return
+    if args.workers > 1 and not args.dry_run:
+        await run_sharded(args)
+        return
+    if args.llm_concurrency:
+        SCHEDULER.max_concurrent = args.llm_concurrency
+    if not args.shard and not args.dry_run:  # части пула не делят один порт /metrics
+        start_exporters()
     
-    if len(sys.argv) > 1:
-        name = sys.argv[1]
-        sc = next((s for s in SCENARIOS if s.name == name), None)
-        if sc:
-            await runner.run_all([sc])
-        else:
+    runner = TestRunner(trace=args.trace, otlp=args.otlp,
+                        profile=args.profile, profile_mem=args.profile_mem,
+                        pipelines=args.pipeline.split(","), prompt_variants=args.prompts.split(","),
+                        jobs=args.jobs * max(args.workers if args.dry_run else 1, 1), shard=args.shard,
+                        changed=args.changed)
+    runner.shard_dir = args.shard_dir
+    
+    if args.scenario:
+        name = args.scenario
+        sc = next((s for s in SCENARIOS + WHAT_IF if s.name == name), None)
+        if not sc:
             print(f"Сценарий '{name}' не найден")
-            print(f"Доступные: {[s.name for s in SCENARIOS]}")
+            print(f"Доступные: {[s.name for s in SCENARIOS + WHAT_IF]}")
+            return
+        scenarios = [sc]
+    else:
+        scenarios = WHAT_IF if args.what_if else SCENARIOS
+    if args.dry_run:
+        runner.dry_run(scenarios)
+        await runner.llm.close()
     else:
-        await runner.run_all()
+        await runner.run_all(scenarios)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""Локальная оценка числа токенов и подрезка истории под бюджет агента"""
+import re
+import sys
+import json
+import glob
+import asyncio
+from collections import deque
+from pathlib import Path
+from typing import Deque, Dict, List, Sequence, Tuple
+
+from config import CFG
+
+_CLASSES = {
+    "cyrillic": re.compile(r"[а-яё]", re.IGNORECASE),
+    "latin": re.compile(r"[a-z]", re.IGNORECASE),
+    "digit": re.compile(r"\d"),
+    "space": re.compile(r"\s"),
+}
+FEATURES = ("cyrillic", "latin", "digit", "space", "other")
+
+# токенов на символ каждого класса, пока нет калибровки
+DEFAULT_WEIGHTS = {"cyrillic": 0.27, "latin": 0.23, "digit": 0.6, "space": 0.05, "other": 0.55}
+
+_MESSAGE_SPLIT = re.compile(r"\n\n(?=(?:Кандидат|Интервьюер): )")
+
+
+def _features(text: str) -> Tuple[float, ...]:
+    counts = [len(rx.findall(text)) for rx in _CLASSES.values()]
+    return tuple(counts) + (len(text) - sum(counts),)
+
+
+def _solve(a: List[List[float]], b: List[float]) -> List[float]:
+    # метод Гаусса для маленькой системы нормальных уравнений
+    n = len(b)
+    m = [row[:] + [b[i]] for i, row in enumerate(a)]
+    for col in range(n):
+        pivot = max(range(col, n), key=lambda r: abs(m[r][col]))
+        if abs(m[pivot][col]) < 1e-9:
+            continue
+        m[col], m[pivot] = m[pivot], m[col]
+        for r in range(n):
+            if r != col:
+                k = m[r][col] / m[col][col]
+                m[r] = [x - k * y for x, y in zip(m[r], m[col])]
+    return [m[i][n] / m[i][i] if abs(m[i][i]) > 1e-9 else 0.0 for i in range(n)]
+
+
+class TokenEstimator:
+    """Линейная модель: токены = сумма (символов класса * вес класса).
+
+    Веса подгоняются методом наименьших квадратов по парам (текст, настоящее число
+    токенов) из countTokens или usageMetadata.
+    """
+
+    def __init__(self, weights: Dict[str, float] = None, refit_every: int = 25):
+        self.weights = dict(weights or DEFAULT_WEIGHTS)
+        self.samples: Deque[Tuple[Tuple[float, ...], int]] = deque(maxlen=2000)
+        self.refit_every = refit_every
+        self._since_fit = 0
+
+    def estimate(self, text: str) -> int:
+        if not text:
+            return 0
+        return int(sum(w * x for w, x in zip(self._vector(), _features(text)))) + 1
+
+    def _vector(self) -> Tuple[float, ...]:
+        return tuple(self.weights[f] for f in FEATURES)
+
+    def observe(self, text: str, actual_tokens: int):
+        """Пара для калибровки, раз в refit_every пар веса пересчитываются"""
+        if not text or actual_tokens <= 0:
+            return
+        self.samples.append((_features(text), actual_tokens))
+        self._since_fit += 1
+        if self.refit_every and self._since_fit >= self.refit_every:
+            self.fit()
+
+    def fit(self) -> bool:
+        self._since_fit = 0
+        if len(self.samples) < len(FEATURES):
+            return False
+        n = len(FEATURES)
+        ata = [[0.0] * n for _ in range(n)]
+        atb = [0.0] * n
+        for x, y in self.samples:
+            for i in range(n):
+                atb[i] += x[i] * y
+                for j in range(n):
+                    ata[i][j] += x[i] * x[j]
+        # лёгкая регуляризация к текущим весам: редких классов символов может не быть в выборке
+        for i, f in enumerate(FEATURES):
+            ata[i][i] += 1.0
+            atb[i] += self.weights[f]
+        solution = _solve(ata, atb)
+        self.weights = {f: max(0.0, w) for f, w in zip(FEATURES, solution)}
+        return True
+
+    def error(self) -> float:
+        """Средняя относительная ошибка на накопленных парах"""
+        if not self.samples:
+            return 0.0
+        v = self._vector()
+        return sum(abs(sum(w * x for w, x in zip(v, f)) - y) / y for f, y in self.samples) / len(self.samples)
+
+    def save(self, path: str):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"weights": self.weights, "samples": len(self.samples)}, f, indent=2)
+
+    def load(self, path: str):
+        if Path(path).exists():
+            with open(path, "r", encoding="utf-8") as f:
+                self.weights.update(json.load(f).get("weights", {}))
+
+
+ESTIMATOR = TokenEstimator()
+if CFG.TOKEN_CALIBRATION_FILE:
+    ESTIMATOR.load(CFG.TOKEN_CALIBRATION_FILE)
+
+
+def trim_history(history: str, max_tokens: int, pinned: str = "", keep_last: int = 2,
+                 estimator: TokenEstimator = ESTIMATOR) -> str:
+    """Выкидывает самые старые реплики, пока история не влезет в max_tokens.
+
+    Последние keep_last реплик остаются всегда, вместо выкинутых - строка с числом
+    опущенных реплик и pinned (навыки, пробелы, утверждения кандидата).
+    """
+    if estimator.estimate(history) <= max_tokens:
+        return history
+    messages = _MESSAGE_SPLIT.split(history)
+    costs = [estimator.estimate(m) for m in messages]
+    note_cost = estimator.estimate(pinned) + 20
+    total = sum(costs) + note_cost
+    dropped = 0
+    while dropped < len(messages) - keep_last and total > max_tokens:
+        total -= costs[dropped]
+        dropped += 1
+    if not dropped:
+        return history
+    note = f"[Ранние реплики опущены: {dropped}.{' Зафиксировано ранее: ' + pinned if pinned else ''}]"
+    return "\n\n".join([note] + messages[dropped:])
+
+
+async def calibrate(paths: Sequence[str] = ("test_logs/*.json",)) -> TokenEstimator:
+    """Подгоняет веса по countTokens на промптах агентов и сохранённых диалогах"""
+    import prompts
+    from llm_client import GeminiClient
+
+    texts = [t.render(v, **prompts.SAMPLE_FIELDS) for t in prompts.TEMPLATES for v in prompts.VARIANTS]
+    for pattern in paths:
+        for path in sorted(glob.glob(pattern))[:30]:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    turns = json.load(f).get("turns", [])
+            except (OSError, ValueError, AttributeError):
+                continue
+            texts += [f"{t.get('agent_visible_message', '')}\n\n{t.get('user_message', '')}" for t in turns]
+
+    llm = GeminiClient()
+    estimator = TokenEstimator(ESTIMATOR.weights, refit_every=0)
+    for text in texts:
+        estimator.observe(text, await llm.count_tokens(text))
+    await llm.close()
+
+    before = estimator.error()
+    estimator.fit()
+    print(f"Пар для калибровки: {len(estimator.samples)}, ошибка {before:.1%} -> {estimator.error():.1%}")
+    print(f"Веса: { {k: round(v, 3) for k, v in estimator.weights.items()} }")
+    return estimator
+
+
+if __name__ == "__main__":
+    if "--calibrate" in sys.argv:
+        est = asyncio.run(calibrate())
+        est.save(CFG.TOKEN_CALIBRATION_FILE or "test_logs/token_calibration.json")
+    else:
+        for line in sys.stdin:
+            print(ESTIMATOR.estimate(line))
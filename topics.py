@@ -0,0 +1,69 @@
+"""Канонические ключи тем: "Django", "django ORM" и "Джанго" - одна тема"""
+import re
+from functools import lru_cache
+from typing import Dict
+
+# каноническая тема -> как её ещё называют кандидаты и Observer
+ALIASES = {
+    "python": ("питон", "пайтон", "python3", "cpython"),
+    "django": ("джанго", "django orm", "drf", "django rest framework"),
+    "flask": ("фласк",),
+    "fastapi": ("фастапи", "fast api"),
+    "sql": ("скуль", "эскуэль", "sql запросы", "запросы sql"),
+    "postgresql": ("postgres", "постгрес", "постгря", "pg"),
+    "mysql": ("мускул", "майскл"),
+    "git": ("гит", "github", "gitlab"),
+    "docker": ("докер", "docker compose", "docker-compose", "контейнеризация"),
+    "kubernetes": ("k8s", "кубер", "кубернетес"),
+    "javascript": ("js", "джаваскрипт", "жс", "ecmascript"),
+    "typescript": ("ts", "тайпскрипт"),
+    "react": ("реакт", "react.js", "reactjs"),
+    "vue": ("вью", "vue.js", "vuejs"),
+    "linux": ("линукс", "unix", "bash"),
+    "rest": ("rest api", "restful", "рест", "http api"),
+    "ооп": ("oop", "объектно-ориентированное программирование", "классы и объекты"),
+    "asyncio": ("async", "асинхронность", "асинхронное программирование", "async/await"),
+    "redis": ("редис",),
+    "celery": ("селери",),
+    "тестирование": ("pytest", "unittest", "юнит-тесты", "тесты"),
+    "алгоритмы": ("algorithms", "алгоритмы и структуры данных"),
+    "базы данных": ("бд", "database", "databases", "субд"),
+}
+
+_ALIAS: Dict[str, str] = {alias: canon for canon, aliases in ALIASES.items() for alias in aliases}
+_ALIAS.update({canon: canon for canon in ALIASES})
+_PUNCT = re.compile(r"[^\w\s+#./-]+")
+_SPACES = re.compile(r"\s+")
+_WORD = re.compile(r"[\w+#.-]+")
+# известные названия внутри темы, длинные первыми: "django rest framework" раньше "django"
+_KNOWN = re.compile(r"(?<![\w+#.-])(" + "|".join(re.escape(a) for a in sorted(_ALIAS, key=len, reverse=True))
+                    + r")(?![\w+#-])")
+# слова, которые не делают тему отдельной подтемой: "язык python" - это python
+_GENERIC = {"язык", "языка", "языке", "фреймворк", "framework", "библиотека", "library", "основы", "базовые",
+            "знание", "знания", "опыт", "работа", "работы", "с", "на", "в", "и", "по"}
+
+
+def normalize(topic: str) -> str:
+    text = _PUNCT.sub(" ", topic.lower().replace("ё", "е"))
+    return _SPACES.sub(" ", text).strip(" .-")
+
+
+@lru_cache(maxsize=4096)
+def canonical(topic: str) -> str:
+    """Ключ темы: самое конкретное из известных названий.
+
+    "Джанго" и "язык Python" сводятся к django и python. Если кроме известного названия
+    есть своё содержание ("Python GIL", "SQL injection"), это отдельная подтема: синонимы
+    заменяются каноническими названиями ("питон декораторы" -> "python декораторы"),
+    остальное остаётся. Две известные технологии ("python asyncio") - тоже отдельная тема.
+    """
+    text = normalize(topic)
+    if text in _ALIAS:
+        return _ALIAS[text]
+    known = {_ALIAS[m] for m in _KNOWN.findall(text)}
+    rest = [w for w in _WORD.findall(_KNOWN.sub(" ", text)) if w not in _GENERIC]
+    if len(known) == 1 and not rest:
+        return known.pop()
+    # "Джанго ORM" после замены синонимов - "django orm", а это тоже известное название
+    text = _SPACES.sub(" ", _KNOWN.sub(lambda m: _ALIAS[m.group(1)], text)).strip()
+    return _ALIAS.get(text, text)
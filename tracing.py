@@ -0,0 +1,155 @@
+import json
+import os
+import time
+import asyncio
+import functools
+import threading
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, Optional
+
+
+@dataclass
+class Span:
+    name: str
+    trace_id: int
+    span_id: int
+    parent_id: Optional[int]
+    tracer: "Tracer"
+    start_ns: int = field(default_factory=time.time_ns)
+    end_ns: int = 0
+    tid: int = 0  # дорожка в chrome trace (одна на asyncio-задачу)
+    attrs: Dict[str, Any] = field(default_factory=dict)
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    @property
+    def duration_ms(self) -> float:
+        return (self.end_ns - self.start_ns) / 1e6
+
+
+class _NoopSpan:
+    def set(self, **attrs):
+        pass
+
+
+_NOOP = _NoopSpan()
+_current: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+_ids = iter(range(1, 1 << 62))
+_ids_lock = threading.Lock()
+
+
+def _next_id() -> int:
+    with _ids_lock:
+        return next(_ids)
+
+
+class Tracer:
+    """Собирает спаны одной сессии и выгружает их в chrome trace / OTLP JSON"""
+
+    def __init__(self, enabled: bool = True, service: str = "interview-coach", max_spans: int = 100_000):
+        self.enabled = enabled
+        self.service = service
+        self.spans: Deque[Span] = deque(maxlen=max_spans)
+        self._tids: Dict[int, int] = {}
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        """Корневой (или вложенный, если уже внутри трейса) спан"""
+        if not self.enabled:
+            yield _NOOP
+            return
+        parent = _current.get()
+        if parent is not None and parent.tracer is self:
+            trace_id, parent_id = parent.trace_id, parent.span_id
+        else:
+            trace_id, parent_id = _next_id(), None
+        with self._open(name, trace_id, parent_id, attrs) as s:
+            yield s
+
+    @contextmanager
+    def _open(self, name: str, trace_id: int, parent_id: Optional[int], attrs: Dict):
+        s = Span(name, trace_id, _next_id(), parent_id, self, attrs=dict(attrs), tid=self._tid())
+        token = _current.set(s)
+        try:
+            yield s
+        except BaseException as e:
+            s.attrs["error"] = type(e).__name__
+            raise
+        finally:
+            s.end_ns = time.time_ns()
+            _current.reset(token)
+            self.spans.append(s)
+
+    def _tid(self) -> int:
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        key = id(task) if task else 0
+        return self._tids.setdefault(key, len(self._tids) + 1)
+
+    def clear(self):
+        self.spans.clear()
+        self._tids.clear()
+
+    def to_chrome(self) -> Dict:
+        events = []
+        for s in sorted(self.spans, key=lambda s: s.start_ns):
+            events.append({
+                "name": s.name, "cat": s.name.split(".")[0], "ph": "X",
+                "ts": s.start_ns / 1000, "dur": (s.end_ns - s.start_ns) / 1000,
+                "pid": os.getpid(), "tid": s.tid,
+                "args": {k: str(v) for k, v in s.attrs.items()},
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def to_otlp(self) -> Dict:
+        spans = []
+        for s in self.spans:
+            item = {
+                "traceId": f"{s.trace_id:032x}", "spanId": f"{s.span_id:016x}",
+                "name": s.name, "kind": 1,
+                "startTimeUnixNano": str(s.start_ns), "endTimeUnixNano": str(s.end_ns),
+                "attributes": [{"key": k, "value": {"stringValue": str(v)}} for k, v in s.attrs.items()],
+            }
+            if s.parent_id:
+                item["parentSpanId"] = f"{s.parent_id:016x}"
+            spans.append(item)
+        return {"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service}}]},
+            "scopeSpans": [{"scope": {"name": "tracing"}, "spans": spans}],
+        }]}
+
+    def export_chrome(self, path: str):
+        """Файл открывается в chrome://tracing или ui.perfetto.dev"""
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_chrome(), f, ensure_ascii=False)
+
+    def export_otlp(self, path: str):
+        """OTLP/JSON, как пишет file exporter OpenTelemetry Collector"""
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_otlp(), f, ensure_ascii=False)
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """Дочерний спан текущего трейса; вне трейса ничего не делает"""
+    parent = _current.get()
+    if parent is None:
+        yield _NOOP
+        return
+    with parent.tracer._open(name, parent.trace_id, parent.span_id, attrs) as s:
+        yield s
+
+
+def traced(method):
+    """Оборачивает async-метод агента в спан "<агент>.<метод>" """
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        with span(f"{self.name}.{method.__name__}", agent=self.name):
+            return await method(self, *args, **kwargs)
+    return wrapper
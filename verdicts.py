@@ -0,0 +1,176 @@
+"""Кэш вердиктов FactChecker между сессиями: кандидаты повторяют одни и те же заблуждения"""
+import os
+import re
+import json
+import time
+import atexit
+from pathlib import Path
+from typing import Dict, Optional, Set, Tuple
+
+from config import CFG
+from metrics import FACT_CACHE_LOOKUPS
+
+_PUNCT = re.compile(r"[^\w\s.]+")
+_SPACES = re.compile(r"\s+")
+_NUMBER = re.compile(r"\d+(?:\.\d+)*")
+_NEGATION = re.compile(r"(?<!\w)(не|нет|ни|никогда|not|no|never)(?!\w)|(?<!\w)(im|не)(mutable|изменя)")
+MIN_CLAIM_WORDS = 4  # "да, конечно" без вопроса не утверждение - такой вердикт не переиспользуем
+_SEP = "\t"  # ключ: вопрос + утверждение, вердикт получен с вопросом в промпте
+
+
+def normalize(claim: str) -> str:
+    text = claim.lower().replace("ё", "е")
+    text = _PUNCT.sub(" ", text)
+    return _SPACES.sub(" ", text).strip(" .")
+
+
+def shingles(text: str, n: int = 4) -> Set[str]:
+    if len(text) <= n:
+        return {text}
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+def _guard(text: str) -> Tuple:
+    # числа и отрицания должны совпадать точно: "Python 3.12" != "Python 4.0", "изменяемый" != "неизменяемый"
+    return tuple(sorted(_NUMBER.findall(text))), len(_NEGATION.findall(text))
+
+
+def cache_key(claim: str, context: str = "") -> str:
+    claim = normalize(claim)
+    if len(claim.split()) < MIN_CLAIM_WORDS:
+        return ""
+    return f"{normalize(context)}{_SEP}{claim}"
+
+
+class VerdictCache:
+    """Нормализованные вопрос и утверждение -> вердикт FactChecker, с TTL и вытеснением давно не нужных.
+
+    Точное совпадение после нормализации, иначе - тот же вопрос и похожее утверждение
+    по символьным 4-граммам (Jaccard не ниже порога) при совпадающих числах и отрицаниях.
+    На диск пишется не чаще раза в save_interval секунд и при выходе.
+    """
+
+    def __init__(self, path: str = "", ttl_days: float = 30, max_entries: int = 2000, threshold: float = 0.85,
+                 save_interval: float = 30.0):
+        self.path = path
+        self.ttl = ttl_days * 86400
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.save_interval = save_interval
+        self.entries: Dict[str, Dict] = {}  # ключ -> {"verdict", "created", "used", "hits"}
+        self._shingles: Dict[str, Set[str]] = {}  # по утверждению, без вопроса
+        self._dirty = False
+        self._saved = time.time()
+        if path:
+            self.load()
+            atexit.register(self.flush)
+
+    def use_file(self, path: str):
+        """Сменить файл кэша: "" - только в памяти, без записей прежнего файла"""
+        self.path = path
+        self.entries, self._shingles = {}, {}
+        if path:
+            self.load()
+            atexit.register(self.flush)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, claim: str, context: str = "") -> Optional[Dict]:
+        key = cache_key(claim, context)
+        if not key:
+            return None
+        now = time.time()
+        entry = self._alive(key, now)
+        tier = "exact"
+        if entry is None:
+            key, entry = self._fuzzy(key, now)
+            tier = "fuzzy"
+        if entry is None:
+            FACT_CACHE_LOOKUPS.inc(tier="miss")
+            return None
+        FACT_CACHE_LOOKUPS.inc(tier=tier)
+        entry["used"] = now
+        entry["hits"] += 1
+        return entry["verdict"]
+
+    def put(self, claim: str, verdict: Dict, context: str = ""):
+        key = cache_key(claim, context)
+        if not key:
+            return
+        now = time.time()
+        self.entries[key] = {"verdict": verdict, "created": now, "used": now, "hits": 0}
+        self._shingles[key] = shingles(key.split(_SEP, 1)[1])
+        if len(self.entries) > self.max_entries:
+            self._evict(now)
+        self._dirty = True
+        if self.path and now - self._saved >= self.save_interval:
+            self.save()
+
+    def flush(self):
+        if self.path and self._dirty:
+            self.save()
+
+    def _alive(self, key: str, now: float) -> Optional[Dict]:
+        entry = self.entries.get(key)
+        if entry and now - entry["created"] > self.ttl:
+            self._drop(key)
+            return None
+        return entry
+
+    def _fuzzy(self, key: str, now: float) -> Tuple[str, Optional[Dict]]:
+        context, claim = key.split(_SEP, 1)
+        query = shingles(claim)
+        guard = _guard(claim)
+        best, best_score = "", 0.0
+        for other, sh in self._shingles.items():
+            if not other.startswith(context + _SEP):
+                continue  # вердикт на другой вопрос может не подойти
+            # Jaccard >= t невозможен, если размеры отличаются сильнее чем в t раз
+            if min(len(sh), len(query)) < self.threshold * max(len(sh), len(query)):
+                continue
+            score = len(query & sh) / len(query | sh)
+            if score >= self.threshold and score > best_score and _guard(other.split(_SEP, 1)[1]) == guard:
+                best, best_score = other, score
+        if not best:
+            return "", None
+        return best, self._alive(best, now)
+
+    def _evict(self, now: float):
+        for key in [k for k, e in self.entries.items() if now - e["created"] > self.ttl]:
+            self._drop(key)
+        # дальше - давно не использованные
+        extra = len(self.entries) - self.max_entries
+        if extra > 0:
+            for key in sorted(self.entries, key=lambda k: self.entries[k]["used"])[:extra]:
+                self._drop(key)
+
+    def _drop(self, key: str):
+        self.entries.pop(key, None)
+        self._shingles.pop(key, None)
+
+    def load(self):
+        if not Path(self.path).exists():
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+        # записи без вопроса в ключе - от прежнего формата, их вердикт мог зависеть от вопроса
+        self.entries = {k: e for k, e in self.entries.items() if _SEP in k}
+        self._shingles = {k: shingles(k.split(_SEP, 1)[1]) for k in self.entries}
+        self._evict(time.time())
+
+    def save(self):
+        # через временный файл: параллельные прогоны не оставят обрезанный JSON
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+        self._dirty = False
+        self._saved = time.time()
+
+
+VERDICT_CACHE = VerdictCache(CFG.FACT_CACHE_FILE, CFG.FACT_CACHE_TTL_DAYS, CFG.FACT_CACHE_MAX_ENTRIES,
+                             CFG.FACT_CACHE_FUZZY_THRESHOLD)